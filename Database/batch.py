@@ -0,0 +1,62 @@
+from sqlalchemy import text
+from typing import Dict, List, Tuple
+
+
+def insert_rows(db, table_name: str, rows: List[dict]):
+    """
+    Inserta varias filas en una tabla agrupándolas por forma (mismas columnas).
+    Cada grupo se envía con un único executemany, que pymysql reescribe como un
+    solo INSERT multi-fila (un round trip por grupo en vez de uno por fila).
+    """
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row.keys()), []).append(row)
+
+    for columns, group in groups.items():
+        query = f"""
+            INSERT INTO {table_name} ({', '.join(columns)})
+            VALUES ({', '.join(f':{col}' for col in columns)})
+        """
+        if len(group) == 1:
+            db.execute(text(query), group[0])
+        else:
+            db.execute(text(query), group)
+
+
+def insert_pending_rows(db, pending: List[Tuple[str, dict]]):
+    """
+    Recibe una lista ordenada de (tabla, fila) y las inserta agrupadas por tabla,
+    respetando el orden de primera aparición de cada tabla (para las FKs).
+    """
+    by_table: Dict[str, List[dict]] = {}
+    for table_name, row in pending:
+        by_table.setdefault(table_name, []).append(row)
+
+    for table_name, rows in by_table.items():
+        insert_rows(db, table_name, rows)
+
+
+def upsert_rows(db, table_name: str, rows: List[dict], update_columns: List[str]):
+    """
+    INSERT ... ON DUPLICATE KEY UPDATE agrupado por forma de fila. Solo se
+    actualizan las columnas indicadas en update_columns que vengan en la fila.
+    """
+    groups: Dict[Tuple[str, ...], List[dict]] = {}
+    for row in rows:
+        groups.setdefault(tuple(row.keys()), []).append(row)
+
+    for columns, group in groups.items():
+        updates = [col for col in columns if col in update_columns]
+        if not updates:
+            insert_rows(db, table_name, group)
+            continue
+
+        query = f"""
+            INSERT INTO {table_name} ({', '.join(columns)})
+            VALUES ({', '.join(f':{col}' for col in columns)})
+            ON DUPLICATE KEY UPDATE {', '.join(f'{col} = VALUES({col})' for col in updates)}
+        """
+        if len(group) == 1:
+            db.execute(text(query), group[0])
+        else:
+            db.execute(text(query), group)
@@ -0,0 +1,4 @@
+-- Version por medical_record: se incrementa en cada create/update/delete de
+-- secciones o firmas y se usa como ETag en GET /medical-records/{record_id}.
+ALTER TABLE medical_record
+    ADD COLUMN version INT UNSIGNED NOT NULL DEFAULT 1;
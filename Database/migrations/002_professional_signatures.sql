@@ -0,0 +1,21 @@
+-- Firma registrada por profesional. El archivo se guarda una sola vez,
+-- direccionado por su SHA-256 (sig_prof_<hash>.<ext>), y los medical_records
+-- lo referencian en lugar de subir una copia nueva en cada registro.
+CREATE TABLE professional_signatures (
+    id CHAR(36) NOT NULL PRIMARY KEY,
+    professional_id CHAR(36) NOT NULL,
+    url VARCHAR(512) NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    is_default TINYINT(1) NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL,
+    UNIQUE KEY uq_professional_signatures_hash (professional_id, content_hash),
+    KEY idx_professional_signatures_default (professional_id, is_default),
+    CONSTRAINT fk_professional_signatures_professional
+        FOREIGN KEY (professional_id) REFERENCES professionals (id) ON DELETE CASCADE
+);
+
+ALTER TABLE medical_record_signatures
+    ADD COLUMN professional_signature_id CHAR(36) NULL;
+
+ALTER TABLE medical_record_laboral_signatures
+    ADD COLUMN professional_signature_id CHAR(36) NULL;
@@ -0,0 +1,41 @@
+-- Cascada de borrado de medical_record en la DB: DELETE FROM medical_record
+-- borra todas las secciones (y medical_record_data_img vía medical_record_data).
+-- Si alguna tabla ya tiene una FK a medical_record sin ON DELETE CASCADE,
+-- hay que hacer DROP FOREIGN KEY de esa constraint antes de correr esto.
+-- ADD CONSTRAINT falla si quedan filas huérfanas (medical_record_id inexistente).
+ALTER TABLE medical_record_bucodental_exam ADD CONSTRAINT fk_mr_bucodental_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_cardiovascular_exam ADD CONSTRAINT fk_mr_cardiovascular_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_clinical_exam ADD CONSTRAINT fk_mr_clinical_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_data ADD CONSTRAINT fk_mr_data_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_data_img ADD CONSTRAINT fk_mr_data_img_data FOREIGN KEY (medical_record_data_id) REFERENCES medical_record_data (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_derivations ADD CONSTRAINT fk_mr_derivations_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_digestive_exam ADD CONSTRAINT fk_mr_digestive_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_evaluation_type ADD CONSTRAINT fk_mr_evaluation_type_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_family_history ADD CONSTRAINT fk_mr_family_history_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_genitourinario_exam ADD CONSTRAINT fk_mr_genitourinario_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_habits ADD CONSTRAINT fk_mr_habits_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_head_exam ADD CONSTRAINT fk_mr_head_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_immunizations ADD CONSTRAINT fk_mr_immunizations_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_laboral_contacts ADD CONSTRAINT fk_mr_laboral_contacts_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_laboral_exam ADD CONSTRAINT fk_mr_laboral_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_laboral_history ADD CONSTRAINT fk_mr_laboral_history_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_neuro_clinical_exam ADD CONSTRAINT fk_mr_neuro_clinical_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_oftalmologico_exam ADD CONSTRAINT fk_mr_oftalmologico_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_orl_exam ADD CONSTRAINT fk_mr_orl_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_osteoarticular_exam ADD CONSTRAINT fk_mr_osteoarticular_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_personal_history ADD CONSTRAINT fk_mr_personal_history_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_previous_problems ADD CONSTRAINT fk_mr_previous_problems_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_psychiatric_clinical_exam ADD CONSTRAINT fk_mr_psychiatric_clinical_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_recomendations ADD CONSTRAINT fk_mr_recomendations_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_respiratorio_exam ADD CONSTRAINT fk_mr_respiratorio_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_signatures ADD CONSTRAINT fk_mr_signatures_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_skin_exam ADD CONSTRAINT fk_mr_skin_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_studies ADD CONSTRAINT fk_mr_studies_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_surgerys ADD CONSTRAINT fk_mr_surgerys_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_laboral_signatures ADD CONSTRAINT fk_mr_laboral_signatures_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_cuestionario_riesgos ADD CONSTRAINT fk_mr_cuestionario_riesgos_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_ddjj ADD CONSTRAINT fk_mr_ddjj_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_neuro_medical_exam ADD CONSTRAINT fk_mr_neuro_medical_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_oftalmologico_medical_exam ADD CONSTRAINT fk_mr_oftalmologico_medical_exam_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_patient_signatures ADD CONSTRAINT fk_mr_patient_signatures_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
+ALTER TABLE medical_record_medical_responsable_signatures ADD CONSTRAINT fk_mr_medical_responsable_signatures_record FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE;
@@ -0,0 +1,14 @@
+-- Change log de medical_record: una fila por create / update / delete, escrita en
+-- la misma transacción que el cambio. seq es el cursor de
+-- GET /medical-records/changes?since=<seq>.
+CREATE TABLE medical_record_changes (
+    seq BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    medical_record_id CHAR(36) NOT NULL,
+    patient_id CHAR(36) NOT NULL,
+    version INT UNSIGNED NOT NULL,
+    operation ENUM('create', 'update', 'delete') NOT NULL,
+    tables JSON NULL,
+    changed_at DATETIME NOT NULL,
+    KEY idx_medical_record_changes_patient (patient_id, seq),
+    KEY idx_medical_record_changes_record (medical_record_id, seq)
+);
@@ -0,0 +1,53 @@
+-- Índice de texto libre sobre las observaciones de las secciones (y las descripciones
+-- del examen neurológico): una fila por (medical_record, sección) con el texto
+-- concatenado. Se mantiene en cada create / update; el DELETE del registro lo
+-- borra por cascada. Lo usa GET /medical-records/search (MATCH ... AGAINST).
+CREATE TABLE medical_record_search (
+    medical_record_id CHAR(36) NOT NULL,
+    section VARCHAR(64) NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (medical_record_id, section),
+    FULLTEXT KEY ft_medical_record_search_content (content),
+    CONSTRAINT fk_medical_record_search_record
+        FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE
+);
+
+-- Carga inicial desde las secciones existentes
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_bucodental_exam', observations FROM medical_record_bucodental_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_cardiovascular_exam', observations FROM medical_record_cardiovascular_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_digestive_exam', observations FROM medical_record_digestive_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_family_history', observations FROM medical_record_family_history WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_genitourinario_exam', observations FROM medical_record_genitourinario_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_head_exam', observations FROM medical_record_head_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_laboral_exam', observations FROM medical_record_laboral_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_neuro_clinical_exam', observations FROM medical_record_neuro_clinical_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_oftalmologico_exam', observations FROM medical_record_oftalmologico_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_orl_exam', observations FROM medical_record_orl_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_osteoarticular_exam', observations FROM medical_record_osteoarticular_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_psychiatric_clinical_exam', observations FROM medical_record_psychiatric_clinical_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_recomendations', observations FROM medical_record_recomendations WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_respiratorio_exam', observations FROM medical_record_respiratorio_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_skin_exam', observations FROM medical_record_skin_exam WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_studies', observations FROM medical_record_studies WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_ddjj', observations FROM medical_record_ddjj WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_cuestionario_riesgos', observations FROM medical_record_cuestionario_riesgos WHERE observations <> '';
+INSERT IGNORE INTO medical_record_search (medical_record_id, section, content)
+    SELECT medical_record_id, 'medical_record_neuro_medical_exam', CONCAT_WS(' ', test_dedo_nariz_description, test_romberg_description, test_seguimiento_ocular_description, exam_miembro_sup_description, exam_miembro_inf_description) FROM medical_record_neuro_medical_exam WHERE test_dedo_nariz_description <> '' OR test_romberg_description <> '' OR test_seguimiento_ocular_description <> '' OR exam_miembro_sup_description <> '' OR exam_miembro_inf_description <> '';
@@ -0,0 +1,93 @@
+-- Índice bitmap de hallazgos booleanos: un bitset empaquetado por (medical_record,
+-- sección), con los campos bool de la sección en el orden del modelo (el primer
+-- campo es el bit más alto del primer byte, igual que numpy.packbits).
+-- Se mantiene en cada create / update; el DELETE del registro lo borra por cascada.
+-- Lo usa POST /medical-records/findings/query.
+CREATE TABLE medical_record_findings (
+    medical_record_id CHAR(36) NOT NULL,
+    section VARCHAR(64) NOT NULL,
+    bits VARBINARY(16) NOT NULL,
+    PRIMARY KEY (medical_record_id, section),
+    CONSTRAINT fk_medical_record_findings_record
+        FOREIGN KEY (medical_record_id) REFERENCES medical_record (id) ON DELETE CASCADE
+);
+
+-- Carga inicial desde las secciones existentes (mismo empaquetado que utils/findings_index.py)
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_bucodental_exam', UNHEX(LPAD(HEX((IF(protesis, 1, 0) << 7) | (IF(caries, 1, 0) << 6) | (IF(encias_alteradas, 1, 0) << 5) | (IF(dentadura_parcial, 1, 0) << 4)), 2, '0'))
+    FROM medical_record_bucodental_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_cardiovascular_exam', UNHEX(LPAD(HEX((IF(ritmo_irregular, 1, 0) << 7) | (IF(ruidos_alterados, 1, 0) << 6) | (IF(extrasistoles, 1, 0) << 5) | (IF(soplos, 1, 0) << 4) | (IF(pulsos_perifericos_ausentes, 1, 0) << 3) | (IF(varices, 1, 0) << 2)), 2, '0'))
+    FROM medical_record_cardiovascular_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_digestive_exam', UNHEX(LPAD(HEX((IF(cicatrices_quirurgicas, 1, 0) << 7) | (IF(hemorroides, 1, 0) << 6) | (IF(dolores_abdominales, 1, 0) << 5) | (IF(hepatomegalia, 1, 0) << 4) | (IF(esplenomegalia, 1, 0) << 3) | (IF(adenopatias, 1, 0) << 2) | (IF(hernias, 1, 0) << 1)), 2, '0'))
+    FROM medical_record_digestive_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_evaluation_type', UNHEX(LPAD(HEX((IF(preocupational_exam, 1, 0) << 7) | (IF(graduation_exam, 1, 0) << 6) | (IF(post_enf_prolonged, 1, 0) << 5) | (IF(periodic_exams, 1, 0) << 4) | (IF(laboral_change_position, 1, 0) << 3) | (IF(sport_physical_aptitude, 1, 0) << 2) | (IF(other_boolean, 1, 0) << 1)), 2, '0'))
+    FROM medical_record_evaluation_type;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_family_history', UNHEX(LPAD(HEX((IF(father_alive, 1, 0) << 15) | (IF(mother_alive, 1, 0) << 14) | (IF(brothers_alive, 1, 0) << 13) | (IF(sisters_alive, 1, 0) << 12) | (IF(husband_alive, 1, 0) << 11) | (IF(sons_alive, 1, 0) << 10) | (IF(mental_illnesses, 1, 0) << 9) | (IF(cardiovascular_illnesses, 1, 0) << 8) | (IF(kidney_problems, 1, 0) << 7) | (IF(digestive_problems, 1, 0) << 6) | (IF(asma, 1, 0) << 5) | (IF(tuberculosis, 1, 0) << 4) | (IF(diabetes, 1, 0) << 3) | (IF(reumatism, 1, 0) << 2) | (IF(cancer, 1, 0) << 1)), 4, '0'))
+    FROM medical_record_family_history;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_genitourinario_exam', UNHEX(LPAD(HEX((IF(women_alteraciones_mamarias, 1, 0) << 15) | (IF(women_alteraciones_ginecologicas, 1, 0) << 14) | (IF(women_fum, 1, 0) << 13) | (IF(women_dolores_menstruales, 1, 0) << 12) | (IF(women_flujos_alterados, 1, 0) << 11) | (IF(women_anticonceptivos, 1, 0) << 10) | (IF(women_parto_normal, 1, 0) << 9) | (IF(women_abortos, 1, 0) << 8) | (IF(women_cesarea, 1, 0) << 7) | (IF(men_alteraciones_mamarias, 1, 0) << 6) | (IF(men_alteraciones_testiculares, 1, 0) << 5)), 4, '0'))
+    FROM medical_record_genitourinario_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_habits', UNHEX(LPAD(HEX((IF(diet, 1, 0) << 7) | (IF(smoke, 1, 0) << 6) | (IF(alcoholic_drinks, 1, 0) << 5) | (IF(drugs, 1, 0) << 4) | (IF(sleep_alteration, 1, 0) << 3) | (IF(daily_diet, 1, 0) << 2) | (IF(physic_activity, 1, 0) << 1)), 2, '0'))
+    FROM medical_record_habits;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_head_exam', UNHEX(LPAD(HEX((IF(alteration_movility, 1, 0) << 7) | (IF(latidos_carotideos_alterados, 1, 0) << 6) | (IF(tumoraciones_tiroideas, 1, 0) << 5) | (IF(adenopatias, 1, 0) << 4)), 2, '0'))
+    FROM medical_record_head_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_immunizations', UNHEX(LPAD(HEX((IF(sars_cov_2, 1, 0) << 7) | (IF(fha, 1, 0) << 6) | (IF(triple_adultos_tetanos, 1, 0) << 5) | (IF(hepatitis_a, 1, 0) << 4) | (IF(hepatitis_b, 1, 0) << 3) | (IF(dengue, 1, 0) << 2)), 2, '0'))
+    FROM medical_record_immunizations;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_laboral_contacts', UNHEX(LPAD(HEX((IF(dusty_environment, 1, 0) << 7) | (IF(noisy_environment, 1, 0) << 6) | (IF(animal_products, 1, 0) << 5) | (IF(chemicals_products, 1, 0) << 4) | (IF(ionizing_radiation, 1, 0) << 3) | (IF(other_contamination, 1, 0) << 2)), 2, '0'))
+    FROM medical_record_laboral_contacts;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_laboral_exam', UNHEX(LPAD(HEX((IF(physical, 1, 0) << 7) | (IF(chemical, 1, 0) << 6) | (IF(biological, 1, 0) << 5) | (IF(ergonomic, 1, 0) << 4) | (IF(others, 1, 0) << 3)), 2, '0'))
+    FROM medical_record_laboral_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_neuro_clinical_exam', UNHEX(LPAD(HEX((IF(desorientado, 1, 0) << 7) | (IF(motilidad_alterada, 1, 0) << 6) | (IF(sensibilidad_alterada, 1, 0) << 5) | (IF(reflejos_alterados, 1, 0) << 4) | (IF(apraxia, 1, 0) << 3) | (IF(ataxia, 1, 0) << 2)), 2, '0'))
+    FROM medical_record_neuro_clinical_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_oftalmologico_exam', UNHEX(LPAD(HEX((IF(eyes_alterations, 1, 0) << 7) | (IF(discromatopsia, 1, 0) << 6)), 2, '0'))
+    FROM medical_record_oftalmologico_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_orl_exam', UNHEX(LPAD(HEX((IF(faringe_pathology, 1, 0) << 7) | (IF(amigdalas_pathology, 1, 0) << 6) | (IF(voice_alterations, 1, 0) << 5) | (IF(rinitis, 1, 0) << 4) | (IF(audition_disorders, 1, 0) << 3) | (IF(adenopatias, 1, 0) << 2)), 2, '0'))
+    FROM medical_record_orl_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_osteoarticular_exam', UNHEX(LPAD(HEX((IF(column_movilidad_alterada, 1, 0) << 15) | (IF(column_puntos_dolorosos, 1, 0) << 14) | (IF(column_escoliosis, 1, 0) << 13) | (IF(column_cifosis, 1, 0) << 12) | (IF(column_lordosis, 1, 0) << 11) | (IF(dolor_articular, 1, 0) << 10) | (IF(limitacion_movimientos, 1, 0) << 9) | (IF(tono_trofismo, 1, 0) << 8) | (IF(amputaciones, 1, 0) << 7) | (IF(movilidad_hombro_alterado, 1, 0) << 6) | (IF(movilidad_codo_alterado, 1, 0) << 5) | (IF(movilidad_muñeca_alterado, 1, 0) << 4) | (IF(movilidad_mano_alterado, 1, 0) << 3) | (IF(movilidad_cadera_alterado, 1, 0) << 2) | (IF(movilidad_rodilla_alterado, 1, 0) << 1) | (IF(movilidad_pie_alterado, 1, 0) << 0)), 4, '0'))
+    FROM medical_record_osteoarticular_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_personal_history', UNHEX(LPAD(HEX((IF(internations, 1, 0) << 7) | (IF(covid, 1, 0) << 6) | (IF(fha, 1, 0) << 5) | (IF(dengue, 1, 0) << 4)), 2, '0'))
+    FROM medical_record_personal_history;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_previous_problems', UNHEX(LPAD(HEX((IF(head_pain, 1, 0) << 39) | (IF(seizures, 1, 0) << 38) | (IF(dizziness_or_fainting, 1, 0) << 37) | (IF(excesive_nervious, 1, 0) << 36) | (IF(memory_loss, 1, 0) << 35) | (IF(eyes_problems, 1, 0) << 34) | (IF(ear_problems, 1, 0) << 33) | (IF(mouth_problems, 1, 0) << 32) | (IF(skin_diseases, 1, 0) << 31) | (IF(allergies, 1, 0) << 30) | (IF(sinusitis, 1, 0) << 29) | (IF(asma, 1, 0) << 28) | (IF(long_cough, 1, 0) << 27) | (IF(tuberculosis, 1, 0) << 26) | (IF(chest_pain, 1, 0) << 25) | (IF(insufficient_air, 1, 0) << 24) | (IF(palpitations, 1, 0) << 23) | (IF(high_or_low_pressure, 1, 0) << 22) | (IF(digestive_problems, 1, 0) << 21) | (IF(others_boolean, 1, 0) << 20) | (IF(hepatitis, 1, 0) << 19) | (IF(hernias, 1, 0) << 18) | (IF(hemorroides, 1, 0) << 17) | (IF(difficulty_pee, 1, 0) << 16) | (IF(amputations, 1, 0) << 15) | (IF(bone_breaks, 1, 0) << 14) | (IF(neck_pain, 1, 0) << 13) | (IF(back_or_waist_pain, 1, 0) << 12) | (IF(shoulders_elbows_wrists_pain, 1, 0) << 11) | (IF(hips_knees_ankles_pain, 1, 0) << 10) | (IF(plane_feet, 1, 0) << 9) | (IF(varices, 1, 0) << 8) | (IF(diabetes, 1, 0) << 7) | (IF(fiebre_reumatica, 1, 0) << 6) | (IF(chagas, 1, 0) << 5) | (IF(sexual_transmition_diseases, 1, 0) << 4) | (IF(cancer, 1, 0) << 3) | (IF(medication_actually, 1, 0) << 2)), 10, '0'))
+    FROM medical_record_previous_problems;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_psychiatric_clinical_exam', UNHEX(LPAD(HEX((IF(alteraciones_conducta, 1, 0) << 7) | (IF(nerviosismo_excesivo, 1, 0) << 6) | (IF(depresion_psicomotriz, 1, 0) << 5) | (IF(timidez_excesiva, 1, 0) << 4)), 2, '0'))
+    FROM medical_record_psychiatric_clinical_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_recomendations', UNHEX(LPAD(HEX((IF(apto, 1, 0) << 7) | (IF(apto_preexistencia_no_condiciona, 1, 0) << 6) | (IF(apto_preexistencia_condiciona, 1, 0) << 5) | (IF(no_apto_definitivo, 1, 0) << 4) | (IF(no_apto_temporal, 1, 0) << 3)), 2, '0'))
+    FROM medical_record_recomendations;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_respiratorio_exam', UNHEX(LPAD(HEX((IF(deformaciones_toracicas, 1, 0) << 7) | (IF(rales, 1, 0) << 6) | (IF(roncus, 1, 0) << 5) | (IF(murmullo_vesicular, 1, 0) << 4) | (IF(adenopatias, 1, 0) << 3) | (IF(proceso_agudo, 1, 0) << 2)), 2, '0'))
+    FROM medical_record_respiratorio_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_skin_exam', UNHEX(LPAD(HEX((IF(skin_alteration, 1, 0) << 7) | (IF(piercing, 1, 0) << 6) | (IF(tattoo, 1, 0) << 5) | (IF(cicatrices, 1, 0) << 4)), 2, '0'))
+    FROM medical_record_skin_exam;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_studies', UNHEX(LPAD(HEX((IF(rx_torax_frente, 1, 0) << 15) | (IF(rx_columna_lumbo_sacra_frente, 1, 0) << 14) | (IF(rx_columna_cervical_frente, 1, 0) << 13) | (IF(electro, 1, 0) << 12) | (IF(audiometria, 1, 0) << 11) | (IF(psicotecnico, 1, 0) << 10) | (IF(espirometria, 1, 0) << 9) | (IF(ergometria, 1, 0) << 8) | (IF(evaluation_oftalmologica, 1, 0) << 7) | (IF(psicometria, 1, 0) << 6) | (IF(electroencefalograma, 1, 0) << 5) | (IF(laboratorio, 1, 0) << 4) | (IF(drogas_abuso, 1, 0) << 3) | (IF(test_cereal, 1, 0) << 2)), 4, '0'))
+    FROM medical_record_studies;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_surgerys', UNHEX(LPAD(HEX((IF(apendice, 1, 0) << 7) | (IF(amigdala, 1, 0) << 6) | (IF(hernia, 1, 0) << 5) | (IF(varices, 1, 0) << 4) | (IF(vesicula, 1, 0) << 3) | (IF(columna, 1, 0) << 2) | (IF(testiculos, 1, 0) << 1) | (IF(others, 1, 0) << 0)), 2, '0'))
+    FROM medical_record_surgerys;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_ddjj', UNHEX(LPAD(HEX((IF(last_year_mareos_vertigo_desmayos, 1, 0) << 15) | (IF(pico_presion_arterial, 1, 0) << 14) | (IF(golpe_severo_craneo, 1, 0) << 13) | (IF(trastornos_depresivos_fobias, 1, 0) << 12) | (IF(inseguridad_trabajos_altura, 1, 0) << 11) | (IF(epilepsias_convulsiones, 1, 0) << 10) | (IF(medicacion_neurologica, 1, 0) << 9) | (IF(hipoglucemia, 1, 0) << 8) | (IF(caidas, 1, 0) << 7) | (IF(inseguridad_conduccion, 1, 0) << 6)), 4, '0'))
+    FROM medical_record_ddjj;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_cuestionario_riesgos', UNHEX(LPAD(HEX((IF(es_apto, 1, 0) << 7) | (IF(no_es_apto, 1, 0) << 6)), 2, '0'))
+    FROM medical_record_cuestionario_riesgos;
+INSERT IGNORE INTO medical_record_findings (medical_record_id, section, bits)
+    SELECT medical_record_id, 'medical_record_neuro_medical_exam', UNHEX(LPAD(HEX((IF(test_dedo_nariz_normal, 1, 0) << 15) | (IF(test_dedo_nariz_anormal, 1, 0) << 14) | (IF(test_romberg_normal, 1, 0) << 13) | (IF(test_romberg_anormal, 1, 0) << 12) | (IF(test_seguimiento_ocular_normal, 1, 0) << 11) | (IF(test_seguimiento_ocular_anormal, 1, 0) << 10) | (IF(exam_miembro_sup_normal, 1, 0) << 9) | (IF(exam_miembro_sup_anormal, 1, 0) << 8) | (IF(exam_miembro_inf_normal, 1, 0) << 7) | (IF(exam_miembro_inf_anormal, 1, 0) << 6)), 4, '0'))
+    FROM medical_record_neuro_medical_exam;
@@ -0,0 +1,4 @@
+-- SHA-256 del contenido de cada archivo de estudio, calculado mientras el upload
+-- se copia a disco por bloques. NULL para archivos subidos antes de esta migración.
+ALTER TABLE study_files
+    ADD COLUMN content_hash CHAR(64) NULL AFTER size_bytes;
@@ -0,0 +1,17 @@
+-- Uploads reanudables de archivos de estudio: la sesión guarda cuántos bytes
+-- ya se recibieron; los bloques se escriben en un único archivo .part en disco
+-- que al finalizar se renombra como un study_files más.
+CREATE TABLE study_upload_sessions (
+    id CHAR(36) NOT NULL PRIMARY KEY,
+    study_id CHAR(36) NOT NULL,
+    created_by_user_id CHAR(36) NOT NULL,
+    original_filename VARCHAR(255) NULL,
+    mime_type VARCHAR(127) NULL,
+    total_bytes BIGINT UNSIGNED NOT NULL,
+    received_bytes BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    KEY idx_study_upload_sessions_updated (updated_at),
+    CONSTRAINT fk_study_upload_sessions_study
+        FOREIGN KEY (study_id) REFERENCES studies (id) ON DELETE CASCADE
+);
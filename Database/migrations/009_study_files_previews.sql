@@ -0,0 +1,6 @@
+-- Derivados de cada archivo de estudio (miniatura para galerías y preview web),
+-- generados en segundo plano después del upload. NULL mientras no existan o si
+-- el tipo de archivo no admite preview.
+ALTER TABLE study_files
+    ADD COLUMN thumbnail_path VARCHAR(512) NULL AFTER file_path,
+    ADD COLUMN preview_path VARCHAR(512) NULL AFTER thumbnail_path;
@@ -0,0 +1,14 @@
+-- Deduplicación de archivos de estudios: un archivo <sha256><ext> por contenido y
+-- un contador de las filas de study_files que lo referencian (study_files.content_hash
+-- + file_path). Los archivos subidos antes quedan con su nombre propio y se siguen
+-- borrando junto con su fila.
+CREATE TABLE study_blobs (
+    content_hash CHAR(64) NOT NULL PRIMARY KEY,
+    stored_name VARCHAR(255) NOT NULL,
+    size_bytes BIGINT UNSIGNED NOT NULL,
+    ref_count INT UNSIGNED NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL
+);
+
+ALTER TABLE study_files
+    ADD KEY idx_study_files_content_hash (content_hash);
@@ -0,0 +1,13 @@
+-- Listados de estudios paginados por keyset sobre (created_at, id), del más nuevo al
+-- más viejo: por paciente, por estado (p. ej. pending) y por tipo de estudio. Cada
+-- índice termina en (created_at, id) para que filtro + orden + cursor se resuelvan
+-- con un rango del índice, sin filesort ni OFFSET.
+ALTER TABLE studies
+    ADD KEY idx_studies_created (created_at, id),
+    ADD KEY idx_studies_patient_created (patient_id, created_at, id),
+    ADD KEY idx_studies_status_created (status, created_at, id),
+    ADD KEY idx_studies_type_created (study_type, created_at, id);
+
+-- Archivos de los estudios de una página (WHERE study_id IN (...) ORDER BY uploaded_at)
+ALTER TABLE study_files
+    ADD KEY idx_study_files_study_uploaded (study_id, uploaded_at);
@@ -0,0 +1,7 @@
+-- Cola de revisión de estudios pendientes: el revisor que lo tomó y hasta cuándo
+-- vale su lease. Un lease vencido (o NULL) deja el estudio disponible para otro
+-- revisor. La toma recorre idx_studies_status_created (011) en orden de antigüedad.
+ALTER TABLE studies
+    ADD COLUMN assigned_to_user_id CHAR(36) NULL,
+    ADD COLUMN claimed_at DATETIME NULL,
+    ADD COLUMN lease_expires_at DATETIME NULL;
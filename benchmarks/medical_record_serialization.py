@@ -0,0 +1,91 @@
+"""
+Benchmark de serialización de historias clínicas largas (GET /medical-records/patient/{id}).
+
+Compara el camino de FastAPI con response_model (validación + jsonable_encoder + json.dumps)
+contra el adapter precompilado que usan las rutas (una validación + dump_json de pydantic-core).
+
+    python -m benchmarks.medical_record_serialization --records 200 --repeat 5
+"""
+import argparse
+import asyncio
+import time
+import typing
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from models.medical_record import MEDICAL_RECORD_LIST_ADAPTER, MedicalRecordFullResponse, dump_records_json
+
+
+def _db_value(annotation, index: int):
+    """Valor con el tipo que devuelve pymysql para una columna del modelo."""
+    base = next((a for a in typing.get_args(annotation) if a is not type(None)), annotation)
+    if base is bool:
+        return index % 2  # tinyint
+    if base is int:
+        return index
+    if base is float:
+        return Decimal("36.5")
+    if base is datetime:
+        return datetime(2025, 1, 1, 12, 0)
+    return f"valor de prueba {index}"
+
+
+def build_history(records: int) -> List[dict]:
+    """Historia clínica sintética con todas las secciones completas, como la arma _fetch_record_sections."""
+    history = []
+    for i in range(records):
+        record_id = str(uuid.uuid4())
+        rec = {"id": record_id, "patient_id": "patient-1"}
+        for section, field in MedicalRecordFullResponse.model_fields.items():
+            if section in ("id", "patient_id"):
+                continue
+            model = typing.get_args(field.annotation)[0]
+            row = {name: _db_value(f.annotation, i) for name, f in model.model_fields.items()}
+            row["id"] = str(uuid.uuid4())
+            rec[section] = row
+        history.append(rec)
+    return history
+
+
+def response_model_path(field, history: List[dict]) -> bytes:
+    content = asyncio.run(serialize_response(field=field, response_content=history))
+    return JSONResponse(content).body
+
+
+def adapter_path(history: List[dict]) -> bytes:
+    return dump_records_json(MEDICAL_RECORD_LIST_ADAPTER, history)
+
+
+def _best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    field = create_model_field(name="Response", type_=List[MedicalRecordFullResponse], mode="serialization")
+    print(f"{'records':>8} {'response_model (ms)':>20} {'adapter (ms)':>14} {'speedup':>8} {'size (KiB)':>11}")
+    for count in args.records:
+        history = build_history(count)
+        legacy = _best_of(lambda: response_model_path(field, history), args.repeat)
+        fast = _best_of(lambda: adapter_path(history), args.repeat)
+        size = len(adapter_path(history)) / 1024
+        print(f"{count:>8} {legacy * 1000:>20.1f} {fast * 1000:>14.1f} {legacy / fast:>7.1f}x {size:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
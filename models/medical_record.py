@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, TypeAdapter, model_validator
 from typing import Optional, List, Any
 import json
 from datetime import datetime
@@ -58,6 +58,9 @@ class MedicalRecordDataImg(BaseModel):
     medical_record_data_id: Optional[str] = None
     url: Optional[str] = None
 
+class MedicalRecordDataImgResponse(MedicalRecordDataImg):
+    data_uri: Optional[str] = None # solo con embed (imagen inline en base64)
+
 class MedicalRecordDerivations(BaseModel):
     id: Optional[str] = None
     medical_record_id: Optional[str] = None
@@ -345,6 +348,8 @@ class MedicalRecordSignatures(BaseModel):
     url: Optional[str] = None
     professional_id: Optional[str] = None
     created_at: Optional[datetime] = None
+    professional_signature_id: Optional[str] = None # firma registrada del profesional (professional_signatures)
+    data_uri: Optional[str] = None # solo en respuestas con embed (imagen inline en base64)
 
 class MedicalRecordLaboralSignatures(BaseModel):
     id: Optional[str] = None
@@ -352,6 +357,8 @@ class MedicalRecordLaboralSignatures(BaseModel):
     url: Optional[str] = None
     professional_id: Optional[str] = None
     created_at: Optional[datetime] = None
+    professional_signature_id: Optional[str] = None # firma registrada del profesional (professional_signatures)
+    data_uri: Optional[str] = None # solo en respuestas con embed (imagen inline en base64)
     
 class MedicalRecordPatientSignatures(BaseModel):
     id: Optional[str] = None
@@ -359,6 +366,7 @@ class MedicalRecordPatientSignatures(BaseModel):
     url: Optional[str] = None
     patient_id: Optional[str] = None
     created_at: Optional[datetime] = None
+    data_uri: Optional[str] = None # solo en respuestas con embed (imagen inline en base64)
     
 class MedicalRecordMedicalResponsableSignatures(BaseModel):
     id: Optional[str] = None
@@ -366,6 +374,7 @@ class MedicalRecordMedicalResponsableSignatures(BaseModel):
     url: Optional[str] = None
     professional_id: Optional[str] = None
     created_at: Optional[datetime] = None
+    data_uri: Optional[str] = None # solo en respuestas con embed (imagen inline en base64)
 
 class MedicalRecordSkinExam(BaseModel):
     id: Optional[str] = None
@@ -537,7 +546,7 @@ class MedicalRecordFullResponse(BaseModel):
     medical_record_cardiovascular_exam: Optional[MedicalRecordCardiovascularExam] = Field(None, description="**Medical Record Cardiovascular Exam**")
     medical_record_clinical_exam: Optional[MedicalRecordClinicalExam] = Field(None, description="**Medical Record Clinical Exam**")
     medical_record_data: Optional[MedicalRecordData] = Field(None, description="**Medical Record Data**")
-    medical_record_data_img: Optional[MedicalRecordDataImg] = Field(None, description="**Medical Record Data Img**")
+    medical_record_data_img: Optional[MedicalRecordDataImgResponse] = Field(None, description="**Medical Record Data Img**")
     medical_record_derivations: Optional[MedicalRecordDerivations] = Field(None, description="**Medical Record Derivations**")
     medical_record_digestive_exam: Optional[MedicalRecordDigestiveExam] = Field(None, description="**Medical Record Digestive Exam**")
     medical_record_evaluation_type: Optional[MedicalRecordEvaluationType] = Field(None, description="**Medical Record Evaluation Type**")
@@ -569,3 +578,23 @@ class MedicalRecordFullResponse(BaseModel):
     medical_record_cuestionario_riesgos: Optional[MedicalRecordCuestionarioRiesgos] = Field(None, description="**Medical Record Cuestionario Riesgos**")
     medical_record_neuro_medical_exam: Optional[MedicalRecordNeuroMedicalExam] = Field(None, description="**Medical Record Neuro Medical Exam**")
     medical_record_oftalmologico_medical_exam: Optional[MedicalRecordOftalmologicoMedicalExam] = Field(None, description="**Medical Record Oftalmologico Medical Exam**")
+
+
+class FindingsQueryRequest(BaseModel):
+    filter: Any = Field(..., description='Hallazgo ("caries" o "seccion.campo") o {"and": [...]}, {"or": [...]}, {"not": ...}')
+    company_id: Optional[str] = None
+    limit: int = Field(100, ge=0, le=5000, description="Cantidad máxima de registros devueltos")
+
+
+# -------------------------------------------------------------------
+# Serialización rápida de respuestas
+# -------------------------------------------------------------------
+
+# Adapters precompilados: se valida una sola vez (tinyint -> bool, Decimal -> float, ...)
+# y se codifica a JSON en pydantic-core, sin pasar por response_model + jsonable_encoder.
+MEDICAL_RECORD_ADAPTER = TypeAdapter(MedicalRecordFullResponse)
+MEDICAL_RECORD_LIST_ADAPTER = TypeAdapter(List[MedicalRecordFullResponse])
+
+def dump_records_json(adapter: TypeAdapter, content: Any) -> bytes:
+    """Valida los dicts armados desde la DB y los devuelve como JSON (bytes)."""
+    return adapter.dump_json(adapter.validate_python(content))
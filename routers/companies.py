@@ -3,6 +3,11 @@ from models.user import User
 from auth.authentication import require_roles, require_active_user
 from Database.getConnection import getConnectionForLogin
 from sqlalchemy import text
+from utils.study_blobs import release_blobs, remove_unused_blobs
+from utils.pdf_render import remove_cached_pdfs
+from utils.change_log import track_change_log
+from utils.storage_dirs import STUDIES_DIR
+from datetime import datetime
 import uuid
 
 router = APIRouter(prefix="/companies", tags=["Companies"])
@@ -228,6 +233,18 @@ async def delete_employee(
             {"pid": patient_id}
         ).mappings().all()
 
+        # Change log de medical_records: un 'delete' por registro (ver GET /medical-records/changes)
+        track_change_log(db)
+        db.execute(
+            text("""
+                INSERT INTO medical_record_changes (medical_record_id, patient_id, version, operation, tables, changed_at)
+                SELECT id, patient_id, version, 'delete', NULL, :now
+                FROM medical_record WHERE patient_id = :pid
+            """),
+            {"pid": patient_id, "now": datetime.utcnow()}
+        )
+
+        unused_study_files = []
         for mr in medical_records:
             mr_id = mr["id"]
             study_ids = db.execute(
@@ -235,6 +252,11 @@ async def delete_employee(
                 {"mrid": mr_id}
             ).mappings().all()
             for s in study_ids:
+                # Archivos físicos: se borran después del commit, solo los que quedan sin referencias
+                unused_study_files.extend(release_blobs(db, db.execute(
+                    text("SELECT file_path, content_hash FROM study_files WHERE study_id = :sid"),
+                    {"sid": s["id"]}
+                ).mappings().all()))
                 db.execute(text("DELETE FROM study_files WHERE study_id = :sid"), {"sid": s["id"]})
             db.execute(text("DELETE FROM studies WHERE medical_record_id = :mrid"), {"mrid": mr_id})
             db.execute(text("DELETE FROM medical_record WHERE id = :mrid"), {"mrid": mr_id})
@@ -245,6 +267,8 @@ async def delete_employee(
             db.execute(text("DELETE FROM users WHERE id = :uid"), {"uid": linked_user_id})
 
         db.commit()
+        remove_unused_blobs(db, STUDIES_DIR, unused_study_files)
+        remove_cached_pdfs([str(mr["id"]) for mr in medical_records])
         
         return {
             "detail": "Employee deleted successfully",
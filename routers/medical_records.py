@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Header, Response, Request, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from models.user import UserSchema
 from models.medical_record import (
-    MedicalRecordFullRequest, MedicalRecordFullResponse,
+    MedicalRecordFullRequest, MedicalRecordFullResponse, FindingsQueryRequest,
+    MEDICAL_RECORD_ADAPTER, MEDICAL_RECORD_LIST_ADAPTER, dump_records_json,
     MedicalRecordBucodentalExam, MedicalRecordCardiovascularExam, MedicalRecordClinicalExam,
     MedicalRecordData, MedicalRecordDataImg, MedicalRecordDerivations, MedicalRecordDigestiveExam,
     MedicalRecordEvaluationType, MedicalRecordFamilyHistory, MedicalRecordGenitourinarioExam,
@@ -14,10 +16,21 @@ from models.medical_record import (
 )
 from auth.authentication import require_active_user, require_roles
 from Database.getConnection import getConnectionForLogin
-from sqlalchemy import text
-from datetime import datetime
+from Database.batch import insert_pending_rows, upsert_rows
+from utils.file_storage import UploadBatch, normalize_upload, remove_files, run_in_file_pool
+from utils.file_cache import data_uri_cache
+from utils.http_cache import etag_matches
+from utils.storage_layout import file_url, relative_path, resolve_path
+from utils.storage_dirs import DATA_IMAGES_DIR, SIGNATURE_TABLES, SIGNATURES_DIR
+from utils.findings_index import FindingsIndex, FindingsIndexCache, FindingsLayout
+from utils.vitals_store import VITAL_NAMES, VITALS_COLUMNS, VitalsStore, VitalsStoreCache
+from utils.change_log import CHANGES_COMMIT_LAG_SECONDS, track_change_log
+from utils.pdf_render import get_or_render_pdf, pdf_cache_path, remove_cached_pdfs
+from utils.image_processing import DATA_IMAGE_PROFILE, SIGNATURE_IMAGE_PROFILE, ImageProfile, is_normalizable, original_copies
+from sqlalchemy import text, bindparam
+from datetime import datetime, timedelta
 from typing import List, Optional, Annotated, Any, Dict
-from pydantic import Json, ValidationError, BeforeValidator
+from pydantic import Json, ValidationError, BeforeValidator, TypeAdapter
 import json
 import uuid
 import os
@@ -25,21 +38,17 @@ import shutil
 import mimetypes
 from pathlib import Path
 import json
+import time
+import typing
+import hashlib
+import numpy as np
+import asyncio
+import re
+from contextlib import contextmanager
 from datetime import date
 
 router = APIRouter(prefix="/medical-records", tags=["Medical Records"])
 
-# Configuration for Signatures
-SIGNATURES_DIR_ENV = os.getenv("SIGNATURES_DIR")
-if SIGNATURES_DIR_ENV:
-    SIGNATURES_DIR = Path(SIGNATURES_DIR_ENV)
-elif os.name == 'posix':
-    SIGNATURES_DIR = Path("/home/iweb/vitalis/data/signatures/")
-else:
-    # Default relative to this file: ./../../signatures
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    SIGNATURES_DIR = Path(os.path.join(BASE_DIR, "signatures"))
-
 DOMAIN_URL = "https://saludvitalis.org/MdpuF8KsXiRArNlHtl6pXO2XyLSJMTQ8_Vitalis/api/signatures"
 
 # Ensure signatures directory exists
@@ -48,15 +57,6 @@ try:
 except Exception as e:
     print(f"Warning: Could not create signatures directory: {e}")
 
-# Configuration for Data Images
-DATA_IMAGES_DIR_ENV = os.getenv("DATA_IMAGES_DIR")
-if DATA_IMAGES_DIR_ENV:
-    DATA_IMAGES_DIR = Path(DATA_IMAGES_DIR_ENV)
-else:
-    # Default relative to this file: ./../../data_images
-    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    DATA_IMAGES_DIR = Path(os.path.join(BASE_DIR, "data_images"))
-
 # Ensure data images directory exists
 try:
     os.makedirs(DATA_IMAGES_DIR, exist_ok=True)
@@ -65,6 +65,15 @@ except Exception as e:
 
 DATA_IMAGES_DOMAIN_URL = "https://saludvitalis.org/MdpuF8KsXiRArNlHtl6pXO2XyLSJMTQ8_Vitalis/api/data_images"
 
+# Firmas registradas del profesional (professional_signatures): se guardan una sola
+# vez como sig_prof_<sha256>.<ext> y se comparten entre todos sus registros
+PROFILE_SIGNATURE_PREFIX = "sig_prof_"
+PROFILE_SIGNATURE_TABLES = ["medical_record_signatures", "medical_record_laboral_signatures"]
+
+# Digest del upload original en el nombre de las imágenes normalizadas (ver _stage_upload)
+SOURCE_DIGEST_LENGTH = 16
+SOURCE_DIGEST_RE = re.compile(r"\.([0-9a-f]{16})\.\w+$")
+
 
 def clean_data(data: Any) -> Any:
     """
@@ -118,18 +127,666 @@ def delete_physical_file(file_url: str, base_directory: Path):
     try:
         # Asumimos que la URL termina en /nombre_archivo.ext
         filename = file_url.split("/")[-1]
-        file_path = base_directory / filename
+        if filename.startswith(PROFILE_SIGNATURE_PREFIX):
+            return # firma registrada del profesional, compartida entre registros
+        file_path = resolve_path(base_directory, file_url)
         
         if file_path.exists():
             os.remove(file_path)
             print(f"File deleted: {file_path}")
         else:
             print(f"File not found on disk: {file_path}")
+        for original in original_copies(file_path):
+            os.remove(original)
     except Exception as e:
         print(f"Error deleting file {file_url}: {e}")
 
+async def _stage_upload(
+    batch: UploadBatch,
+    upload: UploadFile,
+    directory: Path,
+    prefix: str,
+    domain_url: str,
+    image_profile: Optional[ImageProfile] = None,
+) -> tuple:
+    """
+    Registra un upload en el batch con nombre único y devuelve (ruta local, URL pública).
+    El archivo se escribe recién con `await batch.persist()`; las imágenes se normalizan
+    acá, antes de elegir el nombre, y si no se pueden decodificar se guardan tal cual
+    con su propia extensión. Las imágenes normalizadas llevan en el nombre el digest del upload original
+    (`prefijo<uuid>.<digest>.webp`) para poder compararlas sin releer el archivo.
+    """
+    normalized = await normalize_upload(upload, image_profile) if image_profile and is_normalizable(upload) else None
+    if normalized is not None:
+        digest = (await run_in_file_pool(_file_sha256, upload.file))[:SOURCE_DIGEST_LENGTH]
+        filename = relative_path(f"{prefix}{uuid.uuid4()}.{digest}{image_profile.extension}")
+        file_path = batch.add(upload, directory, filename, normalized=normalized)
+    else:
+        file_ext = get_file_extension(upload)
+        filename = relative_path(f"{prefix}{uuid.uuid4()}{file_ext}")
+        file_path = batch.add(upload, directory, filename)
+
+    return file_path, file_url(domain_url, filename)
+
+def _local_file_path(file_url: Optional[str], base_directory: Path) -> Optional[Path]:
+    """
+    Ruta local del archivo al que apunta una URL pública (o None).
+    Las firmas registradas del profesional son compartidas y nunca se devuelven para borrar.
+    """
+    if not file_url:
+        return None
+    filename = file_url.split("/")[-1]
+    if filename.startswith(PROFILE_SIGNATURE_PREFIX):
+        return None
+    return resolve_path(base_directory, file_url)
+
+# Sub-tablas de medical_record (todas cuelgan de medical_record_id, salvo
+# medical_record_data_img que cuelga de medical_record_data)
+MEDICAL_RECORD_TABLES = [
+    "medical_record_bucodental_exam", "medical_record_cardiovascular_exam", "medical_record_clinical_exam",
+    "medical_record_data", "medical_record_data_img", "medical_record_derivations", "medical_record_digestive_exam",
+    "medical_record_evaluation_type", "medical_record_family_history", "medical_record_genitourinario_exam",
+    "medical_record_habits", "medical_record_head_exam", "medical_record_immunizations", "medical_record_laboral_contacts",
+    "medical_record_laboral_exam", "medical_record_laboral_history", "medical_record_neuro_clinical_exam",
+    "medical_record_oftalmologico_exam", "medical_record_orl_exam", "medical_record_osteoarticular_exam",
+    "medical_record_personal_history", "medical_record_previous_problems", "medical_record_psychiatric_clinical_exam",
+    "medical_record_recomendations", "medical_record_respiratorio_exam", "medical_record_signatures",
+    "medical_record_skin_exam", "medical_record_studies", "medical_record_surgerys", "medical_record_laboral_signatures", "medical_record_cuestionario_riesgos", "medical_record_ddjj", "medical_record_neuro_medical_exam", "medical_record_oftalmologico_medical_exam", "medical_record_patient_signatures", "medical_record_medical_responsable_signatures"
+]
+
+# Tabla de firma -> (prefijo del archivo, nombre para mensajes de error)
+SIGNATURE_FILES = {
+    "medical_record_signatures": ("sig_", "signature"),
+    "medical_record_laboral_signatures": ("sig_lab_", "laboral signature"),
+    "medical_record_patient_signatures": ("sig_pat_", "patient signature"),
+    "medical_record_medical_responsable_signatures": ("sig_resp_", "responsable signature"),
+}
+
+# URLs de todos los archivos de un registro: firmas + data images (kind = tabla o "data_img")
+RECORD_FILES_SQL = " UNION ALL ".join(
+    [f"SELECT '{table}' AS kind, url FROM {table} WHERE medical_record_id = :rid" for table in SIGNATURE_TABLES]
+    + ["""SELECT 'data_img' AS kind, img.url FROM medical_record_data_img img
+          JOIN medical_record_data d ON d.id = img.medical_record_data_id
+          WHERE d.medical_record_id = :rid"""]
+)
+
+def _json_response(adapter: TypeAdapter, content: Any, headers: Optional[dict] = None) -> Response:
+    """Respuesta JSON serializada con el adapter precompilado (ver dump_records_json)."""
+    return Response(content=dump_records_json(adapter, content), media_type="application/json", headers=headers)
+
+# Change feed (GET /changes)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+CHANGES_MAX_PAGE_SIZE = int(os.getenv("CHANGES_MAX_PAGE_SIZE", "5000"))
+
+PDF_STREAM_CHUNK_BYTES = 64 * 1024
+
+# Valores de ?embed= -> tablas cuyas imágenes se incluyen inline
+EMBED_KINDS = {
+    "signatures": SIGNATURE_TABLES,
+    "data_img": ["medical_record_data_img"],
+}
+
+# Tabla -> modelo Pydantic de la sección (los nombres de campo coinciden con las tablas)
+SECTION_MODELS = {
+    name: typing.get_args(field.annotation)[0]
+    for name, field in MedicalRecordFullResponse.model_fields.items()
+    if name not in ("id", "patient_id")
+}
+
+# Columnas de texto libre indexadas en medical_record_search (GET /search)
+SEARCH_TEXT_COLUMNS = {
+    table: columns
+    for table, model in SECTION_MODELS.items()
+    if (columns := [name for name in model.model_fields if name == "observations" or name.endswith("_description")])
+}
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_SNIPPET_CHARS = 160
+
+# Hallazgos booleanos por sección -> bitsets de medical_record_findings (POST /findings/query)
+FINDINGS_LAYOUT = FindingsLayout(SECTION_MODELS)
+_findings_indexes = FindingsIndexCache()
+
+# Signos vitales numéricos en columnas NumPy por empresa (GET /vitals/stats)
+_vitals_stores = VitalsStoreCache()
+VITALS_DEFAULT_PERCENTILES = [5, 25, 50, 75, 95]
+VITALS_MAX_BINS = 100
+
+def _file_sha256(fileobj) -> str:
+    """
+    Calcula el SHA-256 de un archivo abierto leyendo por bloques y lo deja en la posición 0.
+    """
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+def _stored_file_sha256(file_url: Optional[str], base_directory: Path) -> Optional[str]:
+    """
+    SHA-256 del archivo ya guardado al que apunta la URL, o None si no existe en disco.
+    """
+    if not file_url:
+        return None
+    file_path = resolve_path(base_directory, file_url)
+    if not file_path.exists():
+        return None
+    with open(file_path, "rb") as f:
+        return _file_sha256(f)
+
+async def _upload_matches_stored(upload: UploadFile, file_url: Optional[str], base_directory: Path) -> bool:
+    """
+    True si el upload tiene el mismo contenido que el archivo guardado.
+    Las imágenes normalizadas se comparan por el digest del original que lleva el nombre;
+    los archivos guardados tal cual, hasheando el archivo en disco (en el pool de archivos).
+    """
+    if not file_url:
+        return False
+    upload_hash = await run_in_file_pool(_file_sha256, upload.file)
+    match = SOURCE_DIGEST_RE.search(file_url)
+    if match:
+        return upload_hash.startswith(match.group(1))
+    return await run_in_file_pool(_stored_file_sha256, file_url, base_directory) == upload_hash
+
+def _section_diff(table_name: str, current_row: Optional[dict], new_values: dict) -> dict:
+    """
+    Devuelve solo las columnas de new_values que difieren de la fila actual.
+    Ambos lados se normalizan con el modelo de la sección (tinyint -> bool, Decimal -> float, etc.).
+    """
+    new_values = {k: v for k, v in new_values.items() if k not in ("id", "medical_record_id", "medical_record_data_id")}
+    if not current_row:
+        return new_values
+
+    model = SECTION_MODELS[table_name]
+    current = model.model_validate(current_row).model_dump()
+    return {k: v for k, v in new_values.items() if current.get(k) != v}
+
+def _record_etag(record_id: str, version: int, variant: str = "") -> str:
+    """ETag del registro; variant distingue representaciones distintas (p.ej. con embed)."""
+    return f'"{record_id}-{version}{"-" + variant if variant else ""}"'
+
+def _change_row(record_id: str, patient_id: str, version: int, operation: str, tables: Optional[List[str]] = None) -> dict:
+    """Fila de medical_record_changes (change log para GET /changes)."""
+    return {
+        "medical_record_id": record_id,
+        "patient_id": patient_id,
+        "version": version,
+        "operation": operation,
+        "tables": json.dumps(sorted(tables)) if tables else None,
+        "changed_at": datetime.utcnow(),
+    }
+
+def _log_record_change(db, record_id: str, operation: str, tables: Optional[List[str]] = None):
+    """
+    Agrega el cambio al change log dentro de la transacción en curso, tomando
+    patient_id / version actuales del registro (llamar después del UPDATE de version).
+    """
+    track_change_log(db)
+    db.execute(
+        text("""
+            INSERT INTO medical_record_changes (medical_record_id, patient_id, version, operation, tables, changed_at)
+            SELECT id, patient_id, version, :operation, :tables, :changed_at
+            FROM medical_record WHERE id = :rid
+        """),
+        {
+            "rid": record_id,
+            "operation": operation,
+            "tables": json.dumps(sorted(tables)) if tables else None,
+            "changed_at": datetime.utcnow(),
+        }
+    )
+
+def _search_content(table_name: str, row: dict) -> str:
+    """Texto indexable de una fila de sección (observaciones / descripciones)."""
+    return " ".join(str(row[col]) for col in SEARCH_TEXT_COLUMNS.get(table_name, []) if row.get(col))
+
+def _refresh_search_index(db, record_id: str, tables):
+    """
+    Re-indexa en medical_record_search las secciones tocadas, leyendo el texto de la
+    fila ya actualizada (un INSERT ... SELECT por sección con texto libre).
+    """
+    for table in tables:
+        columns = SEARCH_TEXT_COLUMNS.get(table)
+        if not columns:
+            continue
+        content = columns[0] if len(columns) == 1 else f"CONCAT_WS(' ', {', '.join(columns)})"
+        db.execute(
+            text(f"""
+                INSERT INTO medical_record_search (medical_record_id, section, content)
+                SELECT medical_record_id, :section, COALESCE({content}, '') FROM {table} WHERE medical_record_id = :rid
+                ON DUPLICATE KEY UPDATE content = VALUES(content)
+            """),
+            {"section": table, "rid": record_id}
+        )
+
+def _refresh_findings(db, record_id: str, tables):
+    """Recalcula los bitsets de hallazgos de las secciones tocadas a partir de sus filas actuales."""
+    rows = []
+    for table in tables:
+        names = FINDINGS_LAYOUT.fields.get(table)
+        if not names:
+            continue
+        current = db.execute(
+            text(f"SELECT {', '.join(names)} FROM {table} WHERE medical_record_id = :rid LIMIT 1"),
+            {"rid": record_id}
+        ).mappings().first()
+        if current:
+            rows.append({"medical_record_id": record_id, "section": table, "bits": FINDINGS_LAYOUT.pack(table, current)})
+    if rows:
+        upsert_rows(db, "medical_record_findings", rows, ["bits"])
+
+def _load_findings(db, company_id: Optional[str], record_ids: Optional[List[str]] = None):
+    """(record_id, patient_id) y (record_id, sección, bits) de un alcance, opcionalmente solo algunos registros."""
+    scope = "JOIN patients p ON p.id = mr.patient_id WHERE 1=1"
+    params: Dict[str, Any] = {}
+    if company_id:
+        scope += " AND p.company_id = :cid"
+        params["cid"] = company_id
+    if record_ids is not None:
+        scope += " AND mr.id IN :ids"
+        params["ids"] = record_ids
+
+    def run(sql):
+        stmt = text(sql)
+        if record_ids is not None:
+            stmt = stmt.bindparams(bindparam("ids", expanding=True))
+        return db.execute(stmt, params).all()
+
+    records = run(f"SELECT mr.id, mr.patient_id FROM medical_record mr {scope}")
+    bits = run(f"""
+        SELECT f.medical_record_id, f.section, f.bits
+        FROM medical_record_findings f JOIN medical_record mr ON mr.id = f.medical_record_id {scope}
+    """)
+    return records, bits
+
+def _company_scope(db, current_user: UserSchema, company_id: Optional[str]) -> Optional[str]:
+    """Alcance de las consultas poblacionales: una empresa solo ve a sus propios pacientes."""
+    if current_user.role != "company":
+        return company_id
+    company_row = db.execute(
+        text("SELECT id FROM companies WHERE owner_user_id = :uid"), {"uid": current_user.id}
+    ).mappings().first()
+    if not company_row or (company_id and company_id != company_row["id"]):
+        raise HTTPException(status_code=403, detail="You can only query your own company patients")
+    return company_row["id"]
+
+def _changes_watermark(db) -> int:
+    """Último seq seguro del change log: el mayor con changed_at fuera de la ventana de commit."""
+    cutoff = datetime.utcnow() - timedelta(seconds=CHANGES_COMMIT_LAG_SECONDS)
+    return db.execute(
+        text("SELECT seq FROM medical_record_changes WHERE changed_at <= :cutoff ORDER BY seq DESC LIMIT 1"),
+        {"cutoff": cutoff}
+    ).scalar() or 0
+
+def _changed_records(db, since: int, upto: int) -> List[str]:
+    """Ids de registros con cambios en el change log entre dos seq (since, upto]."""
+    return [str(row[0]) for row in db.execute(
+        text("SELECT DISTINCT medical_record_id FROM medical_record_changes WHERE seq > :since AND seq <= :upto"),
+        {"since": since, "upto": upto}
+    ).all()]
+
+def _findings_index(db, company_id: Optional[str]) -> FindingsIndex:
+    """
+    Índice en memoria del alcance. Se arma completo la primera vez (o al vencer el TTL)
+    y después se actualiza solo con los registros que aparecen en el change log.
+    """
+    seq = _changes_watermark(db)
+    index = _findings_indexes.get(company_id)
+    if index is None:
+        index = FindingsIndex(FINDINGS_LAYOUT, seq)
+        index.upsert(*_load_findings(db, company_id))
+        _findings_indexes.put(company_id, index)
+    elif seq > index.seq:
+        changed = _changed_records(db, index.seq, seq)
+        index.remove(changed)
+        if changed:
+            index.upsert(*_load_findings(db, company_id, changed))
+        index.seq = seq
+    return index
+
+def _load_vitals(db, company_id: Optional[str], record_ids: Optional[List[str]] = None):
+    """(record_id, *VITAL_NAMES) de un alcance, opcionalmente solo algunos registros."""
+    columns, joins = [], []
+    for i, (table, names) in enumerate(VITALS_COLUMNS.items()):
+        columns += [f"v{i}.{name}" for name in names]
+        joins.append(f"LEFT JOIN {table} v{i} ON v{i}.medical_record_id = mr.id")
+    sql = f"""
+        SELECT mr.id, {', '.join(columns)}
+        FROM medical_record mr
+        JOIN patients p ON p.id = mr.patient_id
+        {' '.join(joins)}
+        WHERE 1=1
+    """
+    params: Dict[str, Any] = {}
+    if company_id:
+        sql += " AND p.company_id = :cid"
+        params["cid"] = company_id
+    stmt = text(sql)
+    if record_ids is not None:
+        stmt = text(sql + " AND mr.id IN :ids").bindparams(bindparam("ids", expanding=True))
+        params["ids"] = record_ids
+    return db.execute(stmt, params).all()
+
+def _vitals_store(db, company_id: Optional[str]) -> VitalsStore:
+    """Igual que _findings_index: carga completa la primera vez, luego solo lo que cambió."""
+    seq = _changes_watermark(db)
+    store = _vitals_stores.get(company_id)
+    if store is None:
+        store = VitalsStore(seq)
+        store.upsert(_load_vitals(db, company_id))
+        _vitals_stores.put(company_id, store)
+    elif seq > store.seq:
+        changed = _changed_records(db, store.seq, seq)
+        store.remove(changed)
+        if changed:
+            store.upsert(_load_vitals(db, company_id, changed))
+        store.seq = seq
+    return store
+
+def _search_snippet(content: str, query: str) -> str:
+    """Fragmento del texto alrededor del primer término de la búsqueda que aparece."""
+    lowered = content.lower()
+    positions = [lowered.find(term) for term in query.lower().split() if term]
+    start = min((pos for pos in positions if pos >= 0), default=0)
+    start = max(0, start - SEARCH_SNIPPET_CHARS // 4)
+    snippet = content[start:start + SEARCH_SNIPPET_CHARS]
+    return ("..." if start else "") + snippet + ("..." if start + SEARCH_SNIPPET_CHARS < len(content) else "")
+
+def _parse_embed(embed: Optional[str]) -> List[str]:
+    """Valida el parámetro embed ("signatures", "data_img", separados por coma)."""
+    if not embed:
+        return []
+    kinds = sorted({k.strip() for k in embed.split(",") if k.strip()})
+    invalid = [k for k in kinds if k not in EMBED_KINDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid embed value(s): {', '.join(invalid)}")
+    return kinds
+
+async def _embed_images(records: List[dict], kinds: List[str]):
+    """
+    Agrega `data_uri` (base64) a las firmas / data image de cada registro cuyo archivo
+    no supere EMBED_MAX_FILE_BYTES. Los hits del LRU no tocan el disco; los misses
+    se leen en paralelo en el pool de archivos.
+    """
+    targets = []
+    for rec in records:
+        for kind in kinds:
+            for table in EMBED_KINDS[kind]:
+                row = rec.get(table)
+                if row and row.get("url"):
+                    base_dir = DATA_IMAGES_DIR if table == "medical_record_data_img" else SIGNATURES_DIR
+                    targets.append((row, resolve_path(base_dir, row["url"])))
+
+    misses = []
+    for row, file_path in targets:
+        data_uri = data_uri_cache.get(file_path)
+        if data_uri is not None:
+            row["data_uri"] = data_uri
+        else:
+            misses.append((row, file_path))
+
+    loaded = await asyncio.gather(*(run_in_file_pool(data_uri_cache.load, file_path) for _, file_path in misses))
+    for (row, _), data_uri in zip(misses, loaded):
+        if data_uri is not None:
+            row["data_uri"] = data_uri
+
+def _fetch_record_sections(db, rec, tables: Optional[List[str]] = None) -> dict:
+    """
+    Arma el dict completo de un medical_record (id, patient_id + todas las sub-tablas).
+    - **tables**: si se indica, solo se consultan esas sub-tablas.
+    """
+    full_rec = {"id": rec["id"], "patient_id": rec["patient_id"]}
+
+    # Ensure record_id is string
+    rec_id_str = str(rec["id"])
+    print(f"Fetching sub-tables for medical_record_id: {rec_id_str}") # DEBUG log
+
+    for table in MEDICAL_RECORD_TABLES:
+        if table == "medical_record_data_img":
+            continue # handled with data
+        if tables is not None and table not in tables:
+            continue
+
+        try:
+            row = db.execute(
+                text(f"SELECT * FROM {table} WHERE medical_record_id = :rid LIMIT 1"),
+                {"rid": rec_id_str}
+            ).mappings().first()
+
+            if row:
+                row_dict = dict(row)
+                # Ensure ID is string
+                if "id" in row_dict:
+                   row_dict["id"] = str(row_dict["id"])
+                full_rec[table] = row_dict
+            else:
+                print(f"Table {table}: No record found for medical_record_id={rec_id_str}") # DEBUG log
+        except Exception as e:
+            print(f"Error fetching table {table} for medical_record_id={rec_id_str}: {e}") # DEBUG log
+
+    # Handle medical_record_data_img
+    wants_img = tables is None or "medical_record_data_img" in tables
+    if wants_img and "medical_record_data" in full_rec and full_rec["medical_record_data"]:
+        data_dict = full_rec["medical_record_data"]
+        # Ensure existing data ID is string
+        data_id = str(data_dict["id"])
+
+        print(f"Fetching image for data_id: {data_id}") # DEBUG log
+
+        try:
+            img_row = db.execute(
+                text("SELECT * FROM medical_record_data_img WHERE medical_record_data_id = :did LIMIT 1"),
+                {"did": data_id}
+            ).mappings().first()
+
+            if img_row:
+                img_dict = dict(img_row)
+                if "id" in img_dict:
+                    img_dict["id"] = str(img_dict["id"])
+                full_rec["medical_record_data_img"] = img_dict
+            else:
+                print(f"No image found for medical_record_data_id={data_id}")
+        except Exception as e:
+            print(f"Error fetching image for data_id={data_id}: {e}")
+
+    return full_rec
+
+async def _register_profile_signature(db, batch: UploadBatch, professional_id: str, upload: UploadFile, content_hash: str, is_default: bool) -> dict:
+    """
+    Da de alta una firma en professional_signatures. El archivo se nombra por su hash,
+    así que subir la misma imagen dos veces no genera otra copia.
+    """
+    normalized = await normalize_upload(upload, SIGNATURE_IMAGE_PROFILE) if is_normalizable(upload) else None
+    file_ext = SIGNATURE_IMAGE_PROFILE.extension if normalized is not None else get_file_extension(upload)
+    filename = relative_path(f"{PROFILE_SIGNATURE_PREFIX}{content_hash}{file_ext}")
+    batch.add(upload, SIGNATURES_DIR, filename, shared=True, normalized=normalized)
+
+    row = {
+        "id": str(uuid.uuid4()),
+        "professional_id": professional_id,
+        "url": file_url(DOMAIN_URL, filename),
+        "content_hash": content_hash,
+        "is_default": 1 if is_default else 0,
+        "created_at": datetime.utcnow(),
+    }
+    db.execute(text("""
+        INSERT INTO professional_signatures (id, professional_id, url, content_hash, is_default, created_at)
+        VALUES (:id, :professional_id, :url, :content_hash, :is_default, :created_at)
+    """), row)
+    return row
+
+async def _resolve_profile_signatures(
+    db,
+    batch: UploadBatch,
+    professional_id: Optional[str],
+    uploads: Dict[str, Optional[UploadFile]],
+    use_registered: bool = False,
+) -> Dict[str, dict]:
+    """
+    Resuelve las firmas del profesional (evaluador / laboral) contra professional_signatures.
+    Devuelve {tabla: {"url", "professional_signature_id"}}:
+    - upload cuyo hash ya está registrado -> se reutiliza el archivo existente (no se escribe nada).
+    - upload nuevo -> se registra (direccionado por contenido) y queda como default si no había.
+    - sin upload y use_registered -> firma por defecto del profesional.
+    """
+    resolved: Dict[str, dict] = {}
+    if not professional_id:
+        return resolved
+
+    hashes: Dict[str, str] = {}
+    for table_name in PROFILE_SIGNATURE_TABLES:
+        upload = uploads.get(table_name)
+        if upload:
+            hashes[table_name] = await run_in_file_pool(_file_sha256, upload.file)
+
+    wants_default = use_registered and any(not uploads.get(t) for t in PROFILE_SIGNATURE_TABLES)
+    if not hashes and not wants_default:
+        return resolved
+
+    rows = db.execute(
+        text("""
+            SELECT id, url, content_hash, is_default
+            FROM professional_signatures
+            WHERE professional_id = :pid AND (is_default = 1 OR content_hash IN :hashes)
+        """).bindparams(bindparam("hashes", expanding=True)),
+        {"pid": professional_id, "hashes": list(hashes.values()) or [""]}
+    ).mappings().all()
+
+    by_hash = {row["content_hash"]: dict(row) for row in rows}
+    default = next((dict(row) for row in rows if row["is_default"]), None)
+
+    for table_name in PROFILE_SIGNATURE_TABLES:
+        upload = uploads.get(table_name)
+        if upload:
+            content_hash = hashes[table_name]
+            profile = by_hash.get(content_hash)
+            if not profile:
+                profile = await _register_profile_signature(db, batch, professional_id, upload, content_hash, is_default=default is None)
+                by_hash[content_hash] = profile
+                if default is None:
+                    default = profile
+        elif use_registered and default:
+            profile = default
+        else:
+            continue
+        resolved[table_name] = {"url": profile["url"], "professional_signature_id": profile["id"]}
+
+    return resolved
+
+
+class _PhaseTimer:
+    """
+    Mide la duración (ms) de cada fase de un request. Se loguea y se expone
+    en el header Server-Timing.
+    """
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.phases.items())
+
+
+def _build_record_rows(
+    record_id: str,
+    patient_id: str,
+    model_dump: dict,
+    professional_id: Optional[str] = None,
+    data_img_url: Optional[str] = None,
+    signature_urls: Optional[Dict[str, Optional[str]]] = None,
+    signature_dates: Optional[Dict[str, Any]] = None,
+    signature_profile_ids: Optional[Dict[str, str]] = None,
+) -> List[tuple]:
+    """
+    Arma la lista ordenada de (tabla, fila) que compone un medical_record nuevo:
+    registro padre, medical_record_data (+ imagen), sub-tablas y firmas.
+    No toca la DB; la inserción agrupada la hace Database.batch.insert_pending_rows.
+    """
+    signature_urls = signature_urls or {}
+    signature_dates = signature_dates or {}
+    signature_profile_ids = signature_profile_ids or {}
+
+    rows = [("medical_record", {"id": record_id, "patient_id": patient_id, "version": 1})]
+
+    # KEY: medical_record_data va primero, su ID se usa en medical_record_data_img
+    mr_data_id = None
+    data_dict = model_dump.get("medical_record_data")
+    if data_dict:
+        # Always generate a new ID for the new record data, ignoring client input to prevent collisions
+        mr_data_id = str(uuid.uuid4())
+        rows.append(("medical_record_data", {**data_dict, "id": mr_data_id, "medical_record_id": record_id}))
+
+        # Data Image subida como archivo
+        if data_img_url:
+            rows.append(("medical_record_data_img", {
+                "id": str(uuid.uuid4()),
+                "medical_record_data_id": mr_data_id,
+                "url": data_img_url
+            }))
+
+    for field_name, field_value in model_dump.items():
+        if field_name in SIGNATURE_TABLES or field_name == "medical_record_data":
+            continue
+        if not field_value:
+            continue
+
+        row = {**field_value, "id": str(uuid.uuid4())}
+        if field_name == "medical_record_data_img":
+            # Model: MedicalRecordDataImg(id, medical_record_data_id, url) -> no lleva medical_record_id
+            if mr_data_id:
+                row["medical_record_data_id"] = mr_data_id
+        else:
+            row["medical_record_id"] = record_id
+        rows.append((field_name, row))
+
+        bits = FINDINGS_LAYOUT.pack(field_name, row)
+        if bits is not None:
+            rows.append(("medical_record_findings", {"medical_record_id": record_id, "section": field_name, "bits": bits}))
+
+        search_content = _search_content(field_name, row)
+        if search_content:
+            rows.append(("medical_record_search", {
+                "medical_record_id": record_id, "section": field_name, "content": search_content
+            }))
+
+    # Firmas: el JSON puede traer datos, la URL del archivo subido se mezcla encima
+    for table_name in SIGNATURE_TABLES:
+        sig_data = dict(model_dump.get(table_name) or {})
+        url = signature_urls.get(table_name)
+        if url:
+            sig_data["url"] = url
+        if not sig_data:
+            continue
+
+        sig_data["id"] = str(uuid.uuid4())
+        sig_data["medical_record_id"] = record_id
+        sig_data["created_at"] = signature_dates.get(table_name)
+        if table_name == "medical_record_patient_signatures":
+            sig_data["patient_id"] = patient_id
+        elif professional_id:
+            sig_data["professional_id"] = professional_id
+        if table_name in signature_profile_ids:
+            sig_data["professional_signature_id"] = signature_profile_ids[table_name]
+        rows.append((table_name, sig_data))
+
+    rows.append(("medical_record_changes", _change_row(
+        record_id, patient_id, 1, "create", [table for table, _ in rows if table != "medical_record"]
+    )))
+    return rows
+
+
 @router.post("/", response_model=dict)
 async def create_medical_record(
+    response: Response,
     patient_id: str = Form(...),
     data: Json[MedicalRecordFullRequest] = Form(...),
     data_img: UploadFile = File(None),
@@ -141,6 +798,7 @@ async def create_medical_record(
     fecha_medico_laboral: Optional[date] = Form(None),
     firma_responsable: UploadFile = File(None),
     fecha_responsable: Optional[date] = Form(None),
+    usar_firma_registrada: bool = Form(False),
     current_user: UserSchema = Depends(require_roles("professional", "admin"))
 ):
     """
@@ -149,333 +807,552 @@ async def create_medical_record(
     - **data**: A JSON string matching `MedicalRecordFullRequest`.
     - **data_img**: Optional image for medical record data.
     - **file**: Optional signature image file.
+    - **usar_firma_registrada**: use the professional's registered signature for
+      the evaluador / laboral slots that have no file.
+
+    Timings of each phase (validation, files, db) are returned in `Server-Timing`.
     """
     request_model = data
+    timer = _PhaseTimer()
 
     db = getConnectionForLogin()
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
         
     try:
-        # 2. Check Patient
-        patient = db.execute(
-            text("SELECT id, company_id FROM patients WHERE id = :pid"),
-            {"pid": patient_id}
-        ).mappings().first()
-        
-        if not patient:
-            raise HTTPException(status_code=404, detail="Patient not found")
+        # 1. Validación: paciente + professional_id en un solo round trip
+        with timer.phase("validation"):
+            patient = db.execute(
+                text("""
+                    SELECT p.id, p.company_id,
+                           (SELECT pr.id FROM professionals pr WHERE pr.user_id = :uid LIMIT 1) AS professional_id
+                    FROM patients p
+                    WHERE p.id = :pid
+                """),
+                {"pid": patient_id, "uid": current_user.id}
+            ).mappings().first()
+
+            if not patient:
+                raise HTTPException(status_code=404, detail="Patient not found")
+
+            prof_id = patient["professional_id"] if current_user.role == "professional" else None
+
+            model_dump = request_model.model_dump(exclude_unset=True)
+            # Limpiar placeholders de Swagger ("string" -> None)
+            model_dump = clean_data(model_dump)
+
+        # 2. Archivos (firmas + data image): se escriben en paralelo y se borran
+        #    automáticamente si la transacción hace rollback
+        with timer.phase("files"):
+            batch = UploadBatch(db)
+            uploads = {
+                "medical_record_signatures": firma_medico_evaluador,
+                "medical_record_laboral_signatures": firma_medico_laboral,
+                "medical_record_patient_signatures": firma_paciente,
+                "medical_record_medical_responsable_signatures": firma_responsable,
+            }
+            # Firmas del profesional: se reutiliza la registrada si el contenido coincide
+            profile_signatures = await _resolve_profile_signatures(db, batch, prof_id, uploads, usar_firma_registrada)
+            signature_urls: Dict[str, Optional[str]] = {t: sig["url"] for t, sig in profile_signatures.items()}
+            for table_name, upload in uploads.items():
+                if upload and table_name not in signature_urls:
+                    prefix, _ = SIGNATURE_FILES[table_name]
+                    _, signature_urls[table_name] = await _stage_upload(batch, upload, SIGNATURES_DIR, prefix, DOMAIN_URL, SIGNATURE_IMAGE_PROFILE)
+
+            data_img_url = None
+            if data_img:
+                _, data_img_url = await _stage_upload(batch, data_img, DATA_IMAGES_DIR, "data_", DATA_IMAGES_DOMAIN_URL, DATA_IMAGE_PROFILE)
 
-        # 3. Handle Signature File if present
-        signature_url = None
-        if firma_medico_evaluador:
             try:
-                # Generate unique filename
-                file_ext = get_file_extension(firma_medico_evaluador)
-                filename = f"sig_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_medico_evaluador.file, buffer)
-                
-                # Construct URL
-                # If DOMAIN_URL ends with /, don't add another.
-                base_url = DOMAIN_URL.rstrip("/")
-                signature_url = f"{base_url}/{filename}"
+                await batch.persist()
             except Exception as e:
-                print(f"Error saving signature: {e}")
-                # Continue without signature or fail? 
-                # User requirement said "pide una imagen para luego guardarla". 
-                # If it fails, maybe we should fail.
-                raise HTTPException(status_code=500, detail=f"Error saving signature file: {str(e)}")
-
-        # 3a. Handle Laboral Signature File if present
-        laboral_signature_url = None
-        if firma_medico_laboral:
-            try:
-                # Generate unique filename
-                file_ext = get_file_extension(firma_medico_laboral)
-                filename = f"sig_lab_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_medico_laboral.file, buffer)
-                
-                # Construct URL
-                base_url = DOMAIN_URL.rstrip("/")
-                laboral_signature_url = f"{base_url}/{filename}"
-            except Exception as e:
-                print(f"Error saving laboral signature: {e}")
-                raise HTTPException(status_code=500, detail=f"Error saving laboral signature file: {str(e)}")
+                print(f"Error saving files: {e}")
+                raise HTTPException(status_code=500, detail=f"Error saving files: {str(e)}")
+
+        # 3. DB: todas las filas agrupadas por tabla en una sola transacción
+        with timer.phase("db"):
+            record_id = str(uuid.uuid4())
+            track_change_log(db)
+            pending_rows = _build_record_rows(
+                record_id,
+                patient_id,
+                model_dump,
+                professional_id=prof_id,
+                data_img_url=data_img_url,
+                signature_urls=signature_urls,
+                signature_dates={
+                    "medical_record_signatures": fecha_medico_evaluador,
+                    "medical_record_laboral_signatures": fecha_medico_laboral,
+                    "medical_record_patient_signatures": fecha_paciente,
+                    "medical_record_medical_responsable_signatures": fecha_responsable,
+                },
+                signature_profile_ids={t: sig["professional_signature_id"] for t, sig in profile_signatures.items()},
+            )
+            insert_pending_rows(db, pending_rows)
+            db.commit()
+
+        response.headers["Server-Timing"] = timer.server_timing()
+        print(f"create_medical_record {record_id}: {timer.server_timing()}")
+        return {"id": record_id, "detail": "Medical record created successfully"}
 
-        # 3b. Handle Data Image File if present
-        data_img_url = None
-        if data_img:
-            try:
-                # Generate unique filename
-                file_ext = get_file_extension(data_img)
-                filename = f"data_{uuid.uuid4()}{file_ext}"
-                file_path = DATA_IMAGES_DIR / filename 
-                
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(data_img.file, buffer)
-                
-                # Construct URL
-                base_url = DATA_IMAGES_DOMAIN_URL.rstrip("/")
-                data_img_url = f"{base_url}/{filename}"
-            except Exception as e:
-                print(f"Error saving data image: {e}")
-                raise HTTPException(status_code=500, detail=f"Error saving data image file: {str(e)}")
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error creating medical record: {str(e)}")
+    finally:
+        db.close()
 
-        # 3c. Handle Patient Signature File if present
-        patient_signature_url = None
-        if firma_paciente:
-            try:
-                # Generate unique filename
-                file_ext = get_file_extension(firma_paciente)
-                filename = f"sig_pat_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_paciente.file, buffer)
-                
-                # Construct URL
-                base_url = DOMAIN_URL.rstrip("/")
-                patient_signature_url = f"{base_url}/{filename}"
-            except Exception as e:
-                print(f"Error saving patient signature: {e}")
-                raise HTTPException(status_code=500, detail=f"Error saving patient signature file: {str(e)}")
-        
-        # 3d. Handle Responsable Signature File if present
-        responsable_signature_url = None
-        if firma_responsable:
+
+# Bulk: cantidad de registros por transacción y máximo por request
+BULK_CHUNK_SIZE = int(os.getenv("MEDICAL_RECORDS_BULK_CHUNK_SIZE", "200"))
+BULK_MAX_ITEMS = int(os.getenv("MEDICAL_RECORDS_BULK_MAX_ITEMS", "10000"))
+# Tamaño máximo de una línea (un registro) del NDJSON
+BULK_MAX_LINE_BYTES = int(os.getenv("MEDICAL_RECORDS_BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+
+
+def _ndjson_line_too_long(line_no: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Line {line_no} exceeds {BULK_MAX_LINE_BYTES} bytes")
+
+
+async def _read_ndjson(request: Request):
+    """
+    Lee el body como NDJSON de forma incremental (sin cargar todo el request en memoria)
+    y devuelve un generador de (número de línea, texto de la línea) no vacías. Cada bloque
+    se busca una sola vez desde donde terminó la búsqueda anterior; 413 si una línea
+    supera BULK_MAX_LINE_BYTES.
+    """
+    buffer = bytearray()
+    line_no = 0
+    async for chunk in request.stream():
+        scan_from = len(buffer)  # lo que ya estaba no tiene "\n"
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", scan_from)) != -1:
+            line_no += 1
+            if end - start > BULK_MAX_LINE_BYTES:
+                raise _ndjson_line_too_long(line_no)
+            line = bytes(buffer[start:end])
+            if line.strip():
+                yield line_no, line
+            start = scan_from = end + 1
+        del buffer[:start]
+        if len(buffer) > BULK_MAX_LINE_BYTES:
+            raise _ndjson_line_too_long(line_no + 1)
+    if buffer.strip():
+        yield line_no + 1, bytes(buffer)
+
+
+@router.post("/bulk", response_model=dict)
+async def bulk_create_medical_records(
+    request: Request,
+    response: Response,
+    current_user: UserSchema = Depends(require_roles("professional", "admin"))
+):
+    """
+    Alta masiva de medical_records (campañas de exámenes periódicos).
+    - **Body**: NDJSON (`application/x-ndjson`), una línea por registro:
+      `{"patient_id": "...", "data": { ...MedicalRecordFullRequest... }}`
+    - Se valida todo antes de insertar; luego se inserta en transacciones de
+      `MEDICAL_RECORDS_BULK_CHUNK_SIZE` registros con INSERTs multi-fila.
+    - Devuelve un manifiesto con el resultado de cada ítem (created / invalid / failed).
+    """
+    timer = _PhaseTimer()
+    items: List[dict] = []
+
+    # 1. Parseo + validación de cada línea
+    with timer.phase("validation"):
+        async for line_no, line in _read_ndjson(request):
+            if len(items) >= BULK_MAX_ITEMS:
+                raise HTTPException(status_code=413, detail=f"Too many items (max {BULK_MAX_ITEMS})")
+
+            item = {"index": len(items), "line": line_no, "patient_id": None, "status": "pending"}
+            items.append(item)
             try:
-                # Generate unique filename
-                file_ext = get_file_extension(firma_responsable)
-                filename = f"sig_resp_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_responsable.file, buffer)
-                
-                # Construct URL
-                base_url = DOMAIN_URL.rstrip("/")
-                responsable_signature_url = f"{base_url}/{filename}"
-            except Exception as e:
-                print(f"Error saving responsable signature: {e}")
-                raise HTTPException(status_code=500, detail=f"Error saving responsable signature file: {str(e)}")
+                payload = json.loads(line)
+                if not isinstance(payload, dict):
+                    raise ValueError("Each line must be a JSON object")
+                patient_id = payload.get("patient_id")
+                if not patient_id:
+                    raise ValueError("patient_id is required")
+                if not isinstance(patient_id, str):
+                    raise ValueError("patient_id must be a string")
+                item["patient_id"] = patient_id
+                request_model = MedicalRecordFullRequest.model_validate(payload.get("data") or {})
+                item["model_dump"] = clean_data(request_model.model_dump(exclude_unset=True))
+            except ValidationError as e:
+                item["status"] = "invalid"
+                item["error"] = [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+            except ValueError as e:
+                item["status"] = "invalid"
+                item["error"] = str(e)
+
+        if not items:
+            raise HTTPException(status_code=400, detail="Empty batch")
 
-        # 4. Insert Main Record
-        record_id = str(uuid.uuid4())
-        
-        # 'medical_record' table only has id and patient_id in new schema
-        db.execute(text("""
-            INSERT INTO medical_record (id, patient_id)
-            VALUES (:id, :patient_id)
-        """), {
-            "id": record_id,
-            "patient_id": patient_id
-        })
-
-        # 5. Insert Sub-tables
-        # We iterate over the fields of the request_model
-        model_dump = request_model.model_dump(exclude_unset=True)
-        # Limpiar placeholders de Swagger ("string" -> None)
-        model_dump = clean_data(model_dump)
-        
-        # Helper to insert generic sub-table
-        def insert_sub_table(table_name: str, data_dict: dict, inject_medical_record_id: bool = True):
-            if not data_dict:
-                 return
-            
-            # Prepare data
-            data_dict["id"] = str(uuid.uuid4())
-            if inject_medical_record_id:
-                data_dict["medical_record_id"] = record_id
-            
-            
-            # Construct Query dynamically
-            columns = list(data_dict.keys())
-            values_placeholders = [f":{col}" for col in columns]
-            
-            query = f"""
-                INSERT INTO {table_name} ({', '.join(columns)})
-                VALUES ({', '.join(values_placeholders)})
-            """
-            
-            db.execute(text(query), data_dict)
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
 
-        # Iterate through all fields in the request model
-        # The field names in Pydantic match the Table names exactly (e.g. medical_record_clinical_exam)
-        mr_data_id = None
-        
-        # KEY: We must insert medical_record_data FIRST if it exists, to get its ID for medical_record_data_img
-        if request_model.medical_record_data:
-             data_dict = request_model.medical_record_data.model_dump(exclude_unset=True)
-             if data_dict:
-                 # Always generate a new ID for the new record data, ignoring client input to prevent collisions
-                 mr_data_id = str(uuid.uuid4())
-                 data_dict["id"] = mr_data_id
-                 
-                 data_dict["medical_record_id"] = record_id
-                 
-                 # Insert manual
-                 cols = list(data_dict.keys())
-                 vals = [f":{col}" for col in cols]
-                 query = f"INSERT INTO medical_record_data ({', '.join(cols)}) VALUES ({', '.join(vals)})"
-                 db.execute(text(query), data_dict)
-
-                 # Insert Data Image if exists
-                 if data_img_url:
-                     img_data = {
-                         "id": str(uuid.uuid4()),
-                         "medical_record_data_id": mr_data_id,
-                         "url": data_img_url
-                     }
-                     db.execute(
-                         text("INSERT INTO medical_record_data_img (id, medical_record_data_id, url) VALUES (:id, :medical_record_data_id, :url)"),
-                         img_data
-                     )
+    try:
+        # 2. Pacientes existentes (una consulta por bloque de IDs) + professional_id
+        with timer.phase("validation"):
+            patient_ids = list({item["patient_id"] for item in items if item["status"] == "pending"})
+            existing_patients = set()
+            for start in range(0, len(patient_ids), 1000):
+                rows = db.execute(
+                    text("SELECT id FROM patients WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                    {"ids": patient_ids[start:start + 1000]}
+                ).mappings().all()
+                existing_patients.update(str(row["id"]) for row in rows)
+
+            for item in items:
+                if item["status"] == "pending" and str(item["patient_id"]) not in existing_patients:
+                    item["status"] = "invalid"
+                    item["error"] = "Patient not found"
+
+            prof_id = _get_professional_id(db, current_user.id) if current_user.role == "professional" else None
+
+        # 3. Inserción por bloques: un INSERT multi-fila por tabla y bloque
+        with timer.phase("db"):
+            valid_items = [item for item in items if item["status"] == "pending"]
+            for start in range(0, len(valid_items), BULK_CHUNK_SIZE):
+                chunk = valid_items[start:start + BULK_CHUNK_SIZE]
+                track_change_log(db)
+                pending_rows = []
+                for item in chunk:
+                    item["id"] = str(uuid.uuid4())
+                    pending_rows.extend(_build_record_rows(item["id"], item["patient_id"], item["model_dump"], professional_id=prof_id))
 
-        for field_name, field_value in model_dump.items():
-            if field_name == "medical_record_signatures": 
-                continue 
-            
-            if field_name == "medical_record_laboral_signatures":
-                continue
+                try:
+                    insert_pending_rows(db, pending_rows)
+                    db.commit()
+                    for item in chunk:
+                        item["status"] = "created"
+                except Exception as e:
+                    db.rollback()
+                    print(f"Bulk chunk failed, retrying item by item: {e}")
+                    # Reintento individual para aislar el/los registros con error
+                    for item in chunk:
+                        try:
+                            track_change_log(db)
+                            insert_pending_rows(db, _build_record_rows(item["id"], item["patient_id"], item["model_dump"], professional_id=prof_id))
+                            db.commit()
+                            item["status"] = "created"
+                        except Exception as item_error:
+                            db.rollback()
+                            item["status"] = "failed"
+                            item["error"] = str(item_error)
+                            item.pop("id", None)
 
-            
-            if field_name == "medical_record_data":
-                continue # Already handled
-                
-            if field_name == "medical_record_data_img":
-                # Handle dependency
-                if field_value and mr_data_id:
-                     field_value["medical_record_data_id"] = mr_data_id
-                     # Remove medical_record_id if Pydantic added it (it shouldn't have it in model? check model)
-                     # Model: MedicalRecordDataImg(id, medical_record_data_id, url)
-                     # It does NOT have medical_record_id. Good.
-                if field_value:
-                     insert_sub_table(field_name, field_value, inject_medical_record_id=False)
-                continue
+    finally:
+        db.close()
 
-            if field_value:
-                 try:
-                     insert_sub_table(field_name, field_value)
-                 except Exception as e:
-                     raise e
-
-        # 6. Insert Signature
-        # Logic: 
-        # - If file provided -> Create new signature entry with URL.
-        # - If JSON `medical_record_signatures` provided -> Use it? 
-        # - Merge them?
-        # The user said "menos la que dice medical_records_signature que no solo aparece en el JSON si no que pide una imagen".
-        # This implies we should merge.
-        
-        sig_data = model_dump.get("medical_record_signatures", {}) or {}
-        if signature_url:
-            sig_data["url"] = signature_url
-        
-        if sig_data or signature_url: # Only insert if we have something
-            sig_data["id"] = str(uuid.uuid4())
-            sig_data["medical_record_id"] = record_id
-            sig_data["created_at"] = fecha_medico_evaluador
-            
-            # Get professional ID
-            prof_id = None
-            if current_user.role == "professional":
-                prof_id = _get_professional_id(db, current_user.id)
-            if prof_id:
-                sig_data["professional_id"] = prof_id
-            
-            # If professional_id was in JSON, it takes precedence? Or ours? 
-            # I'll let the JSON override if present, otherwise use Auth.
-            
-            columns = list(sig_data.keys())
-            values_placeholders = [f":{col}" for col in columns]
-            query = f"""
-                INSERT INTO medical_record_signatures ({', '.join(columns)})
-                VALUES ({', '.join(values_placeholders)})
-            """
-            db.execute(text(query), sig_data)
-
-        # 7. Insert Laboral Signature
-        lab_sig_data = model_dump.get("medical_record_laboral_signatures", {}) or {}
-        if laboral_signature_url:
-             lab_sig_data["url"] = laboral_signature_url
-        
-        if lab_sig_data or laboral_signature_url:
-            lab_sig_data["id"] = str(uuid.uuid4())
-            lab_sig_data["medical_record_id"] = record_id
-            lab_sig_data["created_at"] = fecha_medico_laboral # Use the laboral date
-            
-            # Get professional ID
-            prof_id = None
-            if current_user.role == "professional":
-                prof_id = _get_professional_id(db, current_user.id)
-            if prof_id:
-                 lab_sig_data["professional_id"] = prof_id
-            
-            columns = list(lab_sig_data.keys())
-            values_placeholders = [f":{col}" for col in columns]
-            query = f"""
-                INSERT INTO medical_record_laboral_signatures ({', '.join(columns)})
-                VALUES ({', '.join(values_placeholders)})
-            """
-            db.execute(text(query), lab_sig_data)
-
-        # 8. Insert Patient Signature
-        pat_sig_data = model_dump.get("medical_record_patient_signatures", {}) or {}
-        if patient_signature_url:
-            pat_sig_data["url"] = patient_signature_url
-        
-        if pat_sig_data or patient_signature_url:
-            pat_sig_data["id"] = str(uuid.uuid4())
-            pat_sig_data["medical_record_id"] = record_id
-            pat_sig_data["created_at"] = fecha_paciente # Use the patient date
-            
-            pat_sig_data["patient_id"] = patient_id
-            
-            columns = list(pat_sig_data.keys())
-            values_placeholders = [f":{col}" for col in columns]
-            query = f"""
-                INSERT INTO medical_record_patient_signatures ({', '.join(columns)})
-                VALUES ({', '.join(values_placeholders)})
-            """
-            db.execute(text(query), pat_sig_data)
-
-        # 9. Insert Responsable Signature
-        resp_sig_data = model_dump.get("medical_record_medical_responsable_signatures", {}) or {}
-        if responsable_signature_url:
-            resp_sig_data["url"] = responsable_signature_url
-        
-        if resp_sig_data or responsable_signature_url:
-            resp_sig_data["id"] = str(uuid.uuid4())
-            resp_sig_data["medical_record_id"] = record_id
-            resp_sig_data["created_at"] = fecha_responsable # Use the responsable date
-            
-            # Get professional ID
-            prof_id = None
-            if current_user.role == "professional":
-                prof_id = _get_professional_id(db, current_user.id)
-            if prof_id:
-                resp_sig_data["professional_id"] = prof_id
-            
-            columns = list(resp_sig_data.keys())
-            values_placeholders = [f":{col}" for col in columns]
-            query = f"""
-                INSERT INTO medical_record_medical_responsable_signatures ({', '.join(columns)})
-                VALUES ({', '.join(values_placeholders)})
-            """
-            db.execute(text(query), resp_sig_data)
+    manifest = []
+    for item in items:
+        entry = {"index": item["index"], "line": item["line"], "patient_id": item["patient_id"], "status": item["status"]}
+        if "id" in item:
+            entry["id"] = item["id"]
+        if "error" in item:
+            entry["error"] = item["error"]
+        manifest.append(entry)
+
+    response.headers["Server-Timing"] = timer.server_timing()
+    print(f"bulk_create_medical_records ({len(items)} items): {timer.server_timing()}")
+    return {
+        "total": len(items),
+        "created": sum(1 for item in items if item["status"] == "created"),
+        "invalid": sum(1 for item in items if item["status"] == "invalid"),
+        "failed": sum(1 for item in items if item["status"] == "failed"),
+        "items": manifest,
+    }
+
+
+@router.post("/professional-signature", response_model=dict)
+async def register_professional_signature(
+    file: UploadFile = File(...),
+    is_default: bool = Form(True),
+    current_user: UserSchema = Depends(require_roles("professional"))
+):
+    """
+    Registra la firma del profesional logueado para reutilizarla en las historias clínicas.
+    Si la misma imagen ya estaba registrada se reutiliza (dedupe por SHA-256).
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
 
+    try:
+        prof_id = _get_professional_id(db, current_user.id)
+        if not prof_id:
+            raise HTTPException(status_code=404, detail="Professional not found")
+
+        batch = UploadBatch(db)
+        resolved = await _resolve_profile_signatures(db, batch, prof_id, {"medical_record_signatures": file})
+        signature_id = resolved["medical_record_signatures"]["professional_signature_id"]
+
+        try:
+            await batch.persist()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
+
+        if is_default:
+            db.execute(
+                text("UPDATE professional_signatures SET is_default = (id = :sid) WHERE professional_id = :pid"),
+                {"sid": signature_id, "pid": prof_id}
+            )
         db.commit()
-        return {"id": record_id, "detail": "Medical record created successfully"}
 
+        return {"id": signature_id, "url": resolved["medical_record_signatures"]["url"], "is_default": is_default}
+
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error creating medical record: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+@router.get("/professional-signature", response_model=List[dict])
+async def list_professional_signatures(
+    current_user: UserSchema = Depends(require_roles("professional"))
+):
+    """
+    Firmas registradas del profesional logueado (la default primero).
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        rows = db.execute(
+            text("""
+                SELECT ps.id, ps.url, ps.is_default, ps.created_at
+                FROM professional_signatures ps
+                JOIN professionals p ON p.id = ps.professional_id
+                WHERE p.user_id = :uid
+                ORDER BY ps.is_default DESC, ps.created_at DESC
+            """),
+            {"uid": current_user.id}
+        ).mappings().all()
+        return [{**row, "is_default": bool(row["is_default"])} for row in rows]
+    finally:
+        db.close()
+
+
+@router.get("/search", response_model=dict)
+async def search_medical_records(
+    q: str,
+    company_id: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    page: int = 1,
+    page_size: int = SEARCH_PAGE_SIZE,
+    current_user: UserSchema = Depends(require_roles("admin", "secretary", "professional", "company"))
+):
+    """
+    Búsqueda de texto libre en las observaciones de todas las secciones (FULLTEXT).
+    - **q**: texto a buscar; los resultados vienen ordenados por relevancia.
+    - **company_id** / **patient_id**: acotan la búsqueda. Una empresa solo ve a sus pacientes.
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q is required")
+    if page < 1 or not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page must be >= 1 and page_size between 1 and {SEARCH_MAX_PAGE_SIZE}")
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        company_id = _company_scope(db, current_user, company_id)
+
+        query = """
+            SELECT s.medical_record_id, s.section, s.content, mr.patient_id,
+                   MATCH(s.content) AGAINST (:q IN NATURAL LANGUAGE MODE) AS score
+            FROM medical_record_search s
+            JOIN medical_record mr ON mr.id = s.medical_record_id
+            JOIN patients p ON p.id = mr.patient_id
+            WHERE MATCH(s.content) AGAINST (:q IN NATURAL LANGUAGE MODE)
+        """
+        params = {"q": q, "limit": page_size + 1, "offset": (page - 1) * page_size}
+        if company_id:
+            query += " AND p.company_id = :cid"
+            params["cid"] = company_id
+        if patient_id:
+            query += " AND mr.patient_id = :pid"
+            params["pid"] = patient_id
+        query += " ORDER BY score DESC, s.medical_record_id, s.section LIMIT :limit OFFSET :offset"
+
+        rows = db.execute(text(query), params).mappings().all()
+        hits = [
+            {
+                "medical_record_id": str(row["medical_record_id"]),
+                "patient_id": str(row["patient_id"]),
+                "section": row["section"],
+                "score": float(row["score"]),
+                "snippet": _search_snippet(row["content"], q),
+            }
+            for row in rows[:page_size]
+        ]
+        return {"hits": hits, "page": page, "page_size": page_size, "has_more": len(rows) > page_size}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+@router.get("/findings", response_model=dict)
+async def list_findings(current_user: UserSchema = Depends(require_active_user)):
+    """Hallazgos booleanos disponibles para /findings/query, por sección."""
+    return {"findings": FINDINGS_LAYOUT.fields}
+
+
+@router.post("/findings/query", response_model=dict)
+async def query_findings(
+    body: FindingsQueryRequest,
+    current_user: UserSchema = Depends(require_roles("admin", "secretary", "professional", "company"))
+):
+    """
+    Registros que cumplen un filtro sobre hallazgos booleanos, p.ej.
+    `{"and": ["caries", {"not": "medical_record_cardiovascular_exam.soplos"}]}`.
+    Se evalúa con operaciones vectorizadas sobre el índice bitmap en memoria del alcance
+    (empresa o todos). Una empresa solo consulta a sus propios pacientes.
+    """
+    started = time.perf_counter()
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        company_id = _company_scope(db, current_user, body.company_id)
+        index = _findings_index(db, company_id)
+        try:
+            mask = index.evaluate(body.filter)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        matches = np.flatnonzero(mask)
+        patients = {index.patient_ids[i] for i in matches}
+        return {
+            "count": int(matches.size),
+            "patients": len(patients),
+            "records": [
+                {"medical_record_id": index.record_ids[i], "patient_id": index.patient_ids[i]}
+                for i in matches[:body.limit]
+            ],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+    finally:
+        db.close()
+
+
+@router.get("/vitals/stats", response_model=dict)
+async def vitals_stats(
+    company_id: Optional[str] = None,
+    vitals: Optional[str] = None,
+    percentiles: Optional[str] = None,
+    bins: int = 10,
+    current_user: UserSchema = Depends(require_roles("admin", "secretary", "professional", "company"))
+):
+    """
+    Distribución de signos vitales (talla, peso, imc, saturacion, ta_min, ta_max,
+    freq_cardiaca, tension_arterial) de los registros del alcance: media, desvío,
+    percentiles, histograma y cantidad fuera del rango de referencia.
+    `vitals` y `percentiles` son listas separadas por coma.
+    """
+    started = time.perf_counter()
+    names = [v.strip() for v in vitals.split(",") if v.strip()] if vitals else VITAL_NAMES
+    unknown = [v for v in names if v not in VITAL_NAMES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown vitals: {', '.join(unknown)}")
+    try:
+        points = [float(p) for p in percentiles.split(",") if p.strip()] if percentiles else VITALS_DEFAULT_PERCENTILES
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be numbers")
+    if not points or any(p < 0 or p > 100 for p in points):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    if bins < 1 or bins > VITALS_MAX_BINS:
+        raise HTTPException(status_code=400, detail=f"bins must be between 1 and {VITALS_MAX_BINS}")
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        company_id = _company_scope(db, current_user, company_id)
+        store = _vitals_store(db, company_id)
+        return {
+            "records": int(np.count_nonzero(store.alive)),
+            "vitals": store.stats(names, points, bins),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+    finally:
+        db.close()
+
+
+@router.get("/changes", response_model=dict)
+async def get_medical_record_changes(
+    since: int = 0,
+    limit: int = CHANGES_PAGE_SIZE,
+    patient_id: Optional[str] = None,
+    current_user: UserSchema = Depends(require_roles("admin", "secretary", "professional"))
+):
+    """
+    Change feed de medical_records, en orden de escritura. Solo para personal: el feed
+    incluye los borrados, cuyo paciente ya no existe para acotarlo por empresa.
+    - **since**: cursor devuelto por la llamada anterior (`next_cursor`); 0 para empezar.
+    - **patient_id**: opcional, solo los cambios de ese paciente.
+    Cada cambio trae medical_record_id, version, operación (create / update / delete)
+    y las tablas tocadas cuando se conocen. Los cambios de los últimos
+    CHANGES_COMMIT_LAG_SECONDS aparecen en una llamada siguiente (ver utils.change_log):
+    las escrituras que tardan más de CHANGES_MAX_WRITE_SECONDS en hacer commit se
+    rechazan, así ningún cambio queda detrás del cursor.
+    """
+    if since < 0 or not 1 <= limit <= CHANGES_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"since must be >= 0 and limit between 1 and {CHANGES_MAX_PAGE_SIZE}")
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        query = """
+            SELECT seq, medical_record_id, patient_id, version, operation, tables, changed_at
+            FROM medical_record_changes
+            WHERE seq > :since AND seq <= :upto
+        """
+        params = {"since": since, "upto": _changes_watermark(db), "limit": limit + 1}
+        if patient_id:
+            query += " AND patient_id = :pid"
+            params["pid"] = patient_id
+        rows = db.execute(text(query + " ORDER BY seq LIMIT :limit"), params).mappings().all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        changes = [
+            {
+                "cursor": row["seq"],
+                "medical_record_id": str(row["medical_record_id"]),
+                "patient_id": str(row["patient_id"]),
+                "version": row["version"],
+                "operation": row["operation"],
+                "tables": json.loads(row["tables"]) if isinstance(row["tables"], str) else row["tables"],
+                "changed_at": row["changed_at"],
+            }
+            for row in rows
+        ]
+        return {
+            "changes": changes,
+            "next_cursor": changes[-1]["cursor"] if changes else since,
+            "has_more": has_more,
+        }
     finally:
         db.close()
 
@@ -483,8 +1360,14 @@ async def create_medical_record(
 @router.get("/patient/{patient_id}", response_model=List[MedicalRecordFullResponse])
 async def get_medical_records_by_patient(
     patient_id: str,
+    embed: Optional[str] = None,
     current_user: UserSchema = Depends(require_active_user)
 ):
+    """
+    Todos los medical_records del paciente.
+    - **embed**: `signatures` y/o `data_img`; incluye las imágenes chicas como data URI.
+    """
+    embed_kinds = _parse_embed(embed)
     db = getConnectionForLogin()
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
@@ -498,186 +1381,170 @@ async def get_medical_records_by_patient(
         ).mappings().all()
         
 
-        response_list = []
-        
-        table_names = [
-            "medical_record_bucodental_exam", "medical_record_cardiovascular_exam", "medical_record_clinical_exam",
-            "medical_record_data", "medical_record_data_img", "medical_record_derivations", "medical_record_digestive_exam",
-            "medical_record_evaluation_type", "medical_record_family_history", "medical_record_genitourinario_exam",
-            "medical_record_habits", "medical_record_head_exam", "medical_record_immunizations", "medical_record_laboral_contacts",
-            "medical_record_laboral_exam", "medical_record_laboral_history", "medical_record_neuro_clinical_exam",
-            "medical_record_oftalmologico_exam", "medical_record_orl_exam", "medical_record_osteoarticular_exam",
-            "medical_record_personal_history", "medical_record_previous_problems", "medical_record_psychiatric_clinical_exam",
-            "medical_record_recomendations", "medical_record_respiratorio_exam", "medical_record_signatures",
-            "medical_record_skin_exam", "medical_record_studies", "medical_record_surgerys", "medical_record_laboral_signatures", "medical_record_cuestionario_riesgos", "medical_record_ddjj", "medical_record_neuro_medical_exam", "medical_record_oftalmologico_medical_exam", "medical_record_patient_signatures", "medical_record_medical_responsable_signatures"
-        ]
-        
-        for rec in records:
-            full_rec = dict(rec) # Start with id, patient_id
-            
-            # For each sub-table, fetch the row
-            # For each sub-table, fetch the row
-            print(f"Fetching sub-tables for medical_record_id: {rec['id']}") # DEBUG log
-            
-            for table in table_names:
-                if table == "medical_record_data_img":
-                    continue # handled with data
-                
-                # Ensure record_id is string
-                rec_id_str = str(rec["id"])
-                
-                try:
-                    row = db.execute(
-                        text(f"SELECT * FROM {table} WHERE medical_record_id = :rid LIMIT 1"),
-                        {"rid": rec_id_str}
-                    ).mappings().first()
-                    
-                    if row:
-                        row_dict = dict(row)
-                        # Ensure ID is string
-                        if "id" in row_dict:
-                           row_dict["id"] = str(row_dict["id"])
-                        full_rec[table] = row_dict
-                    else:
-                        print(f"Table {table}: No record found for medical_record_id={rec_id_str}") # DEBUG log
-                except Exception as e:
-                    print(f"Error fetching table {table} for medical_record_id={rec_id_str}: {e}") # DEBUG log
+        response_list = [_fetch_record_sections(db, rec) for rec in records]
+        if embed_kinds:
+            await _embed_images(response_list, embed_kinds)
             
-            # Handle medical_record_data_img
-            if "medical_record_data" in full_rec and full_rec["medical_record_data"]:
-                data_dict = full_rec["medical_record_data"]
-                # Ensure existing data ID is string
-                data_id = str(data_dict["id"])
-                
-                print(f"Fetching image for data_id: {data_id}") # DEBUG log
-                
-                try:
-                    img_row = db.execute(
-                        text("SELECT * FROM medical_record_data_img WHERE medical_record_data_id = :did LIMIT 1"),
-                        {"did": data_id}
-                    ).mappings().first()
-                    
-                    if img_row:
-                        img_dict = dict(img_row)
-                        if "id" in img_dict:
-                            img_dict["id"] = str(img_dict["id"])
-                        full_rec["medical_record_data_img"] = img_dict
-                    else:
-                        print(f"No image found for medical_record_data_id={data_id}")
-                except Exception as e:
-                    print(f"Error fetching image for data_id={data_id}: {e}")
-                    
-            response_list.append(full_rec)
-            
-        return response_list
+        return _json_response(MEDICAL_RECORD_LIST_ADAPTER, response_list)
 
     finally:
         db.close()
 
-@router.delete("/{record_id}")
-async def delete_medical_record(
+@router.get("/{record_id}", response_model=MedicalRecordFullResponse)
+async def get_medical_record(
     record_id: str,
-    current_user: UserSchema = Depends(require_roles("admin", "professional"))
+    if_none_match: Optional[str] = Header(None),
+    embed: Optional[str] = None,
+    current_user: UserSchema = Depends(require_active_user)
 ):
+    """
+    Devuelve un medical_record completo.
+    - **ETag**: derivado de la version del registro; si coincide con `If-None-Match`
+      se responde 304 sin consultar las sub-tablas.
+    - **embed**: `signatures` y/o `data_img`; incluye las imágenes chicas como data URI
+      (`data_uri`) para renderizar el registro en un solo request.
+    """
+    embed_kinds = _parse_embed(embed)
     db = getConnectionForLogin()
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
-        
+
     try:
-        # ---------------------------------------------------------
-        # 1. Recuperar info de archivos ANTES de borrar la DB
-        # ---------------------------------------------------------
-        
-        # A. Buscar firmas (Evaluador y Laboral)
-        signatures = db.execute(
-            text("SELECT url FROM medical_record_signatures WHERE medical_record_id = :rid"), 
+        rec = db.execute(
+            text("SELECT id, patient_id, version FROM medical_record WHERE id = :rid"),
             {"rid": record_id}
-        ).mappings().all()
-        
-        laboral_signatures = db.execute(
-            text("SELECT url FROM medical_record_laboral_signatures WHERE medical_record_id = :rid"), 
-            {"rid": record_id}
-        ).mappings().all()
+        ).mappings().first()
 
-        patient_signatures = db.execute(
-            text("SELECT url FROM medical_record_patient_signatures WHERE medical_record_id = :rid"), 
-            {"rid": record_id}
-        ).mappings().all()
+        if not rec:
+            raise HTTPException(status_code=404, detail="Medical record not found")
 
-        responsable_signatures = db.execute(
-            text("SELECT url FROM medical_record_medical_responsable_signatures WHERE medical_record_id = :rid"), 
-            {"rid": record_id}
-        ).mappings().all()
+        etag = _record_etag(str(rec["id"]), rec["version"], "+".join(embed_kinds))
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
 
-        # B. Buscar Data Images (Es mas complejo porque requiere join o subquery)
-        # Primero buscamos los IDs de medical_record_data asociados a este record
-        data_rows = db.execute(
-            text("SELECT id FROM medical_record_data WHERE medical_record_id = :rid"), 
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        full_rec = _fetch_record_sections(db, rec)
+        if embed_kinds:
+            await _embed_images([full_rec], embed_kinds)
+        return _json_response(MEDICAL_RECORD_ADAPTER, full_rec, headers)
+
+    finally:
+        db.close()
+
+def _open_pdf(path: Path):
+    """Archivo del PDF cacheado abierto para lectura, o None si no existe."""
+    try:
+        return open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+def _iter_pdf(pdf_file):
+    """Lee el PDF por bloques (Starlette lo itera en su threadpool) y cierra el archivo."""
+    try:
+        while chunk := pdf_file.read(PDF_STREAM_CHUNK_BYTES):
+            yield chunk
+    finally:
+        pdf_file.close()
+
+@router.get("/{record_id}/pdf")
+async def get_medical_record_pdf(
+    record_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserSchema = Depends(require_active_user)
+):
+    """
+    PDF del registro completo (secciones, data image y firmas).
+    Se renderiza en un pool de procesos y se cachea en disco por versión:
+    las descargas repetidas se sirven directo del archivo.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        rec = db.execute(
+            text("SELECT id, patient_id, version FROM medical_record WHERE id = :rid"),
             {"rid": record_id}
-        ).mappings().all()
-        
-        data_images_urls = []
-        for dr in data_rows:
-            imgs = db.execute(
-                text("SELECT url FROM medical_record_data_img WHERE medical_record_data_id = :did"),
-                {"did": dr["id"]}
-            ).mappings().all()
-            for img in imgs:
-                data_images_urls.append(img["url"])
-
-        # ---------------------------------------------------------
-        # 2. Eliminar archivos Físicos (Usando el helper)
-        # ---------------------------------------------------------
-        for sig in signatures:
-            delete_physical_file(sig["url"], SIGNATURES_DIR)
-            
-        for l_sig in laboral_signatures:
-            delete_physical_file(l_sig["url"], SIGNATURES_DIR)
-        
-        for p_sig in patient_signatures:
-            delete_physical_file(p_sig["url"], SIGNATURES_DIR)
-        
-        for r_sig in responsable_signatures:
-            delete_physical_file(r_sig["url"], SIGNATURES_DIR)
-            
-        for img_url in data_images_urls:
-            delete_physical_file(img_url, DATA_IMAGES_DIR)
+        ).mappings().first()
+        if not rec:
+            raise HTTPException(status_code=404, detail="Medical record not found")
 
-        # ---------------------------------------------------------
-        # 3. Borrado en Base de Datos (Cascada Manual)
-        # ---------------------------------------------------------
+        etag = _record_etag(str(rec["id"]), rec["version"], "pdf")
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-        # A. Primero borrar medical_record_data_img (Nivel más profundo)
-        # Usamos los data_rows que recuperamos arriba para ser eficientes
-        for dr in data_rows: 
-            db.execute(text("DELETE FROM medical_record_data_img WHERE medical_record_data_id = :did"), {"did": dr["id"]})
-            
-        # B. Borrar medical_record_data
-        db.execute(text("DELETE FROM medical_record_data WHERE medical_record_id = :rid"), {"rid": record_id})
-        
-        # C. Borrar el resto de tablas hijas
-        table_names = [
-            "medical_record_bucodental_exam", "medical_record_cardiovascular_exam", "medical_record_clinical_exam",
-            "medical_record_derivations", "medical_record_digestive_exam",
-            "medical_record_evaluation_type", "medical_record_family_history", "medical_record_genitourinario_exam",
-            "medical_record_habits", "medical_record_head_exam", "medical_record_immunizations", "medical_record_laboral_contacts",
-            "medical_record_laboral_exam", "medical_record_laboral_history", "medical_record_neuro_clinical_exam",
-            "medical_record_oftalmologico_exam", "medical_record_orl_exam", "medical_record_osteoarticular_exam",
-            "medical_record_personal_history", "medical_record_previous_problems", "medical_record_psychiatric_clinical_exam",
-            "medical_record_recomendations", "medical_record_respiratorio_exam", "medical_record_signatures",
-            "medical_record_skin_exam", "medical_record_studies", "medical_record_surgerys", "medical_record_laboral_signatures",
-            "medical_record_cuestionario_riesgos", "medical_record_ddjj", "medical_record_neuro_medical_exam", "medical_record_oftalmologico_medical_exam", "medical_record_patient_signatures", "medical_record_medical_responsable_signatures"
-        ]
-        
-        for table in table_names:
-            db.execute(text(f"DELETE FROM {table} WHERE medical_record_id = :rid"), {"rid": record_id})
-            
-        # D. Finalmente, borrar el registro padre
-        db.execute(text("DELETE FROM medical_record WHERE id = :rid"), {"rid": record_id})
+        # Se abre el PDF cacheado ya: un delete concurrente (remove_cached_pdfs) puede borrar
+        # el archivo, pero el descriptor abierto se sigue leyendo. Si no está, se leen las
+        # secciones con la sesión abierta para renderizarlo.
+        pdf_file = _open_pdf(pdf_cache_path(str(rec["id"]), rec["version"]))
+        full_rec = None if pdf_file is not None else _fetch_record_sections(db, rec)
+    finally:
+        db.close()
+
+    if pdf_file is None:
+        images = {}
+        for table in SIGNATURE_TABLES + ["medical_record_data_img"]:
+            row = full_rec.get(table)
+            base_dir = DATA_IMAGES_DIR if table == "medical_record_data_img" else SIGNATURES_DIR
+            local_path = resolve_path(base_dir, row["url"]) if row and row.get("url") else None
+            if local_path and local_path.exists():
+                images[table] = str(local_path)
+        try:
+            pdf_path = await get_or_render_pdf(full_rec, images, str(rec["id"]), rec["version"])
+        except Exception as e:
+            print(f"Error rendering PDF for medical_record_id={record_id}: {e}")
+            raise HTTPException(status_code=500, detail="Error rendering PDF")
+        pdf_file = _open_pdf(pdf_path)
+        if pdf_file is None:
+            # Se borró entre el render y la apertura: el registro se eliminó mientras tanto
+            raise HTTPException(status_code=404, detail="Medical record not found")
+
+    headers["Content-Length"] = str(os.fstat(pdf_file.fileno()).st_size)
+    headers["Content-Disposition"] = f'attachment; filename="medical_record_{record_id}.pdf"'
+    return StreamingResponse(_iter_pdf(pdf_file), media_type="application/pdf", headers=headers)
+
+@router.delete("/{record_id}")
+async def delete_medical_record(
+    record_id: str,
+    background_tasks: BackgroundTasks,
+    current_user: UserSchema = Depends(require_roles("admin", "professional"))
+):
+    """
+    Borra el registro y todas sus secciones. Las sub-tablas se borran por
+    FK ON DELETE CASCADE (migración 003); los archivos se borran después del commit.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
         
+    try:
+        # 1. Archivos del registro (firmas + data images) en una sola consulta
+        file_rows = db.execute(text(RECORD_FILES_SQL), {"rid": record_id}).mappings().all()
+
+        # Change log antes del DELETE (necesita patient_id / version del registro)
+        _log_record_change(db, record_id, "delete")
+
+        # 2. Borrado del padre: la cascada de la DB borra las sub-tablas
+        result = db.execute(text("DELETE FROM medical_record WHERE id = :rid"), {"rid": record_id})
+        if result.rowcount == 0:
+            raise HTTPException(status_code=404, detail="Medical record not found")
+
         db.commit()
+
+        # 3. Archivos físicos: solo con la transacción confirmada, fuera del request
+        paths = [
+            _local_file_path(row["url"], DATA_IMAGES_DIR if row["kind"] == "data_img" else SIGNATURES_DIR)
+            for row in file_rows
+        ]
+        background_tasks.add_task(remove_files, [p for p in paths if p])
+        background_tasks.add_task(remove_cached_pdfs, [record_id])
         return {"detail": "Record and associated files deleted successfully"}
-        
+
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -698,6 +1565,7 @@ async def update_medical_record(
     fecha_paciente: Optional[date] = Form(None),
     firma_responsable: UploadFile = File(None),
     fecha_responsable: Optional[date] = Form(None),
+    usar_firma_registrada: bool = Form(False),
     current_user: UserSchema = Depends(require_roles("professional", "admin"))
 ):
     request_model = data
@@ -711,8 +1579,8 @@ async def update_medical_record(
         if not curr:
             raise HTTPException(status_code=404, detail="Medical record not found")
 
-        # Update parent patient_id (igual que tenias)
-        db.execute(text("UPDATE medical_record SET patient_id = :pid WHERE id = :rid"), {"pid": patient_id, "rid": record_id})
+        # Update parent patient_id y version (el ETag cambia con cada update)
+        db.execute(text("UPDATE medical_record SET patient_id = :pid, version = version + 1 WHERE id = :rid"), {"pid": patient_id, "rid": record_id})
         
         # -------------------------------------------------
         # Lógica de Sub-tablas (Tu loop original)
@@ -785,9 +1653,41 @@ async def update_medical_record(
                 mr_data_id = existing_data_row["id"]
 
         # -------------------------------------------------
-        # 1. Update DATA IMAGE (Lo que faltaba)
+        # Archivos nuevos: se escriben todos en paralelo antes de tocar las
+        # tablas; si la transacción hace rollback se borran solos
         # -------------------------------------------------
+        batch = UploadBatch(db)
+
+        data_img_url = None
         if data_img and mr_data_id:
+            _, data_img_url = await _stage_upload(batch, data_img, DATA_IMAGES_DIR, "data_", DATA_IMAGES_DOMAIN_URL, DATA_IMAGE_PROFILE)
+
+        signature_slots = {
+            "medical_record_signatures": (firma_medico_evaluador, fecha_medico_evaluador),
+            "medical_record_laboral_signatures": (firma_medico_laboral, fecha_medico_laboral),
+            "medical_record_patient_signatures": (firma_paciente, fecha_paciente),
+            "medical_record_medical_responsable_signatures": (firma_responsable, fecha_responsable),
+        }
+        # Firmas del profesional: se reutiliza la registrada si el contenido coincide
+        prof_id = _get_professional_id(db, current_user.id) if current_user.role == "professional" else None
+        profile_signatures = await _resolve_profile_signatures(
+            db, batch, prof_id, {t: upload for t, (upload, _) in signature_slots.items()}, usar_firma_registrada
+        )
+        signature_urls: Dict[str, str] = {t: sig["url"] for t, sig in profile_signatures.items()}
+        for table_name, (upload, _) in signature_slots.items():
+            if upload and table_name not in signature_urls:
+                prefix, _ = SIGNATURE_FILES[table_name]
+                _, signature_urls[table_name] = await _stage_upload(batch, upload, SIGNATURES_DIR, prefix, DOMAIN_URL, SIGNATURE_IMAGE_PROFILE)
+
+        try:
+            await batch.persist()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
+
+        # -------------------------------------------------
+        # 1. Update DATA IMAGE
+        # -------------------------------------------------
+        if data_img_url:
             try:
                 # A. Buscar imagen vieja
                 existing_img = db.execute(
@@ -795,25 +1695,15 @@ async def update_medical_record(
                     {"did": mr_data_id}
                 ).mappings().first()
 
-                # B. Borrar imagen vieja fisica y registro
+                # B. Borrar registro viejo (el archivo se borra después del commit)
                 if existing_img:
-                    delete_physical_file(existing_img["url"], DATA_IMAGES_DIR)
+                    batch.delete_after_commit(_local_file_path(existing_img["url"], DATA_IMAGES_DIR))
                     db.execute(text("DELETE FROM medical_record_data_img WHERE id = :id"), {"id": existing_img["id"]})
 
-                # C. Guardar imagen nueva
-                file_ext = get_file_extension(data_img)
-                filename = f"data_{uuid.uuid4()}{file_ext}"
-                file_path = DATA_IMAGES_DIR / filename
-                
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(data_img.file, buffer)
-                
-                new_url = f"{DATA_IMAGES_DOMAIN_URL.rstrip('/')}/{filename}"
-
-                # D. Insertar nuevo registro
+                # C. Insertar nuevo registro
                 db.execute(
                     text("INSERT INTO medical_record_data_img (id, medical_record_data_id, url) VALUES (:id, :did, :url)"),
-                    {"id": str(uuid.uuid4()), "did": mr_data_id, "url": new_url}
+                    {"id": str(uuid.uuid4()), "did": mr_data_id, "url": data_img_url}
                 )
 
             except Exception as e:
@@ -821,156 +1711,252 @@ async def update_medical_record(
                 # No lanzamos error 500 para no romper todo el update, pero logueamos.
 
         # -------------------------------------------------
-        # 2. Update FIRMA EVALUADOR (Refactorizado)
+        # 2. Update FIRMAS (evaluador, laboral, paciente, responsable)
         # -------------------------------------------------
-        if firma_medico_evaluador:
+        for table_name, new_url in signature_urls.items():
+            fecha = signature_slots[table_name][1]
+            _, label = SIGNATURE_FILES[table_name]
             try:
                 # A. Buscar vieja
-                existing_sig = db.execute(text("SELECT id, url FROM medical_record_signatures WHERE medical_record_id = :rid"), {"rid": record_id}).mappings().first()
-                
-                # B. Borrar vieja
+                existing_sig = db.execute(text(f"SELECT id, url FROM {table_name} WHERE medical_record_id = :rid"), {"rid": record_id}).mappings().first()
+
+                # B. Borrar registro viejo (el archivo se borra después del commit)
                 if existing_sig:
-                    delete_physical_file(existing_sig["url"], SIGNATURES_DIR) # Usando Helper
-                    db.execute(text("DELETE FROM medical_record_signatures WHERE id = :id"), {"id": existing_sig["id"]})
-
-                # C. Guardar nueva
-                file_ext = get_file_extension(firma_medico_evaluador)
-                filename = f"sig_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_medico_evaluador.file, buffer)
-                
-                new_url = f"{DOMAIN_URL.rstrip('/')}/{filename}"
-                prof_id = _get_professional_id(db, current_user.id)
-
-                # D. Insertar
+                    batch.delete_after_commit(_local_file_path(existing_sig["url"], SIGNATURES_DIR))
+                    db.execute(text(f"DELETE FROM {table_name} WHERE id = :id"), {"id": existing_sig["id"]})
+
+                # C. Insertar
                 sig_data = {
                     "id": str(uuid.uuid4()), "medical_record_id": record_id, "url": new_url,
-                    "professional_id": prof_id,
-                    "created_at": fecha_medico_evaluador if fecha_medico_evaluador else datetime.utcnow()
+                    "created_at": fecha if fecha else datetime.utcnow()
                 }
-                # ... Query de insert (igual que tenías) ...
+                if table_name == "medical_record_patient_signatures":
+                    sig_data["patient_id"] = patient_id
+                else:
+                    if prof_id is None:
+                        prof_id = _get_professional_id(db, current_user.id)
+                    sig_data["professional_id"] = prof_id
+                if table_name in profile_signatures:
+                    sig_data["professional_signature_id"] = profile_signatures[table_name]["professional_signature_id"]
+
                 keys = list(sig_data.keys())
                 vals = [f":{k}" for k in keys]
-                db.execute(text(f"INSERT INTO medical_record_signatures ({', '.join(keys)}) VALUES ({', '.join(vals)})"), sig_data)
+                db.execute(text(f"INSERT INTO {table_name} ({', '.join(keys)}) VALUES ({', '.join(vals)})"), sig_data)
 
             except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error signature update: {e}")
+                raise HTTPException(status_code=500, detail=f"Error {label} update: {e}")
 
-        # -------------------------------------------------
-        # 3. Update FIRMA LABORAL (Refactorizado)
-        # -------------------------------------------------
-        if firma_medico_laboral:
-            try:
-                # A. Buscar vieja
-                existing_lab = db.execute(text("SELECT id, url FROM medical_record_laboral_signatures WHERE medical_record_id = :rid"), {"rid": record_id}).mappings().first()
-                
-                # B. Borrar vieja
-                if existing_lab:
-                    delete_physical_file(existing_lab["url"], SIGNATURES_DIR) # Usando Helper
-                    db.execute(text("DELETE FROM medical_record_laboral_signatures WHERE id = :id"), {"id": existing_lab["id"]})
-
-                # C. Guardar nueva
-                file_ext = get_file_extension(firma_medico_laboral)
-                filename = f"sig_lab_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_medico_laboral.file, buffer)
-
-                new_url = f"{DOMAIN_URL.rstrip('/')}/{filename}"
-                prof_id = _get_professional_id(db, current_user.id)
-
-                # D. Insertar
-                lab_data = {
-                    "id": str(uuid.uuid4()), "medical_record_id": record_id, "url": new_url,
-                    "professional_id": prof_id,
-                    "created_at": fecha_medico_laboral if fecha_medico_laboral else datetime.utcnow()
-                }
-                # ... Query de insert ...
-                keys = list(lab_data.keys())
-                vals = [f":{k}" for k in keys]
-                db.execute(text(f"INSERT INTO medical_record_laboral_signatures ({', '.join(keys)}) VALUES ({', '.join(vals)})"), lab_data)
+        touched = set(model_dump) | set(signature_urls) | ({"medical_record_data_img"} if data_img_url else set())
+        _refresh_search_index(db, record_id, model_dump)
+        _refresh_findings(db, record_id, model_dump)
+        _log_record_change(db, record_id, "update", list(touched))
 
-            except Exception as e:
-                 raise HTTPException(status_code=500, detail=f"Error laboral signature update: {e}")
+        db.commit()
+        return {"detail": "Updated successfully with file management"}
 
-        # -------------------------------------------------
-        # 4. Update FIRMA PACIENTE (Refactorizado)
-        # -------------------------------------------------
-        if firma_paciente:
-            try:
-                # A. Buscar vieja
-                existing_pat = db.execute(text("SELECT id, url FROM medical_record_patient_signatures WHERE medical_record_id = :rid"), {"rid": record_id}).mappings().first()
-                
-                # B. Borrar vieja
-                if existing_pat:
-                    delete_physical_file(existing_pat["url"], SIGNATURES_DIR) # Usando Helper
-                    db.execute(text("DELETE FROM medical_record_patient_signatures WHERE id = :id"), {"id": existing_pat["id"]})
-
-                # C. Guardar nueva
-                file_ext = get_file_extension(firma_paciente)
-                filename = f"sig_pat_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_paciente.file, buffer)
-
-                new_url = f"{DOMAIN_URL.rstrip('/')}/{filename}"
-                prof_id = _get_professional_id(db, current_user.id)
-
-                # D. Insertar
-                pat_data = {
-                    "id": str(uuid.uuid4()), "medical_record_id": record_id, "url": new_url,
-                    "patient_id": patient_id,
-                    "created_at": fecha_paciente if fecha_paciente else datetime.utcnow()
-                }
-                # ... Query de insert ...
-                keys = list(pat_data.keys())
-                vals = [f":{k}" for k in keys]
-                db.execute(text(f"INSERT INTO medical_record_patient_signatures ({', '.join(keys)}) VALUES ({', '.join(vals)})"), pat_data)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
 
-            except Exception as e:
-                 raise HTTPException(status_code=500, detail=f"Error paciente signature update: {e}")
+    finally:
+        db.close()
 
-        # -------------------------------------------------
-        # 5. Update FIRMA RESPONSABLE (Refactorizado)
-        # -------------------------------------------------
-        if firma_responsable:
-            try:
-                # A. Buscar vieja
-                existing_resp = db.execute(text("SELECT id, url FROM medical_record_medical_responsable_signatures WHERE medical_record_id = :rid"), {"rid": record_id}).mappings().first()
-                
-                # B. Borrar vieja
-                if existing_resp:
-                    delete_physical_file(existing_resp["url"], SIGNATURES_DIR) # Usando Helper
-                    db.execute(text("DELETE FROM medical_record_medical_responsable_signatures WHERE id = :id"), {"id": existing_resp["id"]})
-
-                # C. Guardar nueva
-                file_ext = get_file_extension(firma_responsable)
-                filename = f"sig_resp_{uuid.uuid4()}{file_ext}"
-                file_path = SIGNATURES_DIR / filename
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(firma_responsable.file, buffer)
-
-                new_url = f"{DOMAIN_URL.rstrip('/')}/{filename}"
-                prof_id = _get_professional_id(db, current_user.id)
-
-                # D. Insertar
-                resp_data = {
-                    "id": str(uuid.uuid4()), "medical_record_id": record_id, "url": new_url,
-                    "professional_id": prof_id,
-                    "created_at": fecha_responsable if fecha_responsable else datetime.utcnow()
-                }
-                # ... Query de insert ...
-                keys = list(resp_data.keys())
-                vals = [f":{k}" for k in keys]
-                db.execute(text(f"INSERT INTO medical_record_medical_responsable_signatures ({', '.join(keys)}) VALUES ({', '.join(vals)})"), resp_data)
 
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error responsable signature update: {e}")
+@router.patch("/{record_id}")
+async def patch_medical_record(
+    record_id: str,
+    response: Response,
+    patient_id: Optional[str] = Form(None),
+    data: Optional[Json[MedicalRecordFullRequest]] = Form(None),
+    data_img: UploadFile = File(None),
+    firma_medico_evaluador: UploadFile = File(None),
+    fecha_medico_evaluador: Optional[date] = Form(None),
+    firma_medico_laboral: UploadFile = File(None),
+    fecha_medico_laboral: Optional[date] = Form(None),
+    firma_paciente: UploadFile = File(None),
+    fecha_paciente: Optional[date] = Form(None),
+    firma_responsable: UploadFile = File(None),
+    fecha_responsable: Optional[date] = Form(None),
+    usar_firma_registrada: bool = Form(False),
+    current_user: UserSchema = Depends(require_roles("professional", "admin"))
+):
+    """
+    Actualización parcial de un medical_record.
+    - Carga una sola vez las secciones afectadas y calcula el diff por columna.
+    - Solo las columnas que cambiaron se envían, como `INSERT ... ON DUPLICATE KEY UPDATE`.
+    - Las firmas / data image cuyo contenido (SHA-256) no cambió no se reescriben.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        rec = db.execute(
+            text("SELECT id, patient_id, version FROM medical_record WHERE id = :rid FOR UPDATE"),
+            {"rid": record_id}
+        ).mappings().first()
+        if not rec:
+            raise HTTPException(status_code=404, detail="Medical record not found")
+
+        model_dump = clean_data(data.model_dump(exclude_unset=True)) if data else {}
+        # Las firmas y la data image solo se modifican mediante archivos
+        model_dump = {
+            k: v for k, v in model_dump.items()
+            if v and k not in SIGNATURE_TABLES and k != "medical_record_data_img"
+        }
+
+        signature_slots = {
+            "medical_record_signatures": (firma_medico_evaluador, fecha_medico_evaluador),
+            "medical_record_laboral_signatures": (firma_medico_laboral, fecha_medico_laboral),
+            "medical_record_patient_signatures": (firma_paciente, fecha_paciente),
+            "medical_record_medical_responsable_signatures": (firma_responsable, fecha_responsable),
+        }
+
+        touched = set(model_dump)
+        touched.update(table for table, (upload, fecha) in signature_slots.items() if upload or fecha)
+        if usar_firma_registrada:
+            touched.update(PROFILE_SIGNATURE_TABLES)
+        if data_img:
+            touched.update(["medical_record_data", "medical_record_data_img"])
 
+        current = _fetch_record_sections(db, rec, tables=list(touched)) if touched else {}
+        changes: Dict[str, List[str]] = {}
+
+        # Archivos: solo se escriben los que cambiaron de contenido, todos en paralelo.
+        # Los nuevos se borran si hay rollback; los reemplazados, después del commit.
+        batch = UploadBatch(db)
+
+        existing_img = current.get("medical_record_data_img")
+        existing_img_url = existing_img["url"] if existing_img else None
+        data_img_url = None
+        has_data_row = bool(current.get("medical_record_data") or model_dump.get("medical_record_data"))
+        if data_img and has_data_row and not await _upload_matches_stored(data_img, existing_img_url, DATA_IMAGES_DIR):
+            _, data_img_url = await _stage_upload(batch, data_img, DATA_IMAGES_DIR, "data_", DATA_IMAGES_DOMAIN_URL, DATA_IMAGE_PROFILE)
+            batch.delete_after_commit(_local_file_path(existing_img_url, DATA_IMAGES_DIR))
+
+        # Firmas del profesional: se resuelven contra las registradas (por hash)
+        prof_id = _get_professional_id(db, current_user.id) if current_user.role == "professional" else None
+        profile_signatures = await _resolve_profile_signatures(
+            db, batch, prof_id, {t: upload for t, (upload, _) in signature_slots.items()}, usar_firma_registrada
+        )
+
+        signature_urls: Dict[str, str] = {}
+        for table_name, (upload, _) in signature_slots.items():
+            existing = current.get(table_name)
+            existing_url = existing["url"] if existing else None
+            if table_name in profile_signatures:
+                new_url = profile_signatures[table_name]["url"]
+                if new_url != existing_url:
+                    signature_urls[table_name] = new_url
+                    batch.delete_after_commit(_local_file_path(existing_url, SIGNATURES_DIR))
+            elif upload and not await _upload_matches_stored(upload, existing_url, SIGNATURES_DIR):
+                prefix, _ = SIGNATURE_FILES[table_name]
+                _, signature_urls[table_name] = await _stage_upload(batch, upload, SIGNATURES_DIR, prefix, DOMAIN_URL, SIGNATURE_IMAGE_PROFILE)
+                batch.delete_after_commit(_local_file_path(existing_url, SIGNATURES_DIR))
+
+        try:
+            await batch.persist()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error saving files: {e}")
+
+        # 1. Secciones: upsert solo de las columnas modificadas
+        for table_name, values in model_dump.items():
+            current_row = current.get(table_name)
+            diff = _section_diff(table_name, current_row, values)
+            if not diff:
+                continue
+
+            row = {
+                "id": str(current_row["id"]) if current_row else str(uuid.uuid4()),
+                "medical_record_id": record_id,
+                **diff
+            }
+            upsert_rows(db, table_name, [row], list(diff))
+            changes[table_name] = sorted(diff)
+            if table_name == "medical_record_data" and not current_row:
+                current["medical_record_data"] = row
+
+        # 2. Data image (requiere medical_record_data)
+        data_row = current.get("medical_record_data")
+        if data_img_url and data_row:
+            upsert_rows(db, "medical_record_data_img", [{
+                "id": str(existing_img["id"]) if existing_img else str(uuid.uuid4()),
+                "medical_record_data_id": str(data_row["id"]),
+                "url": data_img_url,
+            }], ["url"])
+            changes["medical_record_data_img"] = ["url"]
+
+        # 3. Firmas: solo las que cambiaron de archivo o de fecha
+        for table_name, (upload, fecha) in signature_slots.items():
+            existing = current.get(table_name)
+            sig_changes: Dict[str, Any] = {}
+
+            if table_name in signature_urls:
+                sig_changes["url"] = signature_urls[table_name]
+                if table_name in PROFILE_SIGNATURE_TABLES:
+                    sig_changes["professional_signature_id"] = profile_signatures.get(table_name, {}).get("professional_signature_id")
+
+            if fecha and existing:
+                existing_date = existing.get("created_at")
+                if isinstance(existing_date, datetime):
+                    existing_date = existing_date.date()
+                if existing_date != fecha:
+                    sig_changes["created_at"] = fecha
+
+            # Sin firma previa ni archivo nuevo no hay nada que guardar
+            if not sig_changes or (not existing and "url" not in sig_changes):
+                continue
+
+            row = {
+                "id": str(existing["id"]) if existing else str(uuid.uuid4()),
+                "medical_record_id": record_id,
+                **sig_changes
+            }
+            if not existing:
+                row["created_at"] = fecha if fecha else datetime.utcnow()
+            if "url" in sig_changes:
+                if table_name == "medical_record_patient_signatures":
+                    row["patient_id"] = patient_id or rec["patient_id"]
+                else:
+                    if prof_id is None:
+                        prof_id = _get_professional_id(db, current_user.id)
+                    row["professional_id"] = prof_id
+
+            upsert_rows(db, table_name, [row], [k for k in row if k not in ("id", "medical_record_id")])
+            changes[table_name] = sorted(sig_changes)
+
+        # 4. Registro padre: patient_id (si cambió) + version
+        new_patient_id = patient_id if patient_id and patient_id != rec["patient_id"] else None
+        if not changes and not new_patient_id:
+            db.rollback()
+            response.headers["ETag"] = _record_etag(str(rec["id"]), rec["version"])
+            return {"detail": "No changes", "version": rec["version"], "changes": {}}
+
+        if new_patient_id:
+            db.execute(
+                text("UPDATE medical_record SET patient_id = :pid, version = version + 1 WHERE id = :rid"),
+                {"pid": new_patient_id, "rid": record_id}
+            )
+            changes["medical_record"] = ["patient_id"]
+        else:
+            db.execute(
+                text("UPDATE medical_record SET version = version + 1 WHERE id = :rid"),
+                {"rid": record_id}
+            )
+        _refresh_search_index(db, record_id, [t for t, cols in changes.items() if set(cols) & set(SEARCH_TEXT_COLUMNS.get(t, []))])
+        _refresh_findings(db, record_id, [t for t, cols in changes.items() if set(cols) & set(FINDINGS_LAYOUT.fields.get(t, []))])
+        _log_record_change(db, record_id, "update", list(changes))
+
+        # El commit borra los archivos reemplazados (ver UploadBatch)
         db.commit()
-        return {"detail": "Updated successfully with file management"}
 
+        version = rec["version"] + 1
+        response.headers["ETag"] = _record_etag(str(rec["id"]), version)
+        return {"detail": "Updated successfully", "version": version, "changes": changes}
+
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
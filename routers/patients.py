@@ -7,6 +7,13 @@ from sqlalchemy import text
 import os
 from pathlib import Path
 import shutil
+from datetime import datetime
+from utils.image_processing import original_copies
+from utils.study_blobs import release_blobs, remove_unused_blobs
+from utils.pdf_render import remove_cached_pdfs
+from utils.change_log import track_change_log
+from utils.storage_layout import resolve_path
+from utils.storage_dirs import DATA_IMAGES_DIR, SIGNATURES_DIR, STUDIES_DIR
 
 router = APIRouter(prefix="/patients", tags=["Patients"])
 
@@ -271,38 +278,20 @@ async def update_patient(
 
 # ==================== DELETE PATIENT ====================
 
-# Paths mirrored from medical_records.py and studies.py
-_SIGNATURES_DIR_ENV = os.getenv("SIGNATURES_DIR")
-if _SIGNATURES_DIR_ENV:
-    _SIGNATURES_DIR = Path(_SIGNATURES_DIR_ENV)
-elif os.name == "posix":
-    _SIGNATURES_DIR = Path("/home/iweb/vitalis/data/signatures/")
-else:
-    _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    _SIGNATURES_DIR = Path(os.path.join(_BASE_DIR, "signatures"))
-
-_DATA_IMAGES_DIR_ENV = os.getenv("DATA_IMAGES_DIR")
-if _DATA_IMAGES_DIR_ENV:
-    _DATA_IMAGES_DIR = Path(_DATA_IMAGES_DIR_ENV)
-else:
-    _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    _DATA_IMAGES_DIR = Path(os.path.join(_BASE_DIR, "data_images"))
-
-_STUDIES_DIR = os.getenv("STUDIES_DIR", "/home/iweb/vitalis/data/studies/")
-if os.name != "posix" and not os.getenv("STUDIES_DIR"):
-    _BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    _STUDIES_DIR = os.path.join(_BASE_DIR, "studies")
-
-
 def _delete_file_from_url(url: str, directory) -> None:
     """Elimina un archivo físico dado su URL y directorio base."""
     if not url:
         return
     try:
         filename = url.split("/")[-1]
-        file_path = Path(directory) / filename
+        # Las firmas registradas del profesional (sig_prof_) se comparten entre historias
+        if filename.startswith("sig_prof_"):
+            return
+        file_path = resolve_path(directory, url)
         if file_path.exists():
             os.remove(file_path)
+        for original in original_copies(file_path):
+            os.remove(original)
     except Exception as e:
         print(f"Warning: could not delete file {url}: {e}")
 
@@ -342,6 +331,17 @@ async def delete_patient(
             {"pid": patient_id}
         ).mappings().all()
 
+        # Change log de medical_records: un 'delete' por registro (ver GET /medical-records/changes)
+        track_change_log(db)
+        db.execute(
+            text("""
+                INSERT INTO medical_record_changes (medical_record_id, patient_id, version, operation, tables, changed_at)
+                SELECT id, patient_id, version, 'delete', NULL, :now
+                FROM medical_record WHERE patient_id = :pid
+            """),
+            {"pid": patient_id, "now": datetime.utcnow()}
+        )
+
         mr_sub_tables = [
             "medical_record_bucodental_exam", "medical_record_cardiovascular_exam",
             "medical_record_clinical_exam", "medical_record_derivations",
@@ -369,13 +369,13 @@ async def delete_patient(
                 text("SELECT url FROM medical_record_signatures WHERE medical_record_id = :rid"),
                 {"rid": rid}
             ).mappings().all():
-                _delete_file_from_url(sig["url"], _SIGNATURES_DIR)
+                _delete_file_from_url(sig["url"], SIGNATURES_DIR)
 
             for l_sig in db.execute(
                 text("SELECT url FROM medical_record_laboral_signatures WHERE medical_record_id = :rid"),
                 {"rid": rid}
             ).mappings().all():
-                _delete_file_from_url(l_sig["url"], _SIGNATURES_DIR)
+                _delete_file_from_url(l_sig["url"], SIGNATURES_DIR)
 
             # B. Recolectar y borrar archivos físicos de data images
             for dr in db.execute(
@@ -386,7 +386,7 @@ async def delete_patient(
                     text("SELECT url FROM medical_record_data_img WHERE medical_record_data_id = :did"),
                     {"did": dr["id"]}
                 ).mappings().all():
-                    _delete_file_from_url(img["url"], _DATA_IMAGES_DIR)
+                    _delete_file_from_url(img["url"], DATA_IMAGES_DIR)
                 db.execute(
                     text("DELETE FROM medical_record_data_img WHERE medical_record_data_id = :did"),
                     {"did": dr["id"]}
@@ -405,6 +405,7 @@ async def delete_patient(
         # ----------------------------------------------------------------
         # 3. Eliminar todos los studies del paciente
         # ----------------------------------------------------------------
+        unused_study_files = []
         studies = db.execute(
             text("SELECT id FROM studies WHERE patient_id = :pid"),
             {"pid": patient_id}
@@ -413,18 +414,12 @@ async def delete_patient(
         for study in studies:
             sid = str(study["id"])
 
-            # Borrar archivos físicos
-            for f in db.execute(
-                text("SELECT file_path FROM study_files WHERE study_id = :sid"),
+            # Archivos físicos: se borran después del commit, solo los que quedan sin referencias
+            study_files = db.execute(
+                text("SELECT file_path, content_hash FROM study_files WHERE study_id = :sid"),
                 {"sid": sid}
-            ).mappings().all():
-                try:
-                    fname = os.path.basename(f["file_path"])
-                    local_path = os.path.join(_STUDIES_DIR, fname)
-                    if os.path.exists(local_path):
-                        os.remove(local_path)
-                except Exception as e:
-                    print(f"Warning: could not delete study file: {e}")
+            ).mappings().all()
+            unused_study_files.extend(release_blobs(db, study_files))
 
             db.execute(text("DELETE FROM study_files WHERE study_id = :sid"), {"sid": sid})
             db.execute(text("DELETE FROM studies WHERE id = :sid"), {"sid": sid})
@@ -441,6 +436,9 @@ async def delete_patient(
             db.execute(text("DELETE FROM users WHERE id = :uid"), {"uid": user_id})
 
         db.commit()
+
+        remove_unused_blobs(db, STUDIES_DIR, unused_study_files)
+        remove_cached_pdfs([str(mr["id"]) for mr in medical_records])
         return {"detail": "Patient and all related data deleted successfully", "patient_id": patient_id}
 
     except HTTPException:
@@ -1,27 +1,36 @@
 from os import name
 from Database.getConnection import engine
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, status, Form, UploadFile, File, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Form, UploadFile, File, Query, Request, Header, Response, BackgroundTasks
+from fastapi.responses import FileResponse
 from models.user import User
 from auth.authentication import require_active_user, require_roles
 from Database.getConnection import getConnectionForLogin
-from sqlalchemy import text
-from datetime import datetime
+from sqlalchemy import text, bindparam
+from datetime import date, datetime, timedelta
 import uuid
 import os
 from typing import Optional
 import shutil
 import mimetypes
 from typing import List
+from Database.batch import insert_rows
+from utils.file_storage import (
+    StoredUpload, UploadTooLargeError, hash_file, remove_files, run_in_file_pool, stream_upload, write_at_offset
+)
+from utils.http_cache import etag_matches, http_date, not_modified_since
+from utils.signed_urls import sign_url, verify_url
+from utils.study_previews import generate_previews
+from utils.study_blobs import claim_blob, release_blobs, remove_unused_blobs, restore_unclaimed_blob
+from utils.storage_layout import file_url, relative_from_url, resolve_path
+from utils.storage_dirs import STUDIES_DIR
+from pydantic import BaseModel
+import asyncio
+import base64
+import time
 
 router = APIRouter(prefix="/studies")
 
-STUDIES_DIR = os.getenv("STUDIES_DIR", "/home/iweb/vitalis/data/studies/")
-if os.name != 'posix' and not os.getenv("STUDIES_DIR"):
-     # Fallback for windows dev
-     PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-     STUDIES_DIR = os.path.join(PROJECT_ROOT, "studies")
-     
 DOMAIN_URL = "https://saludvitalis.org/MdpuF8KsXiRArNlHtl6pXO2XyLSJMTQ8_Vitalis/api/studies/files/public"
 
 STUDIES_ADMIN_DIR = os.getenv("STUDIES_ADMIN_DIR", "/home/iweb/vitalis/data/studies_admin/")
@@ -36,19 +45,48 @@ try:
 except Exception as e:
     print(f"Warning: Could not create studies admin directory: {e}")
 
+# Tamaño máximo por archivo de estudio (se controla mientras se copia a disco)
+STUDY_MAX_UPLOAD_BYTES = int(os.getenv("STUDY_MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Archivos de un mismo request que se escriben a la vez (sobre el pool de I/O compartido)
+STUDY_UPLOAD_CONCURRENCY = int(os.getenv("STUDY_UPLOAD_CONCURRENCY", "4"))
+
+# Uploads reanudables: los .part viven junto a STUDIES_DIR (mismo filesystem -> rename sin copia)
+STUDY_UPLOADS_DIR = os.getenv("STUDY_UPLOADS_DIR", os.path.join(STUDIES_DIR, ".uploads"))
+STUDY_UPLOAD_CHUNK_BYTES = int(os.getenv("STUDY_UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+STUDY_UPLOAD_TTL_HOURS = int(os.getenv("STUDY_UPLOAD_TTL_HOURS", "24"))
+
+# URLs firmadas: base pública de la API y ruta de descarga firmada dentro de ella
+API_BASE_URL = os.getenv("API_BASE_URL", "https://saludvitalis.org/MdpuF8KsXiRArNlHtl6pXO2XyLSJMTQ8_Vitalis/api")
+SIGNED_FILES_PATH = "/studies/files/signed"
+SIGNED_URLS_MAX_STUDIES = int(os.getenv("SIGNED_URLS_MAX_STUDIES", "50"))
+
+# Listados paginados por keyset sobre (created_at, id), del más nuevo al más viejo
+STUDIES_PAGE_SIZE = int(os.getenv("STUDIES_PAGE_SIZE", "50"))
+STUDIES_MAX_PAGE_SIZE = int(os.getenv("STUDIES_MAX_PAGE_SIZE", "200"))
+
+# Cola de revisión: los estudios en STUDY_QUEUE_STATUS se asignan a un revisor
+# (licenciado / especialista) con un lease que vence si no lo renueva ni lo cierra
+STUDY_QUEUE_STATUS = "pending"
+STUDY_LEASE_SECONDS = int(os.getenv("STUDY_LEASE_SECONDS", "900"))
+STUDY_CLAIM_MAX = int(os.getenv("STUDY_CLAIM_MAX", "10"))
+STUDY_REVIEWER_ROLES = ("licenciado", "especialista")
+
 DOMAIN_URL_ADMIN = "https://saludvitalis.org/MdpuF8KsXiRArNlHtl6pXO2XyLSJMTQ8_Vitalis/api/studies_admin/files"
 
 def get_file_extension(file: UploadFile) -> str:
     """
     Intenta obtener la extensión del archivo a partir de su nombre o su content_type.
     """
+    return _extension_for(file.filename, file.content_type)
+
+def _extension_for(filename: Optional[str], content_type: Optional[str]) -> str:
     # 1. Intentar por el nombre del archivo
-    filename = file.filename or ""
+    filename = filename or ""
     ext = os.path.splitext(filename)[1]
     
     # 2. Si no tiene extensión o es genérica, intentar por content_type
-    if (not ext or ext.lower() not in ['.jpg', '.jpeg', '.png', '.webp', '.pdf']) and file.content_type:
-        ext = mimetypes.guess_extension(file.content_type)
+    if (not ext or ext.lower() not in ['.jpg', '.jpeg', '.png', '.webp', '.pdf']) and content_type:
+        ext = mimetypes.guess_extension(content_type)
         if ext == ".jpe":
             ext = ".jpg"
     
@@ -56,6 +94,125 @@ def get_file_extension(file: UploadFile) -> str:
     # but let's keep it consistent or use a sensible default.
     return ext or ""
 
+async def _save_study_file(file: UploadFile, stored_filename: str):
+    """Copia el upload a STUDIES_DIR por bloques (tamaño + SHA-256); 413 si excede el máximo."""
+    try:
+        return await run_in_file_pool(stream_upload, file, Path(STUDIES_DIR) / stored_filename, STUDY_MAX_UPLOAD_BYTES)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+def _study_file_url(local_path) -> str:
+    """URL pública de un archivo dentro de STUDIES_DIR (conserva el subdirectorio de shard)."""
+    return file_url(DOMAIN_URL, Path(local_path).relative_to(STUDIES_DIR).as_posix())
+
+def _study_file_row(study_id: str, file_id: str, filename: Optional[str], mime_type: Optional[str], stored: StoredUpload) -> dict:
+    """Fila de study_files para un archivo ya guardado en STUDIES_DIR."""
+    return {
+        "id": file_id,
+        "study_id": study_id,
+        "file_path": file_url(DOMAIN_URL, stored.path.relative_to(STUDIES_DIR).as_posix()),
+        "original_filename": filename,
+        "mime_type": mime_type,
+        "size_bytes": stored.size_bytes,
+        "content_hash": stored.sha256,
+        "uploaded_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+async def _ingest_study_files(db, study_id: str, files: List[UploadFile]):
+    """
+    Guarda los archivos de un estudio en paralelo (hasta STUDY_UPLOAD_CONCURRENCY a la vez)
+    y devuelve las filas de study_files listas para un único INSERT multi-fila, el detalle
+    por archivo (incluye el tiempo de escritura) y los blobs creados (a borrar si la
+    transacción falla). Cada archivo se guarda una sola vez por contenido (study_blobs):
+    si el SHA-256 ya existe, la copia recién subida se descarta.
+    """
+    semaphore = asyncio.Semaphore(STUDY_UPLOAD_CONCURRENCY)
+
+    async def save(file: UploadFile):
+        async with semaphore:
+            started = time.perf_counter()
+            file_id = str(uuid.uuid4())
+            stored = await _save_study_file(file, f".{file_id}.incoming")
+            return file_id, file, stored, (time.perf_counter() - started) * 1000
+
+    results = await asyncio.gather(*(save(f) for f in files), return_exceptions=True)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        remove_files([r[2].path for r in results if not isinstance(r, BaseException)])
+        raise errors[0]
+
+    rows, summary, created, duplicates = [], [], [], []
+    try:
+        for file_id, file, stored, elapsed_ms in results:
+            blob_path, is_new = claim_blob(
+                db, Path(STUDIES_DIR), stored.path, stored.sha256, get_file_extension(file), stored.size_bytes
+            )
+            (created if is_new else duplicates).append(blob_path if is_new else stored.path)
+            row = _study_file_row(
+                study_id, file_id, file.filename, file.content_type,
+                StoredUpload(blob_path, stored.size_bytes, stored.sha256)
+            )
+            rows.append(row)
+            summary.append({
+                "id": file_id,
+                "url": row["file_path"],
+                "filename": file.filename,
+                "size_bytes": stored.size_bytes,
+                "deduplicated": not is_new,
+                "write_ms": round(elapsed_ms, 1),
+            })
+    except BaseException:
+        # Todavía dentro de la transacción: los locks de claim_blob siguen tomados
+        remove_files(created + [r[2].path for r in results])
+        raise
+    finally:
+        remove_files(duplicates)
+    return rows, summary, created
+
+def _discard_new_blobs(db, written: List[Path]):
+    """Post-rollback: blobs creados por la transacción fallida, vía el borrado con lock."""
+    remove_unused_blobs(db, STUDIES_DIR, [Path(p).relative_to(STUDIES_DIR).as_posix() for p in written])
+
+def _preview_jobs(rows: List[dict]) -> List[dict]:
+    """Archivos recién guardados (filas de study_files) a los que generarles derivados."""
+    return [
+        {"id": row["id"], "path": resolve_path(STUDIES_DIR, row["file_path"]), "mime_type": row["mime_type"]}
+        for row in rows
+    ]
+
+async def _store_previews(jobs: List[dict]):
+    """
+    Background task post-commit: genera miniatura y preview en el pool de previews y
+    guarda sus URLs en study_files. Si el archivo se borró mientras tanto, se descartan.
+    """
+    generated = await generate_previews(jobs)
+    if not generated:
+        return
+    db = getConnectionForLogin()
+    if db is None:
+        print("Previews: database connection error")
+        return
+    try:
+        orphans = []
+        for file_id, paths in generated.items():
+            result = db.execute(
+                text("UPDATE study_files SET thumbnail_path = :thumb, preview_path = :preview WHERE id = :fid"),
+                {
+                    "fid": file_id,
+                    "thumb": _study_file_url(paths["thumb"]) if "thumb" in paths else None,
+                    "preview": _study_file_url(paths["preview"]) if "preview" in paths else None,
+                }
+            )
+            if result.rowcount == 0:
+                orphans.extend(Path(p) for p in paths.values())
+        db.commit()
+        remove_files(orphans)
+    except Exception as e:
+        db.rollback()
+        print(f"Previews: could not store preview paths: {e}")
+    finally:
+        db.close()
+
 def _format_study(row) -> dict:
     return {
         "id": row["id"],
@@ -69,20 +226,40 @@ def _format_study(row) -> dict:
         "created_at": row.get("created_at"),
     }
 
+def _patient_access_allowed(current_user: User, patient) -> bool:
+    """
+    Pacientes: solo lo propio. Empresas: solo pacientes de su empresa.
+    `patient` trae user_id y company_owner_user_id (LEFT JOIN companies).
+    """
+    if current_user.role == "patient":
+        return str(patient["user_id"]) == str(current_user.id)
+    if current_user.role == "company":
+        return str(patient["company_owner_user_id"]) == str(current_user.id)
+    return True
+
 def _check_access_to_patient(current_user: User, patient_id: str, db):
     patient = db.execute(
-        text("SELECT id, company_id, user_id FROM patients WHERE id = :pid"),
+        text("""
+            SELECT p.id, p.company_id, p.user_id, c.owner_user_id AS company_owner_user_id
+            FROM patients p
+            LEFT JOIN companies c ON c.id = p.company_id
+            WHERE p.id = :pid
+        """),
         {"pid": patient_id}
     ).mappings().first()
     
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
+
+    if not _patient_access_allowed(current_user, patient):
+        raise HTTPException(status_code=403, detail="Access denied")
     
     return patient
 
 @router.post("/patient/{patient_id}", tags=["Studies"])
 async def create_study(
     patient_id: str,
+    background_tasks: BackgroundTasks,
     study_type: str = Form(...),
     status: str = Form(...),
     study_files: List[UploadFile] = File(...),
@@ -92,6 +269,7 @@ async def create_study(
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
 
+    written = []
     try:
         # Check professional's role
         if current_user.role == "professional":
@@ -131,126 +309,411 @@ async def create_study(
             }
         )
 
-        uploaded_files_data = []
-
-        # Process Files
-        for file in study_files:
-            if not os.path.exists(STUDIES_DIR):
-                os.makedirs(STUDIES_DIR, exist_ok=True)
-            
-            # Normalize filename and ensure uniqueness
-            ext = get_file_extension(file)
-            fname = f"{uuid.uuid4()}{ext}"
-            path = os.path.join(STUDIES_DIR, fname)
-            
-            # Save file
-            content = await file.read()
-            with open(path, "wb") as f:
-                f.write(content)
-                
-            size_bytes = len(content)
-            url_main = f"{DOMAIN_URL}/{fname}"
-            file_id = str(uuid.uuid4())
-            now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Insert File Record
-            db.execute(
-                text("""
-                    INSERT INTO study_files (id, study_id, file_path, original_filename, mime_type, size_bytes, uploaded_at)
-                    VALUES (:id, :study_id, :file_path, :original_filename, :mime_type, :size_bytes, :uploaded_at)
-                """),
-                {
-                    "id": file_id,
-                    "study_id": study_id,
-                    "file_path": url_main,
-                    "original_filename": file.filename,
-                    "mime_type": file.content_type,
-                    "size_bytes": size_bytes,
-                    "uploaded_at": now
-                }
-            )
-            
-            uploaded_files_data.append({
-                "id": file_id,
-                "url": url_main,
-                "filename": file.filename
-            })
+        # Process Files: escritura en paralelo + un solo INSERT para todos los study_files
+        started = time.perf_counter()
+        file_rows, uploaded_files_data, written = await _ingest_study_files(db, study_id, study_files)
+        files_ms = (time.perf_counter() - started) * 1000
 
+        started = time.perf_counter()
+        insert_rows(db, "study_files", file_rows)
         db.commit()
+        written = []
+        db_ms = (time.perf_counter() - started) * 1000
+        background_tasks.add_task(_store_previews, _preview_jobs(file_rows))
+        print(f"create_study {study_id}: files;dur={files_ms:.1f}, db;dur={db_ms:.1f}")
         return {
             "message": "Study created successfully",
             "id": study_id,
-            "files": uploaded_files_data
+            "files": uploaded_files_data,
+            "timing_ms": {"files": round(files_ms, 1), "db": round(db_ms, 1)},
         }
 
     except HTTPException:
+        db.rollback()
+        _discard_new_blobs(db, written)
         raise
     except Exception as e:
         db.rollback()
+        _discard_new_blobs(db, written)
         raise HTTPException(status_code=500, detail=f"Error creating study: {str(e)}")
     finally:
         db.close()
 
+def _encode_cursor(row) -> str:
+    created_at = row["created_at"]
+    if isinstance(created_at, datetime):
+        created_at = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    return base64.urlsafe_b64encode(f"{created_at}|{row['id']}".encode()).decode("ascii")
+
+def _decode_cursor(cursor: str) -> tuple:
+    """(created_at, id) del último estudio de la página anterior; 400 si el cursor no es válido."""
+    try:
+        created_at, study_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode().split("|", 1)
+        datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
+        return created_at, study_id
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _files_by_study(db, study_ids: List[str]) -> dict:
+    """Archivos de varios estudios en una sola consulta, agrupados por study_id."""
+    files_by_study = {sid: [] for sid in study_ids}
+    if not study_ids:
+        return files_by_study
+    files_rows = db.execute(
+        text("""
+            SELECT id, study_id, file_path, thumbnail_path, preview_path, original_filename, mime_type, size_bytes, uploaded_at
+            FROM study_files
+            WHERE study_id IN :sids
+            ORDER BY uploaded_at
+        """).bindparams(bindparam("sids", expanding=True)),
+        {"sids": study_ids}
+    ).mappings().all()
+    for f in files_rows:
+        files_by_study[f["study_id"]].append(f)
+    return files_by_study
+
+def _list_studies(
+    db,
+    filters: dict,
+    cursor: Optional[str],
+    limit: int,
+    with_patient: bool = False,
+) -> dict:
+    """
+    Página de estudios ordenada por (created_at DESC, id DESC) con keyset: la siguiente
+    página arranca después del cursor, sin OFFSET. Los filtros (patient_id, status,
+    study_type, created_from, created_to) usan los índices de 011_studies_listing.sql.
+    Los archivos salen de una sola consulta limitada a los estudios de la página.
+    Devuelve `total` (todos los que cumplen los filtros) y `count` (los de la página).
+    """
+    if not 1 <= limit <= STUDIES_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {STUDIES_MAX_PAGE_SIZE}")
+
+    conditions, params = [], {"limit": limit + 1}
+    for column in ("patient_id", "status", "study_type"):
+        if filters.get(column) is not None:
+            conditions.append(f"s.{column} = :{column}")
+            params[column] = filters[column]
+    if filters.get("created_from"):
+        conditions.append("s.created_at >= :created_from")
+        params["created_from"] = filters["created_from"].strftime('%Y-%m-%d 00:00:00')
+    if filters.get("created_to"):
+        conditions.append("s.created_at < :created_to")
+        params["created_to"] = (filters["created_to"] + timedelta(days=1)).strftime('%Y-%m-%d 00:00:00')
+
+    patient_columns = ", p.first_name, p.last_name, p.dni" if with_patient else ""
+    patient_join = "INNER JOIN patients p ON p.id = s.patient_id" if with_patient else ""
+    # total: todos los estudios que cumplen los filtros (sin el cursor), como antes de paginar
+    total = db.execute(
+        text(f"""
+            SELECT COUNT(*) FROM studies s
+            {patient_join}
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+        """),
+        {k: v for k, v in params.items() if k != "limit"}
+    ).scalar()
+
+    if cursor:
+        params["cursor_created_at"], params["cursor_id"] = _decode_cursor(cursor)
+        conditions.append(
+            "(s.created_at < :cursor_created_at OR (s.created_at = :cursor_created_at AND s.id < :cursor_id))"
+        )
+
+    rows = db.execute(
+        text(f"""
+            SELECT s.id, s.patient_id, s.created_by_user_id, s.study_type, s.status, s.created_at{patient_columns}
+            FROM studies s
+            {patient_join}
+            {"WHERE " + " AND ".join(conditions) if conditions else ""}
+            ORDER BY s.created_at DESC, s.id DESC
+            LIMIT :limit
+        """),
+        params
+    ).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    files_by_study = _files_by_study(db, [row["id"] for row in rows])
+
+    studies = []
+    for row in rows:
+        study = {
+            "id": row["id"],
+            "patient_id": row["patient_id"],
+            "created_by_user_id": row["created_by_user_id"],
+            "study_type": row["study_type"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "files": files_by_study[row["id"]],
+        }
+        if with_patient:
+            study["patient"] = {"first_name": row["first_name"], "last_name": row["last_name"], "dni": row["dni"]}
+        studies.append(study)
+
+    return {
+        "studies": studies,
+        "total": total,
+        "count": len(studies),  # estudios en esta página
+        "next_cursor": _encode_cursor(rows[-1]) if has_more else None,
+        "has_more": has_more,
+    }
+
 @router.get("/patient/{patient_id}", tags=["Studies"])
-async def get_studies(patient_id: str):
+async def get_studies(
+    patient_id: str,
+    status: Optional[str] = None,
+    study_type: Optional[str] = None,
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = STUDIES_PAGE_SIZE,
+    current_user: User = Depends(require_active_user),
+):
+    """
+    Estudios de un paciente, paginados (más nuevos primero).
+    - **cursor**: `next_cursor` de la página anterior; vacío para la primera.
+    - **status**, **study_type**, **created_from** / **created_to** (fechas, inclusive): filtros opcionales.
+
+    Respuesta: `studies` (la página), `count` (estudios en la página), `total` (todos los
+    que cumplen los filtros), `next_cursor` y `has_more`. Cambio respecto de la versión
+    sin paginar: devuelve a lo sumo `limit` estudios y requiere acceso al paciente.
+    """
     db = getConnectionForLogin()
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
     
     try:
+        _check_access_to_patient(current_user, patient_id, db)
+        return _list_studies(
+            db,
+            {
+                "patient_id": patient_id, "status": status, "study_type": study_type,
+                "created_from": created_from, "created_to": created_to,
+            },
+            cursor,
+            limit,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Error fetching studies" + str(e))
+    finally:
+        db.close()
+
+@router.get("", tags=["Studies"])
+async def list_studies(
+    status: Optional[str] = None,
+    study_type: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = STUDIES_PAGE_SIZE,
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    """
+    Listado de estudios de todos los pacientes (p. ej. status=pending), paginado igual
+    que el listado por paciente e incluyendo nombre y DNI del paciente.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        return _list_studies(
+            db,
+            {
+                "patient_id": patient_id, "status": status, "study_type": study_type,
+                "created_from": created_from, "created_to": created_to,
+            },
+            cursor,
+            limit,
+            with_patient=True,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Error fetching studies" + str(e))
+    finally:
+        db.close()
+
+def _require_reviewer(db, current_user: User):
+    """Solo admin o profesionales licenciado / especialista trabajan la cola de revisión."""
+    if current_user.role == "admin":
+        return
+    rol = db.execute(
+        text("SELECT rol FROM professionals WHERE user_id = :uid LIMIT 1"),
+        {"uid": current_user.id}
+    ).scalar()
+    if rol not in STUDY_REVIEWER_ROLES:
+        raise HTTPException(status_code=403, detail="Only licenciados and especialistas can review studies")
+
+def _as_datetime(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
+    return value
+
+def _age_seconds(value, now: datetime) -> Optional[int]:
+    if value is None:
+        return None
+    return max(0, int((now - _as_datetime(value)).total_seconds()))
+
+@router.post("/queue/claim", tags=["Studies Queue"])
+async def claim_pending_studies(
+    count: int = 1,
+    current_user: User = Depends(require_roles("admin", "professional"))
+):
+    """
+    Asigna al revisor los `count` estudios pendientes más viejos que no tengan un lease
+    vigente, por STUDY_LEASE_SECONDS. El SELECT ... FOR UPDATE SKIP LOCKED saltea las
+    filas que otro revisor está tomando en ese momento: revisores concurrentes nunca
+    reciben el mismo estudio ni se esperan entre sí. Un lease vencido vuelve a la cola.
+    """
+    if not 1 <= count <= STUDY_CLAIM_MAX:
+        raise HTTPException(status_code=400, detail=f"count must be between 1 and {STUDY_CLAIM_MAX}")
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        _require_reviewer(db, current_user)
+        now = datetime.utcnow()
         rows = db.execute(
             text("""
                 SELECT id, patient_id, created_by_user_id, study_type, status, created_at
                 FROM studies
-                WHERE patient_id = :patient_id
-                ORDER BY created_at DESC
+                WHERE status = :status AND (lease_expires_at IS NULL OR lease_expires_at < :now)
+                ORDER BY created_at, id
+                LIMIT :count
+                FOR UPDATE SKIP LOCKED
             """),
-            {"patient_id": patient_id}
+            {"status": STUDY_QUEUE_STATUS, "now": now.strftime('%Y-%m-%d %H:%M:%S'), "count": count}
         ).mappings().all()
-        
         if not rows:
-            return {"studies": [], "total": 0}
+            db.commit()
+            return {"studies": [], "lease_expires_at": None}
 
-        # Studies files
-        # Fetch files for all studies matching the patient_id (which is safer and cleaner than passing a list of IDs)
-        files_rows = db.execute(
+        lease_expires_at = (now + timedelta(seconds=STUDY_LEASE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        db.execute(
             text("""
-                SELECT id, study_id, file_path, original_filename, mime_type, size_bytes, uploaded_at
-                FROM study_files
-                WHERE study_id IN (
-                    SELECT id FROM studies WHERE patient_id = :patient_id
-                )
-            """),
-            {"patient_id": patient_id}
-        ).mappings().all() 
-        
-        # Group files by study_id
-        files_by_study = {}
-        for f in files_rows:
-            sid = f["study_id"]
-            if sid not in files_by_study:
-                files_by_study[sid] = []
-            files_by_study[sid].append(f)
-        
+                UPDATE studies SET assigned_to_user_id = :uid, claimed_at = :now, lease_expires_at = :expires
+                WHERE id IN :sids
+            """).bindparams(bindparam("sids", expanding=True)),
+            {
+                "uid": current_user.id,
+                "now": now.strftime('%Y-%m-%d %H:%M:%S'),
+                "expires": lease_expires_at,
+                "sids": [row["id"] for row in rows],
+            }
+        )
+        db.commit()
+
+        files_by_study = _files_by_study(db, [row["id"] for row in rows])
         studies = []
         for row in rows:
-            sid = row["id"]
-            studies.append({
-                "id": sid,
-                "patient_id": row["patient_id"],
-                "created_by_user_id": row["created_by_user_id"],
-                "study_type": row["study_type"],
-                "status": row["status"],
-                "created_at": row["created_at"],
-                "files": files_by_study.get(sid, [])
-            })
-        
-        return {"studies": studies, "total": len(studies)}
-    
+            study = _format_study(row)
+            study["status"] = row["status"]
+            study["files"] = files_by_study[row["id"]]
+            studies.append(study)
+        return {"studies": studies, "lease_expires_at": lease_expires_at}
+
     except HTTPException:
+        db.rollback()
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail="Error fetching studies" + str(e))
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error claiming studies: {str(e)}")
+    finally:
+        db.close()
+
+@router.post("/{study_id}/lease", tags=["Studies Queue"])
+async def renew_study_lease(
+    study_id: str,
+    current_user: User = Depends(require_roles("admin", "professional"))
+):
+    """Extiende el lease de un estudio asignado al revisor (heartbeat mientras lo revisa)."""
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        lease_expires_at = (datetime.utcnow() + timedelta(seconds=STUDY_LEASE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+        result = db.execute(
+            text("""
+                UPDATE studies SET lease_expires_at = :expires
+                WHERE id = :sid AND status = :status AND assigned_to_user_id = :uid
+            """),
+            {"sid": study_id, "status": STUDY_QUEUE_STATUS, "uid": current_user.id, "expires": lease_expires_at}
+        )
+        if result.rowcount == 0:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Study is not assigned to you")
+        db.commit()
+        return {"study_id": study_id, "lease_expires_at": lease_expires_at}
+    finally:
+        db.close()
+
+@router.delete("/{study_id}/lease", tags=["Studies Queue"])
+async def release_study_lease(
+    study_id: str,
+    current_user: User = Depends(require_roles("admin", "professional"))
+):
+    """Devuelve a la cola un estudio asignado al revisor, sin esperar a que venza el lease."""
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        result = db.execute(
+            text("""
+                UPDATE studies SET assigned_to_user_id = NULL, claimed_at = NULL, lease_expires_at = NULL
+                WHERE id = :sid AND status = :status AND assigned_to_user_id = :uid
+            """),
+            {"sid": study_id, "status": STUDY_QUEUE_STATUS, "uid": current_user.id}
+        )
+        if result.rowcount == 0:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Study is not assigned to you")
+        db.commit()
+        return {"detail": "Study released", "study_id": study_id}
+    finally:
+        db.close()
+
+@router.get("/queue/stats", tags=["Studies Queue"])
+async def get_queue_stats(
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    """
+    Métrica de la cola de revisión: profundidad (pendientes), cuántos están tomados con
+    lease vigente y cuántos libres, y la antigüedad del pendiente más viejo (total y libre).
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        now = datetime.utcnow()
+        row = db.execute(
+            text("""
+                SELECT
+                    COUNT(*) AS depth,
+                    COALESCE(SUM(CASE WHEN lease_expires_at >= :now THEN 1 ELSE 0 END), 0) AS leased,
+                    MIN(created_at) AS oldest,
+                    MIN(CASE WHEN lease_expires_at IS NULL OR lease_expires_at < :now THEN created_at END) AS oldest_available
+                FROM studies
+                WHERE status = :status
+            """),
+            {"status": STUDY_QUEUE_STATUS, "now": now.strftime('%Y-%m-%d %H:%M:%S')}
+        ).mappings().first()
+        depth, leased = int(row["depth"]), int(row["leased"])
+        return {
+            "depth": depth,
+            "leased": leased,
+            "available": depth - leased,
+            "oldest_age_seconds": _age_seconds(row["oldest"], now),
+            "oldest_available_age_seconds": _age_seconds(row["oldest_available"], now),
+        }
     finally:
         db.close()
 
@@ -279,7 +742,7 @@ async def get_study(study_id: str, current_user: User = Depends(require_active_u
         
         files = db.execute(
             text("""
-                SELECT id, study_id, file_path, original_filename, mime_type, size_bytes, uploaded_at
+                SELECT id, study_id, file_path, thumbnail_path, preview_path, original_filename, mime_type, size_bytes, uploaded_at
                 FROM study_files
                 WHERE study_id = :sid
             """),
@@ -293,6 +756,8 @@ async def get_study(study_id: str, current_user: User = Depends(require_active_u
                 "mime_type": f["mime_type"],
                 "size_bytes": f["size_bytes"],
                 "uploaded_at": f["uploaded_at"],
+                "thumbnail_url": f["thumbnail_path"],
+                "preview_url": f["preview_path"],
             } for f in files
         ]
         
@@ -310,52 +775,223 @@ async def get_study_file_link(
     study_id: str,
     current_user: User = Depends(require_active_user),
 ):
+    """
+    Último archivo del estudio. Además de la URL pública devuelve `signed_url`,
+    que vence a los FILE_URL_TTL segundos y se sirve sin consultar la base.
+    """
     db = getConnectionForLogin()
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
 
     try:
-        row = db.execute(
-            text("""
-                SELECT
-                    s.patient_id,
-                    sf.file_path,
-                    sf.original_filename,
-                    sf.mime_type
-                FROM studies s
-                INNER JOIN study_files sf ON s.id = sf.study_id
-                WHERE s.id = :study_id
-                ORDER BY sf.uploaded_at DESC
-                LIMIT 1
-            """),
-            {"study_id": study_id},
-        ).mappings().first()
+        rows = _study_files_with_access(db, [study_id])
+    finally:
+        db.close()
 
-        if not row:
-            raise HTTPException(status_code=404, detail="Study not found")
+    if not rows:
+        raise HTTPException(status_code=404, detail="Study not found")
+    row = max(rows, key=lambda r: str(r["uploaded_at"] or ""))
+    if not _patient_access_allowed(current_user, row):
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not row["file_path"]:
+        raise HTTPException(status_code=404, detail="File link not found")
+
+    signed_url, expires = _signed_file_url(row, current_user)
+    return {
+        "url": row["file_path"], 
+        "original_filename": row["original_filename"],
+        "mime_type": row["mime_type"],
+        "signed_url": signed_url,
+        "expires_at": expires,
+    }
 
-        # ✅ permisos (si es paciente)
-        if current_user.role == "patient":
-            user_patient_id = db.execute(
-                text("SELECT id FROM patients WHERE user_id = :uid LIMIT 1"),
-                {"uid": current_user.id},
-            ).scalar()
+def _study_files_with_access(db, study_ids: List[str]):
+    """Archivos de varios estudios con los datos de acceso del paciente, en una sola consulta."""
+    return db.execute(
+        text("""
+            SELECT
+                s.id AS study_id, s.patient_id,
+                sf.id, sf.file_path, sf.thumbnail_path, sf.preview_path,
+                sf.original_filename, sf.mime_type, sf.size_bytes, sf.uploaded_at,
+                p.user_id, c.owner_user_id AS company_owner_user_id
+            FROM studies s
+            INNER JOIN study_files sf ON s.id = sf.study_id
+            INNER JOIN patients p ON p.id = s.patient_id
+            LEFT JOIN companies c ON c.id = p.company_id
+            WHERE s.id IN :sids
+        """).bindparams(bindparam("sids", expanding=True)),
+        {"sids": study_ids},
+    ).mappings().all()
 
-            if not user_patient_id or str(user_patient_id) != str(row["patient_id"]):
-                raise HTTPException(status_code=403, detail="Access denied")
+def _signed_file_url(row, current_user: User, column: str = "file_path") -> tuple:
+    stored_name = relative_from_url(row[column] or "")
+    name = (row["original_filename"] or "") if column == "file_path" else ""
+    path, expires = sign_url(f"{SIGNED_FILES_PATH}/{stored_name}", str(current_user.id), name)
+    return f"{API_BASE_URL}{path}", expires
 
-        if not row["file_path"]:
-            raise HTTPException(status_code=404, detail="File link not found")
+class SignedUrlsRequest(BaseModel):
+    study_ids: List[str]
 
-        return {
-            "url": row["file_path"], 
-            "original_filename": row["original_filename"],
+@router.post("/files/signed-urls", tags=["Studies"])
+async def get_signed_file_urls(
+    body: SignedUrlsRequest,
+    current_user: User = Depends(require_active_user),
+):
+    """
+    URLs firmadas para todos los archivos de uno o más estudios (galerías).
+    Una sola consulta autoriza todo el lote; cada descarga después se valida solo
+    con la firma. Los estudios sin acceso o inexistentes se informan en `denied`.
+    """
+    study_ids = list(dict.fromkeys(body.study_ids))
+    if not study_ids:
+        raise HTTPException(status_code=400, detail="study_ids is required")
+    if len(study_ids) > SIGNED_URLS_MAX_STUDIES:
+        raise HTTPException(status_code=400, detail=f"At most {SIGNED_URLS_MAX_STUDIES} studies per request")
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+    try:
+        rows = _study_files_with_access(db, study_ids)
+    finally:
+        db.close()
+
+    files = {sid: [] for sid in study_ids}
+    denied = set()
+    expires_at = None
+    for row in rows:
+        sid = row["study_id"]
+        if sid in denied or not _patient_access_allowed(current_user, row):
+            denied.add(sid)
+            continue
+        if not row["file_path"]:
+            continue
+        signed_url, expires_at = _signed_file_url(row, current_user)
+        files[sid].append({
+            "id": row["id"],
+            "filename": row["original_filename"],
             "mime_type": row["mime_type"],
-        }
+            "size_bytes": row["size_bytes"],
+            "signed_url": signed_url,
+            "thumbnail_url": _signed_file_url(row, current_user, "thumbnail_path")[0] if row["thumbnail_path"] else None,
+            "preview_url": _signed_file_url(row, current_user, "preview_path")[0] if row["preview_path"] else None,
+        })
+    found = {row["study_id"] for row in rows}
+    denied |= {sid for sid in study_ids if sid not in found}
+    return {
+        "expires_at": expires_at,
+        "files": {sid: items for sid, items in files.items() if sid not in denied},
+        "denied": [sid for sid in study_ids if sid in denied],
+    }
+
+@router.get("/files/signed/{stored_name:path}", tags=["Studies"])
+@router.head("/files/signed/{stored_name:path}", tags=["Studies"])
+async def download_signed_study_file(
+    stored_name: str,
+    expires: int,
+    uid: str,
+    sig: str,
+    name: str = "",
+    download: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    """Descarga con URL firmada: se verifica la firma y el vencimiento, sin base de datos."""
+    if not verify_url(f"{SIGNED_FILES_PATH}/{stored_name}", expires, uid, sig, name):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+    # Solo '<nombre>' o '<ab>/<cd>/<nombre>' (mismo formato que relative_from_url)
+    if relative_from_url(stored_name) != stored_name or stored_name.split("/")[-1] in ("", ".", ".."):
+        raise HTTPException(status_code=404, detail="File not found")
+    return await _serve_study_file(
+        resolve_path(STUDIES_DIR, stored_name), None, None, name or os.path.basename(stored_name),
+        download, if_none_match, if_modified_since
+    )
+
+async def _serve_study_file(
+    local_path: Path,
+    content_hash: Optional[str],
+    mime_type: Optional[str],
+    filename: str,
+    download: bool,
+    if_none_match: Optional[str],
+    if_modified_since: Optional[str],
+):
+    """FileResponse con Range, ETag / Last-Modified y 304 para un archivo de STUDIES_DIR."""
+    try:
+        stat_result = await run_in_file_pool(os.stat, local_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+
+    # Con hash de contenido el ETag es fuerte y estable; si no, mtime + tamaño
+    if content_hash:
+        etag = f'"{content_hash}"'
+    else:
+        etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(stat_result.st_mtime),
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(if_none_match, etag) or (
+        if_none_match is None and not_modified_since(if_modified_since, stat_result.st_mtime)
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return FileResponse(
+        local_path,
+        media_type=mime_type or None,
+        filename=filename,
+        stat_result=stat_result,
+        headers=headers,
+        content_disposition_type="attachment" if download else "inline",
+    )
+
+
+@router.get("/{study_id}/files/{file_id}/download", tags=["Studies"])
+@router.head("/{study_id}/files/{file_id}/download", tags=["Studies"])
+async def download_study_file(
+    study_id: str,
+    file_id: str,
+    download: bool = False,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    current_user: User = Depends(require_active_user),
+):
+    """
+    Sirve el archivo de un estudio desde la API, con control de acceso al paciente.
+    La autorización se hace una vez; el envío lo hace FileResponse (sendfile cuando
+    el servidor lo soporta) con Range / If-Range, ETag, Last-Modified y 304.
+    `?download=true` fuerza la descarga en lugar de mostrarlo inline.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
 
+    try:
+        row = db.execute(
+            text("""
+                SELECT s.patient_id, sf.file_path, sf.original_filename, sf.mime_type, sf.content_hash
+                FROM study_files sf
+                INNER JOIN studies s ON s.id = sf.study_id
+                WHERE sf.id = :fid AND sf.study_id = :sid
+            """),
+            {"fid": file_id, "sid": study_id}
+        ).mappings().first()
+        if not row or not row["file_path"]:
+            raise HTTPException(status_code=404, detail="File not found")
+        _check_access_to_patient(current_user, row["patient_id"], db)
     finally:
         db.close()
 
+    return await _serve_study_file(
+        resolve_path(STUDIES_DIR, row["file_path"]),
+        row["content_hash"],
+        row["mime_type"],
+        row["original_filename"] or os.path.basename(row["file_path"] or ""),
+        download,
+        if_none_match,
+        if_modified_since,
+    )
 
 @router.patch("/{study_id}", tags=["Studies"])
 async def update_study(
@@ -370,7 +1006,7 @@ async def update_study(
     
     try:
         row = db.execute(
-            text("SELECT created_by_user_id FROM studies WHERE id = :sid"),
+            text("SELECT created_by_user_id, assigned_to_user_id, lease_expires_at FROM studies WHERE id = :sid FOR UPDATE"),
             {"sid": study_id}
         ).mappings().first()
         
@@ -378,17 +1014,14 @@ async def update_study(
             raise HTTPException(status_code=404, detail="Study not found")
         
         if status is not None:
+            # Otro revisor lo tiene tomado de la cola con lease vigente
+            lease_expires_at = _as_datetime(row["lease_expires_at"])
+            lease_active = lease_expires_at is not None and lease_expires_at >= datetime.utcnow()
+            if lease_active and str(row["assigned_to_user_id"]) != str(current_user.id):
+                raise HTTPException(status_code=409, detail="Study is being reviewed by another professional")
             if current_user.role == "professional":
-                prof_row = db.execute(
-                    text("SELECT rol FROM professionals WHERE user_id = :uid LIMIT 1"),
-                    {"uid": current_user.id}
-                ).mappings().first()
-                if not prof_row:
-                    raise HTTPException(status_code=403, detail="Professional record not found")
-                
-                rol = prof_row["rol"]
-                if rol != "especialista":
-                    raise HTTPException(status_code=403, detail="Only specialists can change study status")
+                # Los mismos roles que toman estudios de la cola pueden cerrarlos
+                _require_reviewer(db, current_user)
         
         updates = []
         params = {"sid": study_id}
@@ -399,6 +1032,9 @@ async def update_study(
         if status is not None:
             updates.append("status = :status")
             params["status"] = status
+            # Al salir de la cola se cierra el lease; assigned_to_user_id queda como revisor
+            if status != STUDY_QUEUE_STATUS:
+                updates.append("lease_expires_at = NULL")
         
         if not updates:
             raise HTTPException(status_code=400, detail="No fields to update")
@@ -438,24 +1074,19 @@ async def delete_study(
             raise HTTPException(status_code=404, detail="Study not found")
         
         files = db.execute(
-            text("SELECT file_path FROM study_files WHERE study_id = :sid"),
+            text("SELECT file_path, content_hash FROM study_files WHERE study_id = :sid"),
             {"sid": study_id}
         ).mappings().all()
         
-        for f in files:
-            try:
-                # Resolve local path from potential URL
-                fname = os.path.basename(f["file_path"])
-                local_path = os.path.join(STUDIES_DIR, fname)
-                if os.path.exists(local_path):
-                    os.remove(local_path)
-            except Exception:
-                pass
+        # Solo se borran los archivos que ningún otro study_files referencia
+        unused = release_blobs(db, files)
         
         db.execute(text("DELETE FROM study_files WHERE study_id = :sid"), {"sid": study_id})
         db.execute(text("DELETE FROM studies WHERE id = :sid"), {"sid": study_id})
         db.commit()
         
+        remove_unused_blobs(db, STUDIES_DIR, unused)
+        
         return {"detail": "Study deleted successfully", "study_id": study_id}
     
     except HTTPException:
@@ -469,6 +1100,7 @@ async def delete_study(
 @router.post("/{study_id}/files", tags=["Studies"])
 async def upload_study_file(
     study_id: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user: User = Depends(require_active_user)
 ):
@@ -476,7 +1108,7 @@ async def upload_study_file(
     if db is None:
         raise HTTPException(status_code=500, detail="Database connection error")
     
-    file_path = None
+    written = []
     
     try:
         study = db.execute(
@@ -490,53 +1122,26 @@ async def upload_study_file(
         if current_user.role not in ("admin", "professional", "secretary"):
             raise HTTPException(status_code=403, detail="Only admin, secretary or professionals can upload files")
         
-        os.makedirs(STUDIES_DIR, exist_ok=True)
-        
-        file_id = str(uuid.uuid4())
-        file_extension = get_file_extension(file)
-        stored_filename = f"{file_id}{file_extension}"
-        file_path = os.path.join(STUDIES_DIR, stored_filename)
-        
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        size_bytes = len(content)
-        now = datetime.utcnow().isoformat()
-        
-        file_url = f"{DOMAIN_URL}/{stored_filename}"
-
-        db.execute(text("""
-            INSERT INTO study_files
-            (id, study_id, file_path, original_filename, mime_type, size_bytes, uploaded_at)
-            VALUES (:id, :study_id, :file_path, :original_filename, :mime_type, :size_bytes, :uploaded_at)
-        """), {
-            "id": file_id,
-            "study_id": study_id,
-            "file_path": file_url,
-            "original_filename": file.filename,
-            "mime_type": file.content_type,
-            "size_bytes": size_bytes,
-            "uploaded_at": now,
-        })
-        
+        file_rows, (uploaded,), written = await _ingest_study_files(db, study_id, [file])
+        insert_rows(db, "study_files", file_rows)
         db.commit()
+        background_tasks.add_task(_store_previews, _preview_jobs(file_rows))
         
         return {
             "detail": "File uploaded successfully",
-            "file_id": file_id,
+            "file_id": uploaded["id"],
             "filename": file.filename,
-            "size_bytes": size_bytes,
+            "size_bytes": uploaded["size_bytes"],
+            "deduplicated": uploaded["deduplicated"],
+            "write_ms": uploaded["write_ms"],
         }
     except HTTPException:
+        db.rollback()
+        _discard_new_blobs(db, written)
         raise
     except Exception as e:
         db.rollback()
-        try:
-            if file_path and os.path.exists(file_path):
-                os.remove(file_path)
-        except:
-            pass
+        _discard_new_blobs(db, written)
         raise HTTPException(status_code=500, detail="Error uploading file")
     finally:
         db.close()
@@ -553,21 +1158,14 @@ async def delete_study_file(
     
     try:
         file_row = db.execute(
-            text("SELECT file_path FROM study_files WHERE id = :fid AND study_id = :sid"),
+            text("SELECT file_path, content_hash FROM study_files WHERE id = :fid AND study_id = :sid"),
             {"fid": file_id, "sid": study_id}
         ).mappings().first()
         
         if not file_row:
             raise HTTPException(status_code=404, detail="File not found")
         
-        try:
-            # Resolve local path from potential URL
-            fname = os.path.basename(file_row["file_path"])
-            local_path = os.path.join(STUDIES_DIR, fname)
-            if os.path.exists(local_path):
-                os.remove(local_path)
-        except Exception:
-            pass
+        unused = release_blobs(db, [file_row])
         
         db.execute(
             text("DELETE FROM study_files WHERE id = :fid"),
@@ -575,6 +1173,8 @@ async def delete_study_file(
         )
         db.commit()
         
+        remove_unused_blobs(db, STUDIES_DIR, unused)
+        
         return {"detail": "File deleted successfully", "file_id": file_id}
     
     except HTTPException:
@@ -585,6 +1185,282 @@ async def delete_study_file(
     finally:
         db.close()
 
+# Uploads reanudables: crear sesión -> PUT de bloques en su offset -> complete
+
+def _upload_part_path(upload_id: str) -> Path:
+    return Path(STUDY_UPLOADS_DIR) / f"{upload_id}.part"
+
+def _get_upload_session(db, upload_id: str, current_user: User, lock: bool = False):
+    session = db.execute(
+        text(f"""
+            SELECT id, study_id, created_by_user_id, original_filename, mime_type, total_bytes, received_bytes
+            FROM study_upload_sessions WHERE id = :uid{' FOR UPDATE' if lock else ''}
+        """),
+        {"uid": upload_id}
+    ).mappings().first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if current_user.role != "admin" and session["created_by_user_id"] != current_user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return session
+
+def _upload_session_state(session, received_bytes: Optional[int] = None) -> dict:
+    received = session["received_bytes"] if received_bytes is None else received_bytes
+    return {
+        "upload_id": session["id"],
+        "study_id": session["study_id"],
+        "offset": received,
+        "total_bytes": session["total_bytes"],
+        "chunk_size": STUDY_UPLOAD_CHUNK_BYTES,
+        "complete": received == session["total_bytes"],
+    }
+
+def _purge_expired_uploads(db):
+    """Borra sesiones sin actividad por más de STUDY_UPLOAD_TTL_HOURS y sus .part."""
+    cutoff = datetime.utcnow() - timedelta(hours=STUDY_UPLOAD_TTL_HOURS)
+    expired = db.execute(
+        text("SELECT id FROM study_upload_sessions WHERE updated_at < :cutoff"),
+        {"cutoff": cutoff.strftime('%Y-%m-%d %H:%M:%S')}
+    ).scalars().all()
+    if expired:
+        db.execute(
+            text("DELETE FROM study_upload_sessions WHERE updated_at < :cutoff"),
+            {"cutoff": cutoff.strftime('%Y-%m-%d %H:%M:%S')}
+        )
+    # .part huérfanos (estudio borrado, sesión abortada a medias)
+    parts = Path(STUDY_UPLOADS_DIR).glob("*.part") if os.path.isdir(STUDY_UPLOADS_DIR) else []
+    stale = [p for p in parts if p.stem in expired or p.stat().st_mtime < cutoff.timestamp()]
+    return [_upload_part_path(i) for i in expired] + stale
+
+@router.post("/{study_id}/uploads", tags=["Studies"])
+async def create_upload_session(
+    study_id: str,
+    filename: str = Form(...),
+    size_bytes: int = Form(..., gt=0),
+    mime_type: Optional[str] = Form(default=None),
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    """
+    Inicia un upload reanudable de un archivo de `size_bytes` bytes. El cliente envía
+    después los bloques con PUT /studies/uploads/{upload_id}?offset=N y, si se corta,
+    consulta GET /studies/uploads/{upload_id} para saber desde qué offset seguir.
+    """
+    if size_bytes > STUDY_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"{filename} exceeds the maximum size of {STUDY_MAX_UPLOAD_BYTES} bytes")
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        study = db.execute(text("SELECT id, patient_id FROM studies WHERE id = :sid"), {"sid": study_id}).mappings().first()
+        if not study:
+            raise HTTPException(status_code=404, detail="Study not found")
+        _check_access_to_patient(current_user, study["patient_id"], db)
+
+        stale_parts = _purge_expired_uploads(db)
+        upload_id = str(uuid.uuid4())
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        session = {
+            "id": upload_id,
+            "study_id": study_id,
+            "created_by_user_id": current_user.id,
+            "original_filename": filename,
+            "mime_type": mime_type or mimetypes.guess_type(filename)[0],
+            "total_bytes": size_bytes,
+            "received_bytes": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        insert_rows(db, "study_upload_sessions", [session])
+        db.commit()
+        await run_in_file_pool(remove_files, stale_parts)
+        return _upload_session_state(session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error creating upload session: {str(e)}")
+    finally:
+        db.close()
+
+@router.get("/uploads/{upload_id}", tags=["Studies"])
+async def get_upload_session(
+    upload_id: str,
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    """Estado del upload: offset desde el que el cliente debe continuar."""
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+    try:
+        return _upload_session_state(_get_upload_session(db, upload_id, current_user))
+    finally:
+        db.close()
+
+@router.put("/uploads/{upload_id}", tags=["Studies"])
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    """
+    Recibe un bloque (cuerpo crudo, application/octet-stream) y lo escribe en su offset
+    dentro del .part. El offset debe ser el que informa la sesión; si no, 409 con el
+    offset correcto. El cuerpo se escribe a medida que llega, nunca entero en memoria.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    try:
+        # Sin locks mientras llega el cuerpo: se valida el offset en una transacción corta
+        # y al final se avanza con compare-and-set sobre el offset esperado
+        session = _get_upload_session(db, upload_id, current_user)
+        db.commit()
+        if offset != session["received_bytes"]:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Offset mismatch", "offset": session["received_bytes"]}
+            )
+
+        part_path = _upload_part_path(upload_id)
+        position, buffered, pending, received = offset, [], 0, 0
+        async for piece in request.stream():
+            if not piece:
+                continue
+            received += len(piece)
+            if received > STUDY_UPLOAD_CHUNK_BYTES:
+                raise HTTPException(status_code=413, detail=f"Chunks are limited to {STUDY_UPLOAD_CHUNK_BYTES} bytes")
+            if offset + received > session["total_bytes"]:
+                raise HTTPException(status_code=413, detail="Chunk exceeds the declared file size")
+            buffered.append(piece)
+            pending += len(piece)
+            # Se escribe cada ~1 MB para no acumular todo el bloque en memoria
+            if pending >= 1024 * 1024:
+                position = await run_in_file_pool(write_at_offset, part_path, position, buffered)
+                buffered, pending = [], 0
+        position = await run_in_file_pool(write_at_offset, part_path, position, buffered)
+
+        result = db.execute(
+            text("""
+                UPDATE study_upload_sessions SET received_bytes = :received, updated_at = :now
+                WHERE id = :uid AND received_bytes = :offset
+            """),
+            {"received": position, "now": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), "uid": upload_id, "offset": offset}
+        )
+        if result.rowcount == 0:
+            # Otro PUT del mismo offset ganó (o la sesión se cerró): el cliente retoma desde el actual
+            db.rollback()
+            current = _get_upload_session(db, upload_id, current_user)
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Offset mismatch", "offset": current["received_bytes"]}
+            )
+        db.commit()
+        return _upload_session_state(session, position)
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error writing chunk: {str(e)}")
+    finally:
+        db.close()
+
+@router.post("/uploads/{upload_id}/complete", tags=["Studies"])
+async def complete_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    sha256: Optional[str] = Form(default=None),
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    """
+    Cierra el upload: el .part se renombra dentro de STUDIES_DIR (sin copiar) como blob
+    de su contenido, o se descarta si ese contenido ya estaba guardado, y se registra
+    como un study_files del estudio. Si se envía `sha256` se verifica antes.
+    """
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+
+    final_path = None
+    try:
+        session = _get_upload_session(db, upload_id, current_user, lock=True)
+        if session["received_bytes"] != session["total_bytes"]:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Upload is incomplete", "offset": session["received_bytes"]}
+            )
+
+        part_path = _upload_part_path(upload_id)
+        content_hash = await run_in_file_pool(hash_file, part_path)
+        if sha256 and sha256.lower() != content_hash:
+            raise HTTPException(status_code=422, detail="sha256 does not match the uploaded content")
+
+        file_id = str(uuid.uuid4())
+        os.makedirs(STUDIES_DIR, exist_ok=True)
+        blob_path, is_new = claim_blob(
+            db, Path(STUDIES_DIR), part_path, content_hash,
+            _extension_for(session["original_filename"], session["mime_type"]), session["total_bytes"]
+        )
+        final_path = blob_path if is_new else None
+
+        stored = StoredUpload(blob_path, session["total_bytes"], content_hash)
+        row = _study_file_row(session["study_id"], file_id, session["original_filename"], session["mime_type"], stored)
+        insert_rows(db, "study_files", [row])
+        db.execute(text("DELETE FROM study_upload_sessions WHERE id = :uid"), {"uid": upload_id})
+        db.commit()
+        final_path = None
+        if not is_new:
+            # Contenido ya guardado: el .part era una copia
+            await run_in_file_pool(remove_files, [part_path])
+        background_tasks.add_task(_store_previews, _preview_jobs([row]))
+
+        return {
+            "detail": "File uploaded successfully",
+            "file_id": file_id,
+            "study_id": session["study_id"],
+            "filename": session["original_filename"],
+            "size_bytes": stored.size_bytes,
+            "deduplicated": not is_new,
+            "url": row["file_path"],
+        }
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        if final_path and os.path.exists(final_path):
+            # Se devuelve al .part para que el cliente pueda reintentar el complete
+            restore_unclaimed_blob(db, Path(STUDIES_DIR), final_path, _upload_part_path(upload_id))
+        raise HTTPException(status_code=500, detail=f"Error completing upload: {str(e)}")
+    finally:
+        db.close()
+
+@router.delete("/uploads/{upload_id}", tags=["Studies"])
+async def abort_upload(
+    upload_id: str,
+    current_user: User = Depends(require_roles("admin", "professional", "secretary"))
+):
+    db = getConnectionForLogin()
+    if db is None:
+        raise HTTPException(status_code=500, detail="Database connection error")
+    try:
+        _get_upload_session(db, upload_id, current_user)
+        db.execute(text("DELETE FROM study_upload_sessions WHERE id = :uid"), {"uid": upload_id})
+        db.commit()
+        await run_in_file_pool(remove_files, [_upload_part_path(upload_id)])
+        return {"detail": "Upload aborted", "upload_id": upload_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail="Error aborting upload")
+    finally:
+        db.close()
+
 # Studies admin
 
 @router.post("/admin/create_study_category", tags=["Studies Admin"])
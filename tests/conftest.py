@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Los tests importan utils.* / routers.* desde la raíz del repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Database.getConnection arma el engine al importarse (no conecta): alcanza con una URL válida
+os.environ.setdefault("HOST", "localhost")
+os.environ.setdefault("PORT", "3306")
+
+# Los routers crean sus directorios de archivos al importarse: que no toquen los reales
+_FILES_DIR = tempfile.mkdtemp(prefix="vitalis-tests-")
+for _name in ("STUDIES_DIR", "STUDIES_ADMIN_DIR", "SIGNATURES_DIR", "DATA_IMAGES_DIR", "PDF_CACHE_DIR"):
+    os.environ.setdefault(_name, os.path.join(_FILES_DIR, _name.lower()))
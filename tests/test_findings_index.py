@@ -0,0 +1,153 @@
+from typing import Optional
+
+import numpy as np
+import pytest
+from pydantic import BaseModel
+
+from utils.findings_index import FindingsIndex, FindingsIndexCache, FindingsLayout
+
+
+class Dental(BaseModel):
+    caries: Optional[bool] = None
+    observaciones: Optional[str] = None
+    protesis: bool = False
+
+
+class Cardio(BaseModel):
+    soplos: Optional[bool] = None
+    arritmia: Optional[bool] = None
+    f1: Optional[bool] = None
+    f2: Optional[bool] = None
+    f3: Optional[bool] = None
+    f4: Optional[bool] = None
+    f5: Optional[bool] = None
+    f6: Optional[bool] = None
+    f7: Optional[bool] = None  # noveno campo: la sección ocupa dos bytes
+
+
+class Skin(BaseModel):
+    caries: Optional[bool] = None  # mismo nombre que en Dental: solo por nombre completo
+    tattoo: Optional[bool] = None
+
+
+class NoFindings(BaseModel):
+    observaciones: Optional[str] = None
+
+
+@pytest.fixture
+def layout():
+    return FindingsLayout({"dental": Dental, "cardio": Cardio, "skin": Skin, "other": NoFindings})
+
+
+def _index(layout, records):
+    """records: {record_id: {tabla: fila}}"""
+    index = FindingsIndex(layout, seq=1)
+    index.upsert(
+        [(record_id, f"p-{record_id}") for record_id in records],
+        [
+            (record_id, table, layout.pack(table, row))
+            for record_id, sections in records.items()
+            for table, row in sections.items()
+        ],
+    )
+    return index
+
+
+def _ids(index, mask):
+    return sorted(np.array(index.record_ids)[mask].tolist())
+
+
+def test_layout_fields_and_offsets(layout):
+    assert layout.fields == {
+        "dental": ["caries", "protesis"],
+        "cardio": ["soplos", "arritmia", "f1", "f2", "f3", "f4", "f5", "f6", "f7"],
+        "skin": ["caries", "tattoo"],
+    }
+    assert layout.offsets == {"dental": 0, "cardio": 1, "skin": 3}
+    assert layout.row_bytes == 4
+
+
+def test_layout_positions(layout):
+    assert layout.position("soplos") == (1, 7)
+    assert layout.position("cardio.f7") == (2, 7)
+    assert layout.position("skin.caries") == (3, 7)
+    with pytest.raises(ValueError):
+        layout.position("caries")  # ambiguo entre dental y skin
+    with pytest.raises(ValueError):
+        layout.position("unknown")
+
+
+def test_pack(layout):
+    assert layout.pack("dental", {"caries": True, "protesis": None}) == bytes([0b10000000])
+    assert layout.pack("cardio", {"arritmia": 1, "f7": True}) == bytes([0b01000000, 0b10000000])
+    assert layout.pack("other", {"observaciones": "x"}) is None
+
+
+def test_evaluate_and_or_not(layout):
+    index = _index(layout, {
+        "r1": {"dental": {"caries": True}, "cardio": {"soplos": True}},
+        "r2": {"dental": {"caries": True}},
+        "r3": {"cardio": {"soplos": True, "f7": True}, "skin": {"tattoo": True}},
+        "r4": {},
+    })
+    assert _ids(index, index.evaluate("dental.caries")) == ["r1", "r2"]
+    assert _ids(index, index.evaluate({"and": ["dental.caries", "soplos"]})) == ["r1"]
+    assert _ids(index, index.evaluate({"or": ["dental.caries", "tattoo"]})) == ["r1", "r2", "r3"]
+    assert _ids(index, index.evaluate({"not": "soplos"})) == ["r2", "r4"]
+    assert _ids(index, index.evaluate({"AND": ["f7", {"not": "dental.caries"}]})) == ["r3"]
+
+
+@pytest.mark.parametrize("expr", [{"xor": ["soplos"]}, {"and": []}, {"and": "soplos", "or": ["f1"]}, 3])
+def test_evaluate_rejects_invalid_expressions(layout, expr):
+    index = _index(layout, {"r1": {}})
+    with pytest.raises(ValueError):
+        index.evaluate(expr)
+
+
+def test_upsert_replaces_record_and_remove_hides_it(layout):
+    index = _index(layout, {"r1": {"dental": {"caries": True}}, "r2": {"dental": {"caries": True}}})
+
+    # Reemplazo completo: las secciones que no vienen quedan en cero
+    index.upsert([("r1", "p-otro")], [("r1", "skin", layout.pack("skin", {"tattoo": True}))])
+    assert _ids(index, index.evaluate("dental.caries")) == ["r2"]
+    assert _ids(index, index.evaluate("tattoo")) == ["r1"]
+    assert index.patient_ids[index.rows["r1"]] == "p-otro"
+
+    index.remove(["r2", "missing"])
+    assert _ids(index, index.evaluate("dental.caries")) == []
+    assert _ids(index, index.evaluate({"not": "tattoo"})) == []
+
+    # Un registro borrado que vuelve a aparecer reutiliza su fila
+    index.upsert([("r2", "p-r2")], [("r2", "dental", layout.pack("dental", {"caries": True}))])
+    assert _ids(index, index.evaluate("dental.caries")) == ["r2"]
+    assert len(index.record_ids) == 2
+
+
+def test_upsert_ignores_unknown_sections_and_truncates_long_bits(layout):
+    index = FindingsIndex(layout, seq=1)
+    index.upsert(
+        [("r1", "p1"), ("r2", "p2")],
+        [
+            ("r1", "other", b"\xff"),
+            ("missing", "dental", b"\xff"),
+            ("r2", "dental", b"\xff\xff"),  # bits de más: no pisan la sección siguiente
+            ("r2", "cardio", None),
+        ],
+    )
+    assert index.matrix.tolist() == [[0, 0, 0, 0], [255, 0, 0, 0]]
+
+
+def test_cache_lru_and_ttl(layout, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("utils.findings_index.time.monotonic", lambda: now[0])
+    cache = FindingsIndexCache(max_scopes=2, ttl=60)
+    a, b, c = (FindingsIndex(layout, seq=i) for i in range(3))
+    cache.put("a", a)
+    cache.put(None, b)
+    assert cache.get("a") is a  # "a" pasa a ser el más reciente
+    cache.put("c", c)
+    assert cache.get(None) is None
+    assert cache.get("a") is a and cache.get("c") is c
+
+    now[0] += 61
+    assert cache.get("a") is None
@@ -0,0 +1,37 @@
+import pytest
+
+from utils.http_cache import etag_matches, http_date, not_modified_since
+
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize("header", [
+    '"abc123"',
+    'W/"abc123"',
+    '"other", "abc123"',
+    '"other",W/"abc123"',
+    '*',
+])
+def test_etag_matches(header):
+    assert etag_matches(header, ETAG)
+
+
+@pytest.mark.parametrize("header", [None, "", '"other"', "abc123", '"abc1234"', 'W/"other", "x"'])
+def test_etag_does_not_match(header):
+    assert not etag_matches(header, ETAG)
+
+
+def test_not_modified_since():
+    mtime = 1_700_000_000.7
+    assert not_modified_since(http_date(1_700_000_000), mtime)  # resolución de segundos
+    assert not_modified_since(http_date(1_700_000_100), mtime)
+    assert not not_modified_since(http_date(1_699_999_999), mtime)
+
+
+@pytest.mark.parametrize("header", [None, "", "not a date"])
+def test_not_modified_since_ignores_missing_or_invalid_header(header):
+    assert not not_modified_since(header, 0)
+
+
+def test_http_date():
+    assert http_date(0) == "Thu, 01 Jan 1970 00:00:00 GMT"
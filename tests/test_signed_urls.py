@@ -0,0 +1,48 @@
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from utils.signed_urls import sign_url, verify_url
+
+PATH = "/studies/files/signed/ab/cd/blob.pdf"
+NOW = 1_700_000_000
+
+
+def _params(url):
+    query = parse_qs(urlsplit(url).query)
+    return {key: values[0] for key, values in query.items()}
+
+
+def test_sign_and_verify():
+    url, expires = sign_url(PATH, "u1", "informe final.pdf", ttl=60, now=NOW)
+    params = _params(url)
+    assert url.startswith(PATH + "?")
+    assert expires == NOW + 60 and params["expires"] == str(expires)
+    assert params["uid"] == "u1" and params["name"] == "informe final.pdf"
+    assert verify_url(PATH, expires, "u1", params["sig"], params["name"], now=NOW + 60)
+
+
+def test_name_is_optional():
+    url, expires = sign_url(PATH, "u1", ttl=60, now=NOW)
+    params = _params(url)
+    assert "name" not in params
+    assert verify_url(PATH, expires, "u1", params["sig"], now=NOW)
+
+
+def test_expired():
+    url, expires = sign_url(PATH, "u1", ttl=60, now=NOW)
+    assert not verify_url(PATH, expires, "u1", _params(url)["sig"], now=NOW + 61)
+
+
+@pytest.mark.parametrize("field, value", [
+    ("path", "/studies/files/signed/ab/cd/other.pdf"),
+    ("expires", NOW + 3600),
+    ("user_id", "u2"),
+    ("name", "otro.pdf"),
+    ("sig", "A" * 43),
+])
+def test_tampered_values_are_rejected(field, value):
+    url, expires = sign_url(PATH, "u1", "informe.pdf", ttl=60, now=NOW)
+    args = {"path": PATH, "expires": expires, "user_id": "u1", "sig": _params(url)["sig"], "name": "informe.pdf"}
+    args[field] = value
+    assert not verify_url(**args, now=NOW)
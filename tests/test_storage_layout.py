@@ -0,0 +1,68 @@
+import hashlib
+
+import pytest
+
+from utils import storage_layout
+from utils.storage_layout import file_url, relative_from_url, relative_path, resolve_path, shard_prefix
+
+DOMAIN = "https://example.org/api/studies/files/public"
+
+
+def test_shard_prefix():
+    digest = hashlib.md5(b"blob.pdf").hexdigest()
+    assert shard_prefix("blob.pdf") == f"{digest[:2]}/{digest[2:4]}"
+
+
+def test_relative_path(monkeypatch):
+    monkeypatch.setattr(storage_layout, "STORAGE_SHARDING", True)
+    assert relative_path("blob.pdf") == f"{shard_prefix('blob.pdf')}/blob.pdf"
+    monkeypatch.setattr(storage_layout, "STORAGE_SHARDING", False)
+    assert relative_path("blob.pdf") == "blob.pdf"
+
+
+@pytest.mark.parametrize("url, expected", [
+    (f"{DOMAIN}/ab/cd/blob.pdf", "ab/cd/blob.pdf"),
+    (f"{DOMAIN}/blob.pdf", "blob.pdf"),
+    (f"{DOMAIN}/ab/cd/blob.pdf/", "ab/cd/blob.pdf"),
+    ("ab/cd/blob.pdf", "ab/cd/blob.pdf"),
+    ("blob.pdf", "blob.pdf"),
+    # Solo cuentan como shard dos niveles de dos dígitos hex
+    (f"{DOMAIN}/xy/cd/blob.pdf", "blob.pdf"),
+    (f"{DOMAIN}/abc/cd/blob.pdf", "blob.pdf"),
+    ("cd/blob.pdf", "blob.pdf"),
+])
+def test_relative_from_url(url, expected):
+    assert relative_from_url(url) == expected
+
+
+def test_file_url():
+    assert file_url(DOMAIN + "/", "ab/cd/blob.pdf") == f"{DOMAIN}/ab/cd/blob.pdf"
+
+
+def test_resolve_path_prefers_the_url_layout(tmp_path):
+    prefix = shard_prefix("blob.pdf")
+    sharded = tmp_path / prefix / "blob.pdf"
+    sharded.parent.mkdir(parents=True)
+    sharded.write_bytes(b"x")
+    (tmp_path / "blob.pdf").write_bytes(b"x")
+    assert resolve_path(tmp_path, f"{DOMAIN}/{prefix}/blob.pdf") == sharded
+    assert resolve_path(tmp_path, f"{DOMAIN}/blob.pdf") == tmp_path / "blob.pdf"
+
+
+def test_resolve_path_falls_back_to_the_other_layout(tmp_path):
+    prefix = shard_prefix("blob.pdf")
+    # URL vieja (plana) con el archivo ya migrado
+    sharded = tmp_path / prefix / "blob.pdf"
+    sharded.parent.mkdir(parents=True)
+    sharded.write_bytes(b"x")
+    assert resolve_path(tmp_path, f"{DOMAIN}/blob.pdf") == sharded
+
+    # URL nueva con el archivo todavía en la raíz
+    (tmp_path / "flat.pdf").write_bytes(b"x")
+    assert resolve_path(tmp_path, f"{DOMAIN}/{shard_prefix('flat.pdf')}/flat.pdf") == tmp_path / "flat.pdf"
+
+
+def test_resolve_path_missing_file(tmp_path):
+    assert resolve_path(tmp_path, f"{DOMAIN}/ab/cd/missing.pdf") == tmp_path / "ab/cd/missing.pdf"
+    assert resolve_path(tmp_path, None) is None
+    assert resolve_path(tmp_path, "") is None
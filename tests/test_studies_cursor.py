@@ -0,0 +1,31 @@
+import base64
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from routers.studies import _decode_cursor, _encode_cursor
+
+
+@pytest.mark.parametrize("created_at", [datetime(2024, 1, 5, 10, 30, 0), "2024-01-05 10:30:00"])
+def test_round_trip(created_at):
+    cursor = _encode_cursor({"created_at": created_at, "id": "3f2b-study|with-pipe"})
+    assert _decode_cursor(cursor) == ("2024-01-05 10:30:00", "3f2b-study|with-pipe")
+
+
+def test_cursor_is_url_safe():
+    cursor = _encode_cursor({"created_at": "2024-01-05 10:30:00", "id": "??>>~~"})
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"2024-01-05 10:30:00").decode(),  # sin id
+    base64.urlsafe_b64encode(b"yesterday|abc").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe|abc").decode(),
+    "ñ",
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor)
+    assert exc.value.status_code == 400
@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+import pytest
+
+from utils.vitals_store import VITAL_NAMES, VitalsStore
+
+
+def _record(record_id, **values):
+    return (record_id, *[values.get(name) for name in VITAL_NAMES])
+
+
+@pytest.fixture
+def store():
+    store = VitalsStore(seq=1)
+    store.upsert([
+        _record("r1", imc=20, saturacion=98, freq_cardiaca=50),
+        _record("r2", imc=30, saturacion=93),
+        _record("r3", imc=25, freq_cardiaca=110),
+        _record("r4"),
+    ])
+    return store
+
+
+def test_upsert_keeps_missing_values_as_nan(store):
+    assert store.matrix.shape == (4, len(VITAL_NAMES))
+    row = store.matrix[store.rows["r4"]]
+    assert np.isnan(row).all()
+    assert store.matrix[store.rows["r1"], VITAL_NAMES.index("imc")] == 20
+
+
+def test_stats(store):
+    imc = store.stats(["imc"], [50, 90], bins=2)["imc"]
+    assert imc["count"] == 3
+    assert imc["mean"] == 25
+    assert imc["min"] == 20 and imc["max"] == 30
+    assert imc["percentiles"] == {"p50": 25, "p90": 29}
+    assert imc["histogram"] == {"edges": [20, 25, 30], "counts": [1, 2]}
+    assert imc["reference_range"] == {"min": 18.5, "max": 25.0}
+    assert (imc["below_range"], imc["above_range"]) == (0, 1)
+    assert math.isclose(imc["std"], round(float(np.std([20, 25, 30])), 3))
+
+
+def test_stats_one_sided_range_and_empty(store):
+    stats = store.stats(["saturacion", "freq_cardiaca", "talla"], [50], bins=4)
+    assert (stats["saturacion"]["below_range"], stats["saturacion"]["above_range"]) == (1, 0)
+    assert (stats["freq_cardiaca"]["below_range"], stats["freq_cardiaca"]["above_range"]) == (1, 1)
+    assert stats["talla"] == {"count": 0}
+
+
+def test_upsert_replaces_and_remove_excludes(store):
+    store.upsert([_record("r2", imc=22)])
+    assert store.stats(["imc"], [50], bins=1)["imc"]["max"] == 25
+    assert np.isnan(store.matrix[store.rows["r2"], VITAL_NAMES.index("saturacion")])
+
+    store.remove(["r1", "missing"])
+    assert store.stats(["imc"], [50], bins=1)["imc"]["count"] == 2
+
+    # Vuelve a aparecer en la misma fila
+    store.upsert([_record("r1", imc=40)])
+    assert len(store.record_ids) == 4
+    assert store.stats(["imc"], [50], bins=1)["imc"]["max"] == 40
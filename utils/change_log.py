@@ -0,0 +1,47 @@
+import os
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import event
+
+# Change log de medical_records (medical_record_changes, ver GET /medical-records/changes).
+# seq es AUTO_INCREMENT y se asigna al insertar: transacciones concurrentes pueden hacer
+# commit fuera de orden (el 11 visible antes que el 10). Los lectores solo avanzan hasta
+# los cambios con changed_at más viejo que CHANGES_COMMIT_LAG_SECONDS, y para que eso
+# alcance toda transacción que escribe en el change log tiene que hacer commit dentro de
+# CHANGES_MAX_WRITE_SECONDS desde su primer cambio (si no, el commit se rechaza y se
+# deshace). La diferencia entre ambos cubre la latencia del commit y el desfasaje de
+# reloj entre servidores de la API. CHANGES_COMMIT_LAG_SECONDS = 0 desactiva las dos
+# cosas (solo para desarrollo: el feed puede saltear cambios).
+CHANGES_COMMIT_LAG_SECONDS = int(os.getenv("CHANGES_COMMIT_LAG_SECONDS", "10"))
+CHANGES_MAX_WRITE_SECONDS = min(
+    float(os.getenv("CHANGES_MAX_WRITE_SECONDS", "5")), CHANGES_COMMIT_LAG_SECONDS / 2
+)
+
+
+def _check_write_window(session):
+    started = session.info.get("change_log_started")
+    if started is None or CHANGES_MAX_WRITE_SECONDS <= 0:
+        return
+    if time.monotonic() - started > CHANGES_MAX_WRITE_SECONDS:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Transaction exceeded {CHANGES_MAX_WRITE_SECONDS:g}s after writing the change log; retry",
+        )
+
+
+def _reset_write_window(session):
+    session.info.pop("change_log_started", None)
+
+
+def track_change_log(db):
+    """
+    Llamar justo antes de armar / escribir filas del change log. Desde ahí la transacción
+    tiene CHANGES_MAX_WRITE_SECONDS para hacer commit.
+    """
+    if not db.info.get("change_log_guard"):
+        event.listen(db, "before_commit", _check_write_window)
+        event.listen(db, "after_commit", _reset_write_window)
+        event.listen(db, "after_rollback", _reset_write_window)
+        db.info["change_log_guard"] = True
+    db.info.setdefault("change_log_started", time.monotonic())
@@ -0,0 +1,66 @@
+import base64
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+# Imágenes chicas (firmas, data images) servidas inline como data URI
+EMBED_MAX_FILE_BYTES = int(os.getenv("EMBED_MAX_FILE_BYTES", str(64 * 1024)))
+EMBED_CACHE_BYTES = int(os.getenv("EMBED_CACHE_BYTES", str(16 * 1024 * 1024)))
+
+
+class DataUriCache:
+    """
+    LRU en memoria de archivos chicos ya codificados como data URI, acotado por bytes.
+    Los archivos de firmas / data images tienen nombre único (uuid o hash de contenido)
+    y no se reescriben con otro contenido, así que la ruta alcanza como clave.
+    """
+
+    def __init__(self, max_bytes: int = EMBED_CACHE_BYTES, max_file_bytes: int = EMBED_MAX_FILE_BYTES):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self._entries: "OrderedDict[Path, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_path: Path) -> Optional[str]:
+        """Data URI cacheado (sin tocar el disco) o None."""
+        with self._lock:
+            data_uri = self._entries.get(file_path)
+            if data_uri is not None:
+                self._entries.move_to_end(file_path)
+            return data_uri
+
+    def load(self, file_path: Path) -> Optional[str]:
+        """
+        Lee el archivo y lo cachea si no supera el umbral. Devuelve None si no existe
+        o es demasiado grande. Bloqueante: correr en el pool de archivos.
+        """
+        cached = self.get(file_path)
+        if cached is not None:
+            return cached
+        try:
+            if os.path.getsize(file_path) > self.max_file_bytes:
+                return None
+            with open(file_path, "rb") as f:
+                data = f.read(self.max_file_bytes + 1)
+        except OSError:
+            return None
+        if len(data) > self.max_file_bytes:
+            return None
+
+        mime = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+        data_uri = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        with self._lock:
+            if file_path not in self._entries:
+                self._entries[file_path] = data_uri
+                self._size += len(data_uri)
+                while self._size > self.max_bytes and self._entries:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        return data_uri
+
+
+data_uri_cache = DataUriCache()
@@ -0,0 +1,302 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import UploadFile
+from sqlalchemy import event
+
+from utils.image_processing import (
+    ImageProfile, KEEP_ORIGINAL_IMAGES, normalize_image, original_copies, original_path, run_in_image_pool
+)
+
+# Pool acotado para la escritura de archivos (no bloquea el event loop)
+FILE_IO_WORKERS = int(os.getenv("FILE_IO_WORKERS", "8"))
+_file_io_pool = ThreadPoolExecutor(max_workers=FILE_IO_WORKERS, thread_name_prefix="file-io")
+
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Uploads grandes (estudios): copia por bloques con tamaño y hash incrementales
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+class UploadTooLargeError(ValueError):
+    """El upload supera el tamaño máximo permitido."""
+
+    def __init__(self, filename: Optional[str], max_bytes: int):
+        super().__init__(f"{filename or 'file'} exceeds the maximum size of {max_bytes} bytes")
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class StoredUpload:
+    path: Path
+    size_bytes: int
+    sha256: str
+
+
+def _write_upload(upload: UploadFile, file_path: Path):
+    """
+    Copia el contenido del upload al disco y hace fsync del archivo.
+    Corre en un thread del pool.
+    """
+    upload.file.seek(0)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(upload.file, buffer, COPY_BUFFER_SIZE)
+        buffer.flush()
+        os.fsync(buffer.fileno())
+
+
+def _read_upload(upload: UploadFile) -> bytes:
+    upload.file.seek(0)
+    data = upload.file.read()
+    upload.file.seek(0)
+    return data
+
+
+def _write_bytes(data: bytes, file_path: Path):
+    """Escribe bytes al disco con fsync. Corre en un thread del pool."""
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_path, "wb") as buffer:
+        buffer.write(data)
+        buffer.flush()
+        os.fsync(buffer.fileno())
+
+
+def _fsync_directory(directory: Path):
+    """fsync del directorio para que las entradas nuevas queden persistidas."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # p.ej. Windows no permite abrir directorios
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _spool_size(upload: UploadFile) -> Optional[int]:
+    """Tamaño del upload si ya está completo en un archivo temporal (sin leerlo)."""
+    spool = upload.file
+    if isinstance(spool, tempfile.SpooledTemporaryFile):
+        if not getattr(spool, "_rolled", False):
+            return None
+        spool = spool._file
+    try:
+        return os.fstat(spool.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def stream_upload(upload: UploadFile, file_path: Path, max_bytes: Optional[int] = None) -> StoredUpload:
+    """
+    Guarda un upload en file_path sin cargarlo entero en memoria: lee por bloques de
+    UPLOAD_CHUNK_SIZE acumulando tamaño y SHA-256, y corta apenas se supera max_bytes.
+    Se escribe a un temporal en el mismo directorio que se renombra al final.
+    Corre en un thread del pool.
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    spooled_size = _spool_size(upload)
+    if max_bytes is not None and spooled_size is not None and spooled_size > max_bytes:
+        raise UploadTooLargeError(upload.filename, max_bytes)
+
+    digest = hashlib.sha256()
+    size = 0
+    upload.file.seek(0)
+    tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.part")
+    try:
+        with open(tmp_path, "wb") as buffer:
+            while chunk := upload.file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLargeError(upload.filename, max_bytes)
+                digest.update(chunk)
+                buffer.write(chunk)
+            buffer.flush()
+            os.fsync(buffer.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        upload.file.seek(0)
+    return StoredUpload(file_path, size, digest.hexdigest())
+
+
+def write_at_offset(file_path: Path, offset: int, chunks: List[bytes]) -> int:
+    """
+    Escribe bloques contiguos en file_path a partir de offset (pwrite, sin reescribir lo
+    anterior). Lo que hubiera después de offset se descarta primero (reintento de un
+    bloque que quedó a medias). Devuelve el nuevo tamaño. Corre en un thread del pool.
+    """
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        os.ftruncate(fd, offset)
+        position = offset
+        for chunk in chunks:
+            written = 0
+            while written < len(chunk):
+                written += os.pwrite(fd, memoryview(chunk)[written:], position + written)
+            position += len(chunk)
+        os.fsync(fd)
+        return position
+    finally:
+        os.close(fd)
+
+
+def hash_file(file_path: Path) -> str:
+    """SHA-256 de un archivo leído por bloques. Corre en un thread del pool."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_files(paths: List[Path]):
+    """
+    Borra archivos del disco (y el original conservado de cada imagen normalizada).
+    Se usa tanto en commit/rollback del batch como en background tasks post-commit.
+    """
+    paths = [p for file_path in paths for p in (Path(file_path), *original_copies(file_path))]
+    for file_path in paths:
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                print(f"File deleted: {file_path}")
+        except Exception as e:
+            print(f"Error deleting file {file_path}: {e}")
+
+
+async def run_in_file_pool(func, *args):
+    """Ejecuta una función bloqueante de I/O de archivos en el pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_file_io_pool, func, *args)
+
+
+async def normalize_upload(upload: UploadFile, profile: ImageProfile) -> Optional[bytes]:
+    """
+    Normaliza una imagen subida (en el pool de imágenes) antes de elegir su nombre, así
+    la extensión corresponde a lo que se guarda. None si no se pudo decodificar: el
+    upload se guarda tal cual, con su propia extensión.
+    """
+    data = await run_in_file_pool(_read_upload, upload)
+    return await run_in_image_pool(normalize_image, data, profile)
+
+
+class UploadBatch:
+    """
+    Persiste un conjunto de uploads en disco de forma concurrente y ata su ciclo
+    de vida a la transacción de la sesión:
+    - commit: los archivos quedan; los marcados con delete_after_commit se borran.
+    - rollback: los archivos escritos por el batch se borran.
+    """
+
+    def __init__(self, db=None):
+        self._pending: List[tuple] = []
+        self.written: List[Path] = []
+        self._delete_after_commit: List[Path] = []
+        if db is not None:
+            event.listen(db, "after_commit", self._on_commit)
+            event.listen(db, "after_rollback", self._on_rollback)
+
+    def add(
+        self,
+        upload: UploadFile,
+        directory: Path,
+        filename: str,
+        shared: bool = False,
+        normalized: Optional[bytes] = None,
+    ) -> Path:
+        """
+        Registra un upload para escribirlo en directory/filename. Devuelve la ruta destino.
+        - **shared**: archivo direccionado por contenido que otras transacciones pueden
+          referenciar; no se borra en rollback.
+        - **normalized**: imagen ya normalizada (normalize_upload) que se escribe en lugar del upload.
+        """
+        file_path = Path(directory) / filename
+        self._pending.append((upload, file_path, shared, normalized))
+        return file_path
+
+    def delete_after_commit(self, file_path: Optional[Path]):
+        """Borra un archivo existente solo si la transacción hace commit."""
+        if file_path:
+            self._delete_after_commit.append(Path(file_path))
+
+    async def persist(self):
+        """
+        Escribe en paralelo todos los uploads registrados. Cada archivo hace fsync
+        en su thread; después se hace un fsync por directorio para todo el lote.
+        Si alguna escritura falla, se borra lo escrito y se relanza el error.
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        results = await asyncio.gather(
+            *(self._persist_one(upload, file_path, normalized) for upload, file_path, _, normalized in pending),
+            return_exceptions=True
+        )
+
+        errors = []
+        for (upload, file_path, shared, _), result in zip(pending, results):
+            if isinstance(result, BaseException):
+                errors.append((upload, result))
+            elif not shared:
+                self.written.extend(result)
+
+        if errors:
+            self.discard()
+            upload, error = errors[0]
+            raise OSError(f"Error saving {upload.filename}: {error}") from error
+
+        directories = {path.parent for paths in results for path in paths}
+        await asyncio.gather(*(run_in_file_pool(_fsync_directory, d) for d in directories))
+
+    async def _persist_one(self, upload: UploadFile, file_path: Path, normalized: Optional[bytes]) -> List[Path]:
+        """Escribe un upload (o su versión normalizada) y devuelve las rutas creadas."""
+        if normalized is None:
+            await run_in_file_pool(_write_upload, upload, file_path)
+            return [file_path]
+        if not KEEP_ORIGINAL_IMAGES:
+            await run_in_file_pool(_write_bytes, normalized, file_path)
+            return [file_path]
+
+        keep = original_path(file_path, upload)
+        results = await asyncio.gather(
+            run_in_file_pool(_write_bytes, normalized, file_path),
+            run_in_file_pool(_write_upload, upload, keep),
+            return_exceptions=True
+        )
+        error = next((r for r in results if isinstance(r, BaseException)), None)
+        if error:
+            remove_files([file_path, keep])
+            raise error
+        return [file_path, keep]
+
+    def discard(self):
+        """Borra los archivos escritos por el batch (rollback manual)."""
+        written, self.written = self.written, []
+        remove_files(written)
+        self._delete_after_commit = []
+
+    def _on_commit(self, session):
+        self.written = []
+        to_delete, self._delete_after_commit = self._delete_after_commit, []
+        remove_files(to_delete)
+
+    def _on_rollback(self, session):
+        self.discard()
@@ -0,0 +1,174 @@
+import os
+import time
+import typing
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+# Índice bitmap de hallazgos booleanos (caries, soplos, rales, tattoo, ...):
+# cada sección se guarda como un bitset empaquetado (np.packbits) en
+# medical_record_findings, y por empresa se arma en memoria una matriz
+# registros x bytes sobre la que los filtros AND / OR / NOT se evalúan vectorizados.
+FINDINGS_INDEX_TTL = int(os.getenv("FINDINGS_INDEX_TTL", "600"))
+FINDINGS_INDEX_MAX_SCOPES = int(os.getenv("FINDINGS_INDEX_MAX_SCOPES", "32"))
+
+
+class FindingsLayout:
+    """
+    Posición de cada hallazgo booleano: sección -> campos (en el orden del modelo)
+    y offset en bytes de la sección dentro de la fila del índice.
+    Los campos nuevos de un modelo deben agregarse al final para no mover los bits existentes.
+    """
+
+    def __init__(self, section_models: Dict[str, typing.Type[BaseModel]]):
+        self.fields: Dict[str, List[str]] = {}
+        for table, model in section_models.items():
+            names = [
+                name for name, field in model.model_fields.items()
+                if field.annotation is bool or bool in typing.get_args(field.annotation)
+            ]
+            if names:
+                self.fields[table] = names
+
+        self.offsets: Dict[str, int] = {}
+        offset = 0
+        for table, names in self.fields.items():
+            self.offsets[table] = offset
+            offset += (len(names) + 7) // 8
+        self.row_bytes = offset
+
+        # Nombre corto (solo el campo) cuando no es ambiguo entre secciones
+        counts: Dict[str, int] = {}
+        for names in self.fields.values():
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        self._positions: Dict[str, Tuple[int, int]] = {}
+        for table, names in self.fields.items():
+            for i, name in enumerate(names):
+                position = (self.offsets[table] + i // 8, 7 - i % 8)
+                self._positions[f"{table}.{name}"] = position
+                if counts[name] == 1:
+                    self._positions[name] = position
+
+    def pack(self, table: str, row: dict) -> Optional[bytes]:
+        """Bitset empaquetado de los hallazgos de una fila de sección (None/0 -> bit apagado)."""
+        names = self.fields.get(table)
+        if not names:
+            return None
+        return np.packbits(np.array([bool(row.get(name)) for name in names], dtype=bool)).tobytes()
+
+    def position(self, finding: str) -> Tuple[int, int]:
+        """(byte, shift) de un hallazgo; acepta 'seccion.campo' o el campo solo si es único."""
+        try:
+            return self._positions[finding]
+        except KeyError:
+            raise ValueError(f"Unknown finding: {finding}")
+
+
+class FindingsIndex:
+    """
+    Matriz uint8 (registros x row_bytes) de un alcance (empresa o global), con
+    actualización incremental por registro y evaluación vectorizada de filtros.
+    """
+
+    def __init__(self, layout: FindingsLayout, seq: int):
+        self.layout = layout
+        self.seq = seq
+        self.built_at = time.monotonic()
+        self.record_ids: List[str] = []
+        self.patient_ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix = np.zeros((0, layout.row_bytes), dtype=np.uint8)
+        self.alive = np.zeros(0, dtype=bool)
+
+    def upsert(self, records: Iterable[Tuple[str, str]], section_bits: Iterable[Tuple[str, str, bytes]]):
+        """
+        Carga / reemplaza registros completos. records: (record_id, patient_id);
+        section_bits: (record_id, sección, bits) tal como están en medical_record_findings.
+        """
+        new_rows = []
+        for record_id, patient_id in records:
+            record_id = str(record_id)
+            row = self.rows.get(record_id)
+            if row is None:
+                row = len(self.record_ids) + len(new_rows)
+                self.rows[record_id] = row
+                new_rows.append((record_id, str(patient_id)))
+            else:
+                self.patient_ids[row] = str(patient_id)
+                self.matrix[row, :] = 0
+                self.alive[row] = True
+        if new_rows:
+            self.record_ids.extend(r for r, _ in new_rows)
+            self.patient_ids.extend(p for _, p in new_rows)
+            self.matrix = np.vstack([self.matrix, np.zeros((len(new_rows), self.layout.row_bytes), dtype=np.uint8)])
+            self.alive = np.concatenate([self.alive, np.ones(len(new_rows), dtype=bool)])
+
+        for record_id, table, bits in section_bits:
+            row = self.rows.get(str(record_id))
+            offset = self.layout.offsets.get(table)
+            if row is None or offset is None or bits is None:
+                continue
+            data = np.frombuffer(bytes(bits), dtype=np.uint8)
+            width = min(len(data), (len(self.layout.fields[table]) + 7) // 8)
+            self.matrix[row, offset:offset + width] = data[:width]
+
+    def remove(self, record_ids: Iterable[str]):
+        for record_id in record_ids:
+            row = self.rows.get(str(record_id))
+            if row is not None:
+                self.alive[row] = False
+                self.matrix[row, :] = 0
+
+    def column(self, finding: str) -> np.ndarray:
+        """Vector booleano (un valor por registro) de un hallazgo."""
+        byte, shift = self.layout.position(finding)
+        return ((self.matrix[:, byte] >> shift) & 1).astype(bool)
+
+    def evaluate(self, expr: Any) -> np.ndarray:
+        """
+        Evalúa un filtro: "hallazgo" | {"and": [...]} | {"or": [...]} | {"not": expr}.
+        Devuelve la máscara booleana de registros (solo registros vigentes).
+        """
+        return self._evaluate(expr) & self.alive
+
+    def _evaluate(self, expr: Any) -> np.ndarray:
+        if isinstance(expr, str):
+            return self.column(expr)
+        if isinstance(expr, dict) and len(expr) == 1:
+            op, args = next(iter(expr.items()))
+            op = op.lower()
+            if op == "not":
+                return ~self._evaluate(args)
+            if op in ("and", "or") and isinstance(args, list) and args:
+                masks = [self._evaluate(arg) for arg in args]
+                reducer = np.logical_and if op == "and" else np.logical_or
+                return reducer.reduce(masks)
+        raise ValueError(f"Invalid filter expression: {expr!r}")
+
+
+class FindingsIndexCache:
+    """Índices por alcance (company_id o None = todos), LRU y con TTL para rearmado completo."""
+
+    def __init__(self, max_scopes: int = FINDINGS_INDEX_MAX_SCOPES, ttl: int = FINDINGS_INDEX_TTL):
+        self.max_scopes = max_scopes
+        self.ttl = ttl
+        self._indexes: "OrderedDict[Optional[str], FindingsIndex]" = OrderedDict()
+
+    def get(self, scope: Optional[str]) -> Optional[FindingsIndex]:
+        index = self._indexes.get(scope)
+        if index is None:
+            return None
+        if time.monotonic() - index.built_at > self.ttl:
+            del self._indexes[scope]
+            return None
+        self._indexes.move_to_end(scope)
+        return index
+
+    def put(self, scope: Optional[str], index: FindingsIndex):
+        self._indexes[scope] = index
+        self._indexes.move_to_end(scope)
+        while len(self._indexes) > self.max_scopes:
+            self._indexes.popitem(last=False)
@@ -0,0 +1,34 @@
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Compara el header If-None-Match (puede traer varios ETags o '*') con el ETag actual.
+    """
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    for candidate in candidates:
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def not_modified_since(if_modified_since: Optional[str], mtime: float) -> bool:
+    """True si el archivo no cambió desde If-Modified-Since (resolución de segundos)."""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
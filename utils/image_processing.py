@@ -0,0 +1,130 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from fastapi import UploadFile
+from PIL import Image, ImageOps
+
+# Normalización de imágenes subidas (firmas, data_img): orientación EXIF,
+# reducción a una caja máxima y re-codificación a WebP / PNG8.
+IMAGE_NORMALIZATION = os.getenv("IMAGE_NORMALIZATION", "1") == "1"
+KEEP_ORIGINAL_IMAGES = os.getenv("KEEP_ORIGINAL_IMAGES", "0") == "1"
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(os.cpu_count() or 2)))
+
+ORIGINALS_DIRNAME = "originals"
+
+# Tipos que se decodifican; el resto (pdf, svg, gif animado...) se guarda tal cual.
+# HEIC / HEIF solo si está instalado pillow-heif (Pillow no los decodifica solo).
+NORMALIZABLE_CONTENT_TYPES = {"image/jpeg", "image/png", "image/webp", "image/bmp", "image/tiff"}
+try:
+    from pillow_heif import register_heif_opener
+
+    register_heif_opener()
+    NORMALIZABLE_CONTENT_TYPES |= {"image/heic", "image/heif"}
+except ImportError:
+    pass
+
+_image_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _env_size(name: str, default: str) -> Tuple[int, int]:
+    """Lee una caja 'ANCHOxALTO' de una variable de entorno."""
+    width, height = os.getenv(name, default).lower().split("x")
+    return int(width), int(height)
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """Caja máxima y formato de salida para un tipo de imagen."""
+    max_size: Tuple[int, int]
+    format: str  # "WEBP" o "PNG8"
+    quality: int = 80
+
+    @property
+    def extension(self) -> str:
+        return ".webp" if self.format == "WEBP" else ".png"
+
+
+# Firmas: trazos sobre fondo liso -> PNG con paleta (chico y sin artefactos)
+SIGNATURE_IMAGE_PROFILE = ImageProfile(
+    max_size=_env_size("SIGNATURE_MAX_SIZE", "1000x400"),
+    format=os.getenv("SIGNATURE_IMAGE_FORMAT", "PNG8").upper(),
+)
+
+# Data images: fotos -> WebP con pérdida
+DATA_IMAGE_PROFILE = ImageProfile(
+    max_size=_env_size("DATA_IMAGE_MAX_SIZE", "1600x1600"),
+    format=os.getenv("DATA_IMAGE_FORMAT", "WEBP").upper(),
+    quality=int(os.getenv("DATA_IMAGE_QUALITY", "80")),
+)
+
+# Estudios: miniatura para galerías y preview para visualización web (derivados del original)
+STUDY_THUMBNAIL_PROFILE = ImageProfile(
+    max_size=_env_size("STUDY_THUMBNAIL_SIZE", "320x320"),
+    format="WEBP",
+    quality=int(os.getenv("STUDY_THUMBNAIL_QUALITY", "70")),
+)
+STUDY_PREVIEW_PROFILE = ImageProfile(
+    max_size=_env_size("STUDY_PREVIEW_SIZE", "1280x1280"),
+    format="WEBP",
+    quality=int(os.getenv("STUDY_PREVIEW_QUALITY", "80")),
+)
+
+
+def is_normalizable(upload: UploadFile) -> bool:
+    """True si el upload es una imagen que el pipeline puede re-codificar."""
+    return IMAGE_NORMALIZATION and (upload.content_type or "").lower() in NORMALIZABLE_CONTENT_TYPES
+
+
+def normalize_image(data: bytes, profile: ImageProfile) -> Optional[bytes]:
+    """
+    Decodifica, orienta, reduce y re-codifica una imagen. Corre en un proceso del pool.
+    Devuelve None si los bytes no se pueden decodificar como imagen.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG: decodifica directo a una escala reducida (mucho más rápido en fotos grandes)
+            box = max(profile.max_size)
+            img.draft("RGB", (box, box))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail(profile.max_size, Image.Resampling.LANCZOS)
+
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+            out = io.BytesIO()
+            if profile.format == "WEBP":
+                img = img.convert("RGBA" if has_alpha else "RGB")
+                img.save(out, "WEBP", quality=profile.quality, method=4)
+            else:
+                img = img.convert("RGBA").quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+                img.save(out, "PNG", optimize=True)
+            return out.getvalue()
+    except Exception as e:
+        print(f"Image normalisation skipped: {e}")
+        return None
+
+
+async def run_in_image_pool(func, *args):
+    """Ejecuta trabajo de CPU (decodificar / re-codificar imágenes) en el pool de procesos."""
+    global _image_pool
+    if _image_pool is None:
+        _image_pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_image_pool, func, *args)
+
+
+def original_path(file_path: Path, upload: UploadFile) -> Path:
+    """Ruta donde se conserva el original de una imagen normalizada."""
+    source_ext = os.path.splitext(upload.filename or "")[1].lower() or ".bin"
+    return file_path.parent / ORIGINALS_DIRNAME / f"{file_path.stem}{source_ext}"
+
+
+def original_copies(file_path: Path) -> List[Path]:
+    """Originales conservados para un archivo normalizado (si los hay)."""
+    originals_dir = Path(file_path).parent / ORIGINALS_DIRNAME
+    if not originals_dir.is_dir():
+        return []
+    return list(originals_dir.glob(f"{Path(file_path).stem}.*"))
@@ -0,0 +1,194 @@
+import asyncio
+import os
+import tempfile
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Render de un medical_record completo a PDF (matplotlib, backend Agg).
+# Corre en un pool de procesos; el resultado se cachea en disco por versión.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+
+PDF_CACHE_DIR_ENV = os.getenv("PDF_CACHE_DIR")
+if PDF_CACHE_DIR_ENV:
+    PDF_CACHE_DIR = Path(PDF_CACHE_DIR_ENV)
+else:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    PDF_CACHE_DIR = Path(os.path.join(BASE_DIR, "pdf_cache"))
+
+PAGE_SIZE = (8.27, 11.69)  # A4 en pulgadas
+MARGIN = 0.06
+LINE_HEIGHT = 0.0145  # fracción de la altura de la página
+WRAP_WIDTH = 110
+IMAGE_HEIGHT = 0.16
+
+SKIP_FIELDS = {"id", "medical_record_id", "medical_record_data_id", "url", "data_uri", "professional_signature_id"}
+
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[Path, asyncio.Future] = {}
+
+
+def pdf_cache_path(record_id: str, version: int) -> Path:
+    return PDF_CACHE_DIR / f"{record_id}-v{version}.pdf"
+
+
+def _label(name: str) -> str:
+    return name.replace("medical_record_", "").replace("_", " ").strip().capitalize()
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return "Sí" if value else "No"
+    if isinstance(value, datetime):
+        return value.strftime("%d/%m/%Y %H:%M")
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    return str(value)
+
+
+def _record_blocks(record: dict, images: Dict[str, str]) -> List[tuple]:
+    """
+    Arma la lista de bloques a dibujar: ("title"|"heading"|"line", texto) e
+    ("image", etiqueta, ruta). Las secciones vacías no se imprimen.
+    """
+    data = record.get("medical_record_data") or {}
+    blocks = [("title", "Historia clínica")]
+    header = [v for v in (data.get("complete_name"), f"DNI {data['dni']}" if data.get("dni") else None) if v]
+    if header:
+        blocks.append(("line", " - ".join(str(v) for v in header)))
+
+    for section, values in record.items():
+        if not isinstance(values, dict) or section in images:
+            continue
+        lines = [
+            f"{_label(field)}: {_format_value(value)}"
+            for field, value in values.items()
+            if field not in SKIP_FIELDS and value not in (None, "")
+        ]
+        if not lines:
+            continue
+        blocks.append(("heading", _label(section)))
+        for line in lines:
+            for wrapped in textwrap.wrap(line, WRAP_WIDTH) or [""]:
+                blocks.append(("line", wrapped))
+        if section == "medical_record_data" and "medical_record_data_img" in images:
+            blocks.append(("image", "Imagen", images["medical_record_data_img"]))
+
+    signatures = [(table, path) for table, path in images.items() if table != "medical_record_data_img"]
+    if signatures:
+        blocks.append(("heading", "Firmas"))
+        for table, path in signatures:
+            blocks.append(("image", _label(table), path))
+    return blocks
+
+
+def render_record_pdf(record: dict, images: Dict[str, str], output_path: str) -> str:
+    """
+    Dibuja el registro (secciones, data image, firmas) en un PDF A4 paginado.
+    Escribe en un temporal y lo renombra, así nunca se sirve un PDF a medio escribir.
+    Corre en un proceso del pool.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.image as mpimg
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_path.parent, suffix=".pdf.tmp")
+    os.close(fd)
+
+    try:
+        with PdfPages(tmp_path) as pdf:
+            fig, y = None, 0.0
+
+            def new_page():
+                nonlocal fig, y
+                if fig is not None:
+                    pdf.savefig(fig)
+                    plt.close(fig)
+                fig = plt.figure(figsize=PAGE_SIZE)
+                y = 1 - MARGIN
+
+            new_page()
+            for block in _record_blocks(record, images):
+                kind = block[0]
+                needed = IMAGE_HEIGHT + LINE_HEIGHT if kind == "image" else LINE_HEIGHT * (2 if kind != "line" else 1)
+                if y - needed < MARGIN:
+                    new_page()
+
+                if kind == "title":
+                    fig.text(MARGIN, y, block[1], fontsize=16, weight="bold", va="top")
+                    y -= LINE_HEIGHT * 2
+                elif kind == "heading":
+                    y -= LINE_HEIGHT * 0.5
+                    fig.text(MARGIN, y, block[1], fontsize=11, weight="bold", va="top")
+                    y -= LINE_HEIGHT * 1.5
+                elif kind == "line":
+                    fig.text(MARGIN, y, block[1], fontsize=8.5, va="top", family="DejaVu Sans")
+                    y -= LINE_HEIGHT
+                else:
+                    _, label, path = block
+                    fig.text(MARGIN, y, label, fontsize=8.5, va="top")
+                    try:
+                        ax = fig.add_axes([MARGIN, y - LINE_HEIGHT - IMAGE_HEIGHT, 0.4, IMAGE_HEIGHT])
+                        ax.imshow(mpimg.imread(path))
+                        ax.set_anchor("W")
+                        ax.axis("off")
+                    except Exception as e:
+                        print(f"PDF: could not draw image {path}: {e}")
+                    y -= LINE_HEIGHT + IMAGE_HEIGHT
+
+            pdf.savefig(fig)
+            plt.close(fig)
+
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return str(output_path)
+
+
+async def run_in_pdf_pool(func, *args):
+    """Ejecuta el render en el pool de procesos (CPU, no bloquea el event loop)."""
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pdf_pool, func, *args)
+
+
+async def get_or_render_pdf(record: dict, images: Dict[str, str], record_id: str, version: int) -> Path:
+    """
+    Devuelve el PDF cacheado para (record_id, version) o lo renderiza.
+    Requests concurrentes por la misma versión esperan el mismo render.
+    Al generar una versión nueva se borran los PDFs de versiones anteriores.
+    """
+    path = pdf_cache_path(record_id, version)
+    if path.exists():
+        return path
+
+    pending = _inflight.get(path)
+    if pending is None:
+        pending = asyncio.ensure_future(run_in_pdf_pool(render_record_pdf, record, images, str(path)))
+        _inflight[path] = pending
+        pending.add_done_callback(lambda _: _inflight.pop(path, None))
+    await asyncio.shield(pending)
+
+    remove_cached_pdfs([record_id], keep=path)
+    return path
+
+
+def remove_cached_pdfs(record_ids: List[str], keep: Optional[Path] = None):
+    """Borra los PDFs cacheados (todas las versiones) de los registros, salvo keep."""
+    for record_id in record_ids:
+        for cached in PDF_CACHE_DIR.glob(f"{record_id}-v*.pdf"):
+            if cached != keep:
+                try:
+                    os.remove(cached)
+                except OSError:
+                    pass
@@ -0,0 +1,39 @@
+import base64
+import hashlib
+import hmac
+import os
+import time
+from typing import Optional
+from urllib.parse import urlencode
+
+from auth.authentication import SECRET_KEY
+
+# URLs de descarga firmadas (HMAC-SHA256) y con vencimiento: se verifican solo con CPU,
+# sin consultar la base. La clave se deriva de SECRET_KEY salvo que se configure aparte.
+FILE_URL_SECRET = (os.getenv("FILE_URL_SECRET") or hmac.new(SECRET_KEY.encode(), b"signed-file-urls", hashlib.sha256).hexdigest()).encode()
+FILE_URL_TTL = int(os.getenv("FILE_URL_TTL", "300"))
+
+
+def _signature(path: str, expires: int, user_id: str, name: str) -> str:
+    message = "\n".join((path, str(expires), user_id, name)).encode()
+    digest = hmac.new(FILE_URL_SECRET, message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def sign_url(path: str, user_id: str, name: str = "", ttl: int = FILE_URL_TTL, now: Optional[float] = None) -> tuple:
+    """
+    Firma `path` para `user_id` por `ttl` segundos. Devuelve (url, expires).
+    `name` (nombre original para Content-Disposition) también queda firmado.
+    """
+    expires = int(now if now is not None else time.time()) + ttl
+    query = {"expires": expires, "uid": user_id, "sig": _signature(path, expires, user_id, name)}
+    if name:
+        query["name"] = name
+    return f"{path}?{urlencode(query)}", expires
+
+
+def verify_url(path: str, expires: int, user_id: str, sig: str, name: str = "", now: Optional[float] = None) -> bool:
+    """True si la firma corresponde a (path, expires, user_id, name) y no venció."""
+    if expires < (now if now is not None else time.time()):
+        return False
+    return hmac.compare_digest(_signature(path, expires, user_id, name), sig)
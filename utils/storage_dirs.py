@@ -0,0 +1,34 @@
+import os
+from pathlib import Path
+
+# Directorios base de los archivos subidos, compartidos por los routers y por
+# utils.storage_migration. Cada router crea el suyo al importarse.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Firmas
+SIGNATURES_DIR_ENV = os.getenv("SIGNATURES_DIR")
+if SIGNATURES_DIR_ENV:
+    SIGNATURES_DIR = Path(SIGNATURES_DIR_ENV)
+elif os.name == 'posix':
+    SIGNATURES_DIR = Path("/home/iweb/vitalis/data/signatures/")
+else:
+    SIGNATURES_DIR = Path(os.path.join(BASE_DIR, "signatures"))
+
+# Tablas de firmas de un medical_record (cada fila apunta a un archivo de SIGNATURES_DIR)
+SIGNATURE_TABLES = [
+    "medical_record_signatures", "medical_record_laboral_signatures",
+    "medical_record_patient_signatures", "medical_record_medical_responsable_signatures"
+]
+
+# Data images
+DATA_IMAGES_DIR_ENV = os.getenv("DATA_IMAGES_DIR")
+if DATA_IMAGES_DIR_ENV:
+    DATA_IMAGES_DIR = Path(DATA_IMAGES_DIR_ENV)
+else:
+    DATA_IMAGES_DIR = Path(os.path.join(BASE_DIR, "data_images"))
+
+# Estudios
+STUDIES_DIR = os.getenv("STUDIES_DIR", "/home/iweb/vitalis/data/studies/")
+if os.name != 'posix' and not os.getenv("STUDIES_DIR"):
+    # Fallback for windows dev
+    STUDIES_DIR = os.path.join(BASE_DIR, "studies")
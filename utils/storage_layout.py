@@ -0,0 +1,56 @@
+import hashlib
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+# Layout de los directorios de archivos (estudios, firmas, data images): los archivos
+# nuevos van en dos niveles de subdirectorios <ab>/<cd>/<nombre>, con ab/cd tomados del
+# md5 del nombre, para que ningún directorio junte millones de entradas. La URL pública
+# lleva la misma ruta relativa. Los archivos previos siguen en la raíz hasta que se
+# migran (python -m utils.storage_migration); el resolver acepta ambos layouts.
+STORAGE_SHARDING = os.getenv("STORAGE_SHARDING", "1") == "1"
+
+SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+
+
+def shard_prefix(name: str) -> str:
+    digest = hashlib.md5(name.encode(), usedforsecurity=False).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}"
+
+
+def relative_path(name: str) -> str:
+    """Ruta relativa (dentro del directorio base y de la URL) para un archivo nuevo."""
+    return f"{shard_prefix(name)}/{name}" if STORAGE_SHARDING else name
+
+
+def relative_from_url(url: str) -> str:
+    """Ruta relativa de una URL pública: '<ab>/<cd>/<nombre>' o solo '<nombre>' (layout plano)."""
+    parts = url.rstrip("/").split("/")
+    if len(parts) >= 3 and SHARD_RE.match(parts[-3]) and SHARD_RE.match(parts[-2]):
+        return "/".join(parts[-3:])
+    return parts[-1]
+
+
+def file_url(domain_url: str, relative: str) -> str:
+    return f"{domain_url.rstrip('/')}/{relative}"
+
+
+def resolve_path(base_directory: Path, url_or_relative: Optional[str]) -> Optional[Path]:
+    """
+    Ruta local de un archivo a partir de su URL (o ruta relativa), en cualquiera de los
+    dos layouts: primero donde indica la URL y, si no está (migración en curso), en el
+    otro layout. Si no existe en ninguno se devuelve la ruta indicada por la URL.
+    """
+    if not url_or_relative:
+        return None
+    base_directory = Path(base_directory)
+    relative = relative_from_url(url_or_relative)
+    path = base_directory / relative
+    if path.exists():
+        return path
+    name = path.name
+    for candidate in (base_directory / name, base_directory / shard_prefix(name) / name):
+        if candidate != path and candidate.exists():
+            return candidate
+    return path
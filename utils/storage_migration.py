@@ -0,0 +1,222 @@
+"""
+Migración online de firmas, data images y estudios al layout con subdirectorios
+(ver utils.storage_layout).
+
+Recorre por lotes (keyset por clave primaria) las tablas que guardan URLs de archivos;
+por cada archivo que sigue en la raíz crea un hard link en su shard (con sus originales
+y previews), reescribe las URLs de la fila y hace commit del lote. Mientras tanto el
+archivo responde en las dos rutas. Al terminar cada directorio se borran las entradas
+planas que ya tienen su link en el shard y que ninguna fila sigue referenciando.
+Se puede cortar y volver a correr.
+
+    python -m utils.storage_migration --batch-size 500
+    python -m utils.storage_migration --dry-run
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from Database.getConnection import getConnectionForLogin
+from utils.image_processing import ORIGINALS_DIRNAME, original_copies
+from utils.storage_dirs import DATA_IMAGES_DIR, SIGNATURE_TABLES, SIGNATURES_DIR, STUDIES_DIR
+from utils.storage_layout import SHARD_RE, relative_from_url, shard_prefix
+from utils.study_previews import preview_files
+
+# (tabla, clave, columnas): la primera columna es el archivo principal; el resto
+# (miniatura / preview) van al mismo shard que él
+MigrationTarget = Tuple[str, str, List[str]]
+
+TARGETS: Dict[str, Tuple[Path, List[MigrationTarget]]] = {
+    "signatures": (
+        Path(SIGNATURES_DIR),
+        [(table, "id", ["url"]) for table in SIGNATURE_TABLES] + [("professional_signatures", "id", ["url"])],
+    ),
+    "data_images": (Path(DATA_IMAGES_DIR), [("medical_record_data_img", "id", ["url"])]),
+    "studies": (
+        Path(STUDIES_DIR),
+        # study_blobs primero: sus nombres son los que reclaman los uploads nuevos
+        [
+            ("study_blobs", "content_hash", ["stored_name"]),
+            ("study_files", "id", ["file_path", "thumbnail_path", "preview_path"]),
+        ],
+    ),
+}
+
+
+def _is_flat(value: Optional[str]) -> bool:
+    return bool(value) and "/" not in relative_from_url(value)
+
+
+def _sharded(value: Optional[str], prefix: str) -> Optional[str]:
+    """Misma URL (o nombre) con el archivo dentro de <prefix>/."""
+    if not _is_flat(value):
+        return value
+    name = relative_from_url(value)
+    return f"{value[:-len(name)]}{prefix}/{name}"
+
+
+def _link(source: Path, target: Path):
+    """Deja el archivo accesible en target; si ya estaba o no existe, no hace nada."""
+    if target.exists() or not source.exists():
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        os.replace(source, target)  # sin hard links (otro filesystem): se mueve
+
+
+def _link_with_companions(base_dir: Path, name: str, prefix: str):
+    """Link del archivo, sus originales conservados y sus derivados de preview."""
+    source = base_dir / name
+    shard_dir = base_dir / prefix
+    _link(source, shard_dir / name)
+    for original in original_copies(source):
+        _link(original, shard_dir / ORIGINALS_DIRNAME / original.name)
+    for derived in preview_files(source):
+        _link(derived, shard_dir / derived.name)
+
+
+def _migrate_table(db, base_dir: Path, target: MigrationTarget, batch_size: int, dry_run: bool) -> int:
+    """Migra las filas con archivos planos de una tabla. Devuelve la cantidad de filas."""
+    table, key, columns = target
+    anchor = columns[0]
+    migrated, after = 0, None
+    while True:
+        rows = db.execute(
+            text(f"""
+                SELECT {key}, {", ".join(columns)} FROM {table}
+                WHERE {anchor} IS NOT NULL {f"AND {key} > :after" if after is not None else ""}
+                ORDER BY {key} LIMIT :limit
+            """),
+            {"after": after, "limit": batch_size}
+        ).mappings().all()
+        if not rows:
+            return migrated
+        after = rows[-1][key]
+
+        updates = []
+        for row in rows:
+            if not _is_flat(row[anchor]):
+                continue
+            prefix = shard_prefix(relative_from_url(row[anchor]))
+            if not dry_run:
+                for column in columns:
+                    if _is_flat(row[column]):
+                        _link_with_companions(base_dir, relative_from_url(row[column]), prefix)
+            updates.append({
+                "key": row[key],
+                **{c: _sharded(row[c], prefix) for c in columns},
+                **{f"old_{c}": row[c] for c in columns},
+            })
+
+        skipped = 0
+        if updates and not dry_run:
+            # Solo si la fila sigue como se leyó: el writer de previews y los PATCH / upserts
+            # de firmas corren mientras tanto; las filas que cambiaron quedan para otra corrida
+            result = db.execute(
+                text(f"""
+                    UPDATE {table} SET {", ".join(f"{c} = :{c}" for c in columns)}
+                    WHERE {key} = :key {"".join(f" AND {c} <=> :old_{c}" for c in columns)}
+                """),
+                updates
+            )
+            db.commit()
+            skipped = len(updates) - result.rowcount
+        migrated += len(updates) - skipped
+        if updates:
+            print(f"{table}: {migrated} rows {'pending' if dry_run else 'migrated'}"
+                  + (f" ({skipped} changed meanwhile, retry later)" if skipped else ""))
+
+
+def _flat_stems(db, targets: List[MigrationTarget], batch_size: int) -> Set[str]:
+    """Stems de los archivos que alguna fila todavía referencia en la raíz."""
+    stems = set()
+    for table, key, columns in targets:
+        after = None
+        while True:
+            rows = db.execute(
+                text(f"""
+                    SELECT {key}, {", ".join(columns)} FROM {table}
+                    {f"WHERE {key} > :after" if after is not None else ""}
+                    ORDER BY {key} LIMIT :limit
+                """),
+                {"after": after, "limit": batch_size}
+            ).mappings().all()
+            if not rows:
+                break
+            after = rows[-1][key]
+            for row in rows:
+                stems.update(Path(relative_from_url(row[c])).stem for c in columns if _is_flat(row[c]))
+        db.commit()
+    return stems
+
+
+def _is_referenced(name: str, stems: Set[str]) -> bool:
+    """El archivo, sus originales (<stem>.ext) y sus previews (<stem>.kind.ext) comparten el stem."""
+    parts = name.split(".")
+    return any(".".join(parts[:i]) in stems for i in range(1, len(parts)))
+
+
+def _remove_flat_links(db, base_dir: Path, targets: List[MigrationTarget], batch_size: int) -> int:
+    """
+    Borra las entradas de la raíz (y de originals/) que ya tienen su link en un shard,
+    salvo las que alguna fila sigue referenciando por el nombre plano.
+    """
+    stems = _flat_stems(db, targets, batch_size)
+    removed = 0
+    for first in os.scandir(base_dir):
+        if not (first.is_dir() and SHARD_RE.match(first.name)):
+            continue
+        for second in os.scandir(first.path):
+            if not (second.is_dir() and SHARD_RE.match(second.name)):
+                continue
+            shard_dir = Path(second.path)
+            for directory, flat_dir in ((shard_dir, base_dir), (shard_dir / ORIGINALS_DIRNAME, base_dir / ORIGINALS_DIRNAME)):
+                if not directory.is_dir():
+                    continue
+                for entry in os.scandir(directory):
+                    flat = flat_dir / entry.name
+                    try:
+                        if _is_referenced(entry.name, stems):
+                            continue
+                        if entry.is_file() and flat.is_file() and os.path.samefile(entry.path, flat):
+                            os.remove(flat)
+                            removed += 1
+                    except OSError as e:
+                        print(f"Warning: could not remove {flat}: {e}")
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Solo cuenta las filas pendientes")
+    parser.add_argument("--only", choices=sorted(TARGETS), nargs="+", default=sorted(TARGETS))
+    args = parser.parse_args()
+
+    db = getConnectionForLogin()
+    if db is None:
+        raise SystemExit("Database connection error")
+    try:
+        for group in args.only:
+            base_dir, targets = TARGETS[group]
+            started = time.perf_counter()
+            total = sum(_migrate_table(db, base_dir, t, args.batch_size, args.dry_run) for t in targets)
+            removed = 0 if args.dry_run else _remove_flat_links(db, base_dir, targets, args.batch_size)
+            print(f"{group}: {total} rows, {removed} flat files removed in {time.perf_counter() - started:.1f}s")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
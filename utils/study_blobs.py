@@ -0,0 +1,170 @@
+import os
+import re
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Mapping, Tuple
+
+from sqlalchemy import bindparam, text
+
+from utils.storage_layout import relative_from_url, relative_path, resolve_path
+from utils.study_previews import preview_files
+
+# Archivos de estudios direccionados por contenido: un único archivo <sha256><ext> por
+# contenido (study_blobs) con contador de referencias; cada study_files apunta al blob
+# por content_hash y file_path. Cuando se va la última referencia la fila queda con
+# ref_count = 0 y, después del commit, remove_unused_blobs borra archivo y fila bajo el
+# lock de la fila: un upload concurrente del mismo contenido espera ese lock y nunca
+# se queda apuntando a un archivo que se está borrando. Lo mismo vale para los blobs
+# recién creados de una transacción que falla: no se borran directo después del rollback.
+BLOB_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def blob_name(content_hash: str, extension: str) -> str:
+    """Ruta relativa a STUDIES_DIR del blob (en su subdirectorio de shard)."""
+    return relative_path(f"{content_hash}{extension}")
+
+
+def claim_blob(db, directory: Path, source: Path, content_hash: str, extension: str, size_bytes: int) -> Tuple[Path, bool]:
+    """
+    Suma una referencia al blob de content_hash (lo crea si no existe) dentro de la
+    transacción de db. Si el archivo del blob todavía no está en disco, source se
+    renombra como blob y se devuelve (ruta, True); si ya existe, source sobra y se
+    devuelve (ruta, False) para que el llamador lo borre.
+    El INSERT ... ON DUPLICATE KEY bloquea la fila: dos uploads del mismo contenido
+    se serializan y solo uno mueve su archivo. Una fila con ref_count = 0 pendiente de
+    remove_unused_blobs vuelve a usarse (el borrado ve ref_count > 0 y conserva el archivo).
+    """
+    db.execute(
+        text("""
+            INSERT INTO study_blobs (content_hash, stored_name, size_bytes, ref_count, created_at)
+            VALUES (:hash, :name, :size, 1, :now)
+            ON DUPLICATE KEY UPDATE ref_count = ref_count + 1
+        """),
+        {
+            "hash": content_hash,
+            "name": blob_name(content_hash, extension),
+            "size": size_bytes,
+            "now": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+    )
+    stored_name = db.execute(
+        text("SELECT stored_name FROM study_blobs WHERE content_hash = :hash"),
+        {"hash": content_hash}
+    ).scalar()
+    blob_path = Path(directory) / stored_name
+    if blob_path.exists():
+        return blob_path, False
+    blob_path.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(source, blob_path)
+    return blob_path, True
+
+
+def release_blobs(db, files: List[Mapping]) -> List[str]:
+    """
+    Descuenta las referencias de los study_files que se van a borrar (filas con
+    content_hash y file_path) y devuelve las rutas relativas que pueden quedar sin uso,
+    para pasarlas a remove_unused_blobs después del commit. Los archivos previos a la
+    deduplicación (sin blob, nombre propio) se devuelven siempre.
+    """
+    names = [(f["content_hash"], relative_from_url(f["file_path"])) for f in files if f["file_path"]]
+    hashes = sorted({h for h, _ in names if h})
+    blobs: Dict[str, Mapping] = {}
+    if hashes:
+        blobs = {
+            row["content_hash"]: row
+            for row in db.execute(
+                text("""
+                    SELECT content_hash, stored_name, ref_count FROM study_blobs
+                    WHERE content_hash IN :hashes FOR UPDATE
+                """).bindparams(bindparam("hashes", expanding=True)),
+                {"hashes": hashes}
+            ).mappings().all()
+        }
+
+    unused: List[str] = []
+    released: Dict[str, int] = {}
+    for content_hash, name in names:
+        blob = blobs.get(content_hash)
+        if blob is not None and blob["stored_name"] == name:
+            released[content_hash] = released.get(content_hash, 0) + 1
+        else:
+            unused.append(name)
+
+    counts = [{"hash": h, "ref_count": max(0, blobs[h]["ref_count"] - n)} for h, n in released.items()]
+    if counts:
+        db.execute(text("UPDATE study_blobs SET ref_count = :ref_count WHERE content_hash = :hash"), counts)
+    unused.extend(blobs[c["hash"]]["stored_name"] for c in counts if c["ref_count"] == 0)
+    return unused
+
+
+def _remove_with_previews(local_path: Path):
+    for path in (local_path, *preview_files(local_path)):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+                print(f"File deleted: {path}")
+        except Exception as e:
+            print(f"Warning: could not delete study file {path}: {e}")
+
+
+def _lock_if_unused(db, content_hash: str, name: str) -> bool:
+    """
+    Bloquea la fila del blob y dice si está sin referencias. Si la fila no existe (el
+    INSERT de claim_blob se deshizo con un rollback) se crea en ref_count = 0: así el
+    lock existe aunque no haya fila y un claim_blob concurrente espera a este commit.
+    """
+    db.execute(
+        text("""
+            INSERT INTO study_blobs (content_hash, stored_name, size_bytes, ref_count, created_at)
+            VALUES (:hash, :name, 0, 0, :now)
+            ON DUPLICATE KEY UPDATE ref_count = ref_count
+        """),
+        {"hash": content_hash, "name": name, "now": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}
+    )
+    ref_count = db.execute(
+        text("SELECT ref_count FROM study_blobs WHERE content_hash = :hash FOR UPDATE"),
+        {"hash": content_hash}
+    ).scalar()
+    return not ref_count or ref_count <= 0
+
+
+def remove_unused_blobs(db, directory: Path, names: List[str]):
+    """
+    Post-commit (o post-rollback): borra los archivos (y miniatura / preview) que devolvió
+    release_blobs o que un claim_blob deshecho dejó en disco. Cada blob se relee bajo el
+    lock de su fila y solo se borra, junto con la fila, si sigue en ref_count = 0; si otro
+    upload lo reclamó mientras tanto, se conserva.
+    """
+    for name in names:
+        local_path = resolve_path(directory, name)
+        content_hash = Path(name).stem
+        if not BLOB_HASH_RE.match(content_hash):
+            _remove_with_previews(local_path)  # archivo previo a la deduplicación
+            continue
+        try:
+            if _lock_if_unused(db, content_hash, name):
+                _remove_with_previews(local_path)
+                db.execute(text("DELETE FROM study_blobs WHERE content_hash = :hash"), {"hash": content_hash})
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Warning: could not remove unused blob {name}: {e}")
+
+
+def restore_unclaimed_blob(db, directory: Path, blob_path: Path, target: Path):
+    """
+    Post-rollback de un claim_blob que creó el blob desde target: lo devuelve a target
+    si nadie lo reclamó mientras tanto; si otro upload ya lo usa, deja una copia en target.
+    """
+    name = Path(blob_path).relative_to(directory).as_posix()
+    try:
+        if _lock_if_unused(db, Path(name).stem, name):
+            os.replace(blob_path, target)
+            db.execute(text("DELETE FROM study_blobs WHERE content_hash = :hash"), {"hash": Path(name).stem})
+        else:
+            shutil.copyfile(blob_path, target)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Warning: could not restore unclaimed blob {name}: {e}")
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps
+
+from utils.image_processing import NORMALIZABLE_CONTENT_TYPES, STUDY_PREVIEW_PROFILE, STUDY_THUMBNAIL_PROFILE
+
+# Derivados de los archivos de estudios: miniatura (galería) y preview (visor web),
+# guardados junto al original como <nombre>.thumb.webp / <nombre>.preview.webp.
+# Imágenes: se reducen; PDFs: se rasteriza la primera página (pypdfium2).
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+PREVIEW_PROFILES = {
+    "thumb": STUDY_THUMBNAIL_PROFILE,
+    "preview": STUDY_PREVIEW_PROFILE,
+}
+
+_preview_pool: Optional[ProcessPoolExecutor] = None
+
+
+def preview_path(file_path: Path, kind: str) -> Path:
+    file_path = Path(file_path)
+    return file_path.with_name(f"{file_path.stem}.{kind}{PREVIEW_PROFILES[kind].extension}")
+
+
+def preview_files(file_path: Path) -> List[Path]:
+    """Derivados existentes de un archivo de estudio (para borrarlos junto con él)."""
+    return [p for p in (preview_path(file_path, kind) for kind in PREVIEW_PROFILES) if p.exists()]
+
+
+def _is_pdf(file_path: Path, mime_type: Optional[str]) -> bool:
+    return (mime_type or "").lower() == "application/pdf" or file_path.suffix.lower() == ".pdf"
+
+
+def _open_source(file_path: Path, mime_type: Optional[str]) -> Optional[Image.Image]:
+    """Imagen a partir de la cual se generan los derivados, o None si el tipo no aplica."""
+    box = max(max(profile.max_size) for profile in PREVIEW_PROFILES.values())
+    if _is_pdf(file_path, mime_type):
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(str(file_path))
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            # Escala para que el lado mayor quede en la caja más grande (los PDF vienen en puntos)
+            bitmap = page.render(scale=box / max(width, height, 1))
+            return bitmap.to_pil().convert("RGB")
+        finally:
+            pdf.close()
+
+    if (mime_type or "").lower() not in NORMALIZABLE_CONTENT_TYPES:
+        return None
+    with Image.open(file_path) as img:
+        img.draft("RGB", (box, box))
+        img = ImageOps.exif_transpose(img)
+        img.load()
+        return img
+
+
+def render_previews(source: str, mime_type: Optional[str]) -> Dict[str, str]:
+    """
+    Genera los derivados de un archivo de estudio. Corre en un proceso del pool.
+    Devuelve {tipo: ruta}; vacío si el archivo no es imagen ni PDF o no se pudo leer.
+    """
+    source = Path(source)
+    # Blobs compartidos: si otra referencia ya generó los derivados, se reutilizan
+    existing = {kind: preview_path(source, kind) for kind in PREVIEW_PROFILES}
+    if all(path.exists() for path in existing.values()):
+        return {kind: str(path) for kind, path in existing.items()}
+    try:
+        image = _open_source(source, mime_type)
+    except Exception as e:
+        print(f"Preview skipped for {source.name}: {e}")
+        return {}
+    if image is None:
+        return {}
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    results = {}
+    # De mayor a menor: cada derivado se reduce desde el anterior
+    for kind, profile in sorted(PREVIEW_PROFILES.items(), key=lambda kv: -max(kv[1].max_size)):
+        image.thumbnail(profile.max_size, Image.Resampling.LANCZOS)
+        target = preview_path(source, kind)
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            image.save(tmp_path, "WEBP", quality=profile.quality, method=4)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        results[kind] = str(target)
+    return results
+
+
+async def run_in_preview_pool(func, *args):
+    """Pool propio: los derivados no compiten con la normalización de uploads."""
+    global _preview_pool
+    if _preview_pool is None:
+        _preview_pool = ProcessPoolExecutor(max_workers=PREVIEW_WORKERS)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_preview_pool, func, *args)
+
+
+async def generate_previews(files: List[dict]) -> Dict[str, Dict[str, str]]:
+    """
+    files: [{"id", "path", "mime_type"}]. Genera los derivados en paralelo y devuelve
+    {id: {tipo: ruta}} solo de los archivos que produjeron alguno.
+    """
+    results = await asyncio.gather(
+        *(run_in_preview_pool(render_previews, str(f["path"]), f.get("mime_type")) for f in files),
+        return_exceptions=True
+    )
+    generated = {}
+    for f, result in zip(files, results):
+        if isinstance(result, BaseException):
+            print(f"Preview generation failed for {f['path']}: {result}")
+        elif result:
+            generated[f["id"]] = result
+    return generated
@@ -0,0 +1,106 @@
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.findings_index import FindingsIndexCache
+
+# Signos vitales numéricos por registro guardados en columnas NumPy (float64, NaN = sin dato)
+# por alcance (empresa o todos), para estadísticas poblacionales vectorizadas.
+VITALS_STORE_TTL = int(os.getenv("VITALS_STORE_TTL", "600"))
+VITALS_STORE_MAX_SCOPES = int(os.getenv("VITALS_STORE_MAX_SCOPES", "32"))
+
+# Tabla -> columnas numéricas que se cargan en el store
+VITALS_COLUMNS: Dict[str, List[str]] = {
+    "medical_record_clinical_exam": ["talla", "peso", "imc", "saturacion", "ta_min", "ta_max"],
+    "medical_record_cardiovascular_exam": ["freq_cardiaca", "tension_arterial"],
+}
+VITAL_NAMES = [name for columns in VITALS_COLUMNS.values() for name in columns]
+
+# Rango de referencia (mín, máx) para contar valores fuera de rango; None = sin límite
+VITAL_REFERENCE_RANGES: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    "imc": (18.5, 25.0),
+    "saturacion": (95.0, None),
+    "ta_min": (60.0, 90.0),
+    "ta_max": (90.0, 140.0),
+    "freq_cardiaca": (60.0, 100.0),
+    "tension_arterial": (90.0, 140.0),
+}
+
+
+class VitalsStore:
+    """
+    Matriz float64 (registros x VITAL_NAMES) de un alcance, con actualización
+    incremental por registro. Los registros borrados se marcan en `alive`.
+    """
+
+    def __init__(self, seq: int):
+        self.seq = seq
+        self.built_at = time.monotonic()
+        self.record_ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.matrix = np.empty((0, len(VITAL_NAMES)), dtype=np.float64)
+        self.alive = np.zeros(0, dtype=bool)
+
+    def upsert(self, records: Iterable[Sequence]):
+        """records: (record_id, *valores en el orden de VITAL_NAMES), None si no hay dato."""
+        new_ids, new_values = [], []
+        for record in records:
+            record_id = str(record[0])
+            values = [np.nan if v is None else float(v) for v in record[1:]]
+            row = self.rows.get(record_id)
+            if row is None:
+                self.rows[record_id] = len(self.record_ids) + len(new_ids)
+                new_ids.append(record_id)
+                new_values.append(values)
+            else:
+                self.matrix[row] = values
+                self.alive[row] = True
+        if new_ids:
+            self.record_ids.extend(new_ids)
+            self.matrix = np.vstack([self.matrix, np.array(new_values, dtype=np.float64).reshape(-1, len(VITAL_NAMES))])
+            self.alive = np.concatenate([self.alive, np.ones(len(new_ids), dtype=bool)])
+
+    def remove(self, record_ids: Iterable[str]):
+        for record_id in record_ids:
+            row = self.rows.get(str(record_id))
+            if row is not None:
+                self.alive[row] = False
+                self.matrix[row] = np.nan
+
+    def stats(self, names: List[str], percentiles: List[float], bins: int) -> Dict[str, dict]:
+        """Conteo, media, desvío, percentiles, histograma y fuera de rango por signo vital."""
+        result = {}
+        for name in names:
+            values = self.matrix[self.alive, VITAL_NAMES.index(name)]
+            values = values[~np.isnan(values)]
+            low, high = VITAL_REFERENCE_RANGES.get(name, (None, None))
+            if values.size == 0:
+                result[name] = {"count": 0}
+                continue
+
+            counts, edges = np.histogram(values, bins=bins)
+            result[name] = {
+                "count": int(values.size),
+                "mean": round(float(values.mean()), 3),
+                "std": round(float(values.std()), 3),
+                "min": float(values.min()),
+                "max": float(values.max()),
+                "percentiles": {
+                    f"p{p:g}": round(float(v), 3)
+                    for p, v in zip(percentiles, np.percentile(values, percentiles))
+                },
+                "histogram": {"edges": [round(float(e), 3) for e in edges], "counts": counts.tolist()},
+                "reference_range": {"min": low, "max": high},
+                "below_range": int(np.count_nonzero(values < low)) if low is not None else 0,
+                "above_range": int(np.count_nonzero(values > high)) if high is not None else 0,
+            }
+        return result
+
+
+class VitalsStoreCache(FindingsIndexCache):
+    """Stores por alcance (company_id o None = todos), LRU y con TTL para recarga completa."""
+
+    def __init__(self, max_scopes: int = VITALS_STORE_MAX_SCOPES, ttl: int = VITALS_STORE_TTL):
+        super().__init__(max_scopes, ttl)